@@ -0,0 +1,13 @@
+"""
+Benchmarks for waterkit.
+
+Every benchmark runs on seeded synthetic data from benchmarks.generators, so
+the suite runs offline and gives the same inputs on every machine and commit.
+Run it from the repository root with
+
+    python -m benchmarks.run --size small --output before.json
+
+and compare two result files with
+
+    python -m benchmarks.run --compare before.json after.json
+"""
@@ -0,0 +1,34 @@
+"""Benchmarks for waterkit.climate."""
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from waterkit.climate import analysis, usdm
+
+from benchmarks import generators
+from benchmarks.harness import benchmark
+
+USDM_WEEKS = {'small': 52, 'medium': 520, 'large': 1040}
+
+@benchmark("usdm.read_usdm_download", "climate", USDM_WEEKS)
+def bench_read_usdm_download(weeks, random):
+    text = generators.usdm_csv(weeks, random)
+    return lambda: usdm.read_usdm_download(StringIO(text))
+
+@benchmark("climate.DroughtYearFromUsdmAnalysis", "climate", USDM_WEEKS)
+def bench_usdm_drought_years(weeks, random):
+    text = generators.usdm_csv(weeks, random)
+    def run():
+        analysis.DroughtYearFromUsdmAnalysis(StringIO(text), "D2", 0.2,
+            0.25).label_years()
+    return run
+
+@benchmark("climate.DroughtYearFromFlowAnalysis", "climate",
+    {'small': 10, 'medium': 50, 'large': 150})
+def bench_flow_drought_years(years, random):
+    flow = generators.flow_record(years, random)
+    def run():
+        analysis.DroughtYearFromFlowAnalysis(flow, 0.1,
+            ("05-15", "09-30")).label_years()
+    return run
@@ -0,0 +1,41 @@
+"""Benchmarks for waterkit.econ.analysis."""
+from waterkit.econ import analysis
+
+from benchmarks import generators
+from benchmarks.harness import benchmark
+
+NASS_YEARS = {'small': 10, 'medium': 50, 'large': 100}
+
+def crop_groups():
+    commodities = generators.COMMODITIES
+    return [
+        analysis.CropGroup("Forage", 300.0, 2.0, 2.0, commodities[:2]),
+        analysis.CropGroup("Grain", 250.0, 1.5, 1.5, commodities[2:6]),
+        analysis.CropGroup("Row crops", 900.0, 8.0, 2.2, commodities[6:10]),
+    ]
+
+def crop_mix(years, random):
+    return analysis.CropMixDataSet(
+        generators.nass_table(years, random, counties=10))
+
+@benchmark("econ.CropMixDataSet.get_table", "econ", NASS_YEARS)
+def bench_get_table(years, random):
+    data = crop_mix(years, random)
+    groups = crop_groups()
+    return lambda: data.get_table('ACRES', groups)
+
+@benchmark("econ.CropMixDataSet.get_ratio_table", "econ", NASS_YEARS)
+def bench_get_ratio_table(years, random):
+    data = crop_mix(years, random)
+    return lambda: data.get_ratio_table('ACRES')
+
+@benchmark("econ.CropMixDataSet.get_derived_table", "econ", NASS_YEARS)
+def bench_get_derived_table(years, random):
+    data = crop_mix(years, random)
+    groups = crop_groups()
+    return lambda: data.get_derived_table('NIWR', groups)
+
+@benchmark("econ.select_top_n_columns", "econ", NASS_YEARS)
+def bench_select_top_n_columns(years, random):
+    table = crop_mix(years, random).get_table('ACRES')
+    return lambda: analysis.select_top_n_columns(table, 5)
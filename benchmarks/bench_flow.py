@@ -0,0 +1,120 @@
+"""Benchmarks for waterkit.flow.rasterflow and waterkit.flow.analysis."""
+import pandas as pd
+
+from waterkit.flow import analysis, rasterflow
+
+from benchmarks import generators
+from benchmarks.harness import benchmark
+
+FLOW_YEARS = {'small': 10, 'medium': 50, 'large': 150}
+
+def graded_target():
+    target = rasterflow.GradedFlowTarget()
+    target.add(("05-15", "07-15"), 800)
+    target.add(("07-16", "09-30"), 400)
+    target.add(("10-01", "05-14"), 200)
+    return target
+
+def gap_data(years, random):
+    """Generate a flow record with target and gap columns."""
+    data = pd.DataFrame({'flow': generators.flow_record(years, random)})
+    return rasterflow.add_gap_attributes(data, 'flow', graded_target(), 1.0)
+
+@benchmark("rasterflow.GradedFlowTarget.as_daily_timeseries", "rasterflow",
+    FLOW_YEARS)
+def bench_graded_timeseries(years, random):
+    target = graded_target()
+    begin = pd.Timestamp("1950-01-01")
+    end = begin + pd.Timedelta(days=365 * years)
+    return lambda: target.as_daily_timeseries(begin, end)
+
+@benchmark("rasterflow.SeriesFlowTarget.climatology", "rasterflow",
+    FLOW_YEARS)
+def bench_series_climatology(years, random):
+    series = generators.flow_record(years, random)
+    def run():
+        rasterflow.SeriesFlowTarget(series).climatology('mean')
+    return run
+
+@benchmark("rasterflow.add_gap_attributes", "rasterflow", FLOW_YEARS)
+def bench_add_gap_attributes(years, random):
+    flow = generators.flow_record(years, random)
+    target = graded_target()
+    def run():
+        data = pd.DataFrame({'flow': flow})
+        rasterflow.add_gap_attributes(data, 'flow', target, 1.0)
+    return run
+
+@benchmark("rasterflow.filter_season", "rasterflow", FLOW_YEARS)
+def bench_filter_season(years, random):
+    data = gap_data(years, random)
+    return lambda: rasterflow.filter_season(data, ("05-15", "09-30"))
+
+@benchmark("rasterflow.evaluate_targets", "rasterflow",
+    {'small': 10, 'medium': 100, 'large': 500})
+def bench_evaluate_targets(targets, random):
+    flow = generators.flow_record(90, random)
+    candidates = []
+    for value in random.uniform(100, 1000, size=targets):
+        target = rasterflow.GradedFlowTarget()
+        target.add(("05-15", "07-15"), value)
+        target.add(("07-16", "05-14"), value / 2.0)
+        candidates.append(target)
+    return lambda: rasterflow.evaluate_targets(flow, candidates)
+
+@benchmark("analysis.create_raster_table", "flow.analysis", FLOW_YEARS)
+def bench_raster_table(years, random):
+    data = gap_data(years, random)
+    return lambda: analysis.create_raster_table(data, 'flow-gap')
+
+@benchmark("analysis.SnapIndicators", "flow.analysis", FLOW_YEARS)
+def bench_snap_indicators(years, random):
+    data = gap_data(years, random)
+    return lambda: analysis.SnapIndicators(data, 'flow-gap', 'flow-target',
+        analysis.CFS_TO_AFD)
+
+@benchmark("analysis.monthly_volume_deficit_pct", "flow.analysis", FLOW_YEARS)
+def bench_monthly_volume_deficit_pct(years, random):
+    data = gap_data(years, random)
+    return lambda: analysis.monthly_volume_deficit_pct(data, 'flow-gap',
+        'flow-target', analysis.CFS_TO_AFD)
+
+@benchmark("analysis.annual_volume_deficit_pct", "flow.analysis", FLOW_YEARS)
+def bench_annual_volume_deficit_pct(years, random):
+    data = gap_data(years, random)
+    return lambda: analysis.annual_volume_deficit_pct(data, 'flow-gap',
+        'flow-target', analysis.CFS_TO_AFD)
+
+@benchmark("analysis.annual_deficit_pct", "flow.analysis", FLOW_YEARS)
+def bench_annual_deficit_pct(years, random):
+    data = gap_data(years, random)
+    return lambda: analysis.annual_deficit_pct(data, 'flow-gap')
+
+@benchmark("analysis.integrate_monthly", "flow.analysis", FLOW_YEARS)
+def bench_integrate_monthly(years, random):
+    series = generators.flow_record(years, random)
+    return lambda: analysis.integrate_monthly(series, analysis.CFS_TO_AFD)
+
+@benchmark("analysis.annual_low_flows", "flow.analysis", FLOW_YEARS)
+def bench_annual_low_flows(years, random):
+    flows = generators.flow_records(years, 10, random)
+    return lambda: analysis.annual_low_flows(flows)
+
+@benchmark("analysis.delta_matrix", "flow.analysis",
+    {'small': 100, 'medium': 1000, 'large': 5000})
+def bench_delta_matrix(n, random):
+    series = pd.Series(random.normal(size=n))
+    return lambda: analysis.delta_matrix(series, condensed=True)
+
+@benchmark("analysis.DeficitAccumulator.update", "flow.analysis", FLOW_YEARS)
+def bench_deficit_accumulator(years, random):
+    # Seed with the history, then append one new day per call.
+    data = gap_data(years + 10, random)
+    split = len(data) - 3650
+    accumulator = analysis.DeficitAccumulator.from_history(data[:split],
+        'flow-gap', 'flow-target')
+    days = iter(range(split, len(data)))
+    def run():
+        day = next(days)
+        accumulator.update(data[day:day + 1])
+    return run
@@ -0,0 +1,110 @@
+"""Benchmarks for waterkit.flow.nhdplus.
+
+The dense connectivity matrix functions grow with the square or cube of the
+number of flowlines, so they only run at sizes they can finish.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+from waterkit.flow import nhdplus, nhdplus_cache
+from waterkit.tools import dbf
+
+from benchmarks import generators
+from benchmarks.harness import benchmark
+
+NETWORK_EDGES = {'small': 1000, 'medium': 50000, 'large': 1000000}
+
+def network(edges, random):
+    plusflow = generators.plusflow(edges, random)
+    catchments = generators.catchments(generators.network_comids(plusflow),
+        random)
+    return plusflow, catchments
+
+@benchmark("nhdplus.subset_plusflow", "nhdplus", NETWORK_EDGES)
+def bench_subset_plusflow(edges, random):
+    plusflow, catchments = network(edges, random)
+    subset = catchments.sample(frac=0.5, random_state=random)
+    return lambda: nhdplus.subset_plusflow(plusflow, subset)
+
+@benchmark("nhdplus.read_dbf", "nhdplus", NETWORK_EDGES)
+def bench_read_dbf(edges, random):
+    plusflow, catchments = network(edges, random)
+    handle, path = tempfile.mkstemp(suffix=".dbf")
+    os.close(handle)
+    atexit.register(os.remove, path)
+    dbf.write_dbf(path, plusflow)
+    return lambda: nhdplus.read_dbf(path, ['FROMCOMID', 'TOCOMID'])
+
+@benchmark("nhdplus_cache.drainage_areas", "nhdplus", NETWORK_EDGES)
+def bench_cached_drainage_areas(edges, random):
+    plusflow, catchments = network(edges, random)
+    directory = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, directory)
+    plusflow_path = os.path.join(directory, "PlusFlow.dbf")
+    catchment_path = os.path.join(directory, "Catchment.dbf")
+    dbf.write_dbf(plusflow_path, plusflow)
+    dbf.write_dbf(catchment_path, catchments)
+    cache = nhdplus_cache.NetworkCache(os.path.join(directory, "cache"),
+        mmap_mode='r')
+    # Time warm starts only.
+    cache.drainage_areas(catchment_path, plusflow_path)
+    return lambda: cache.drainage_areas(catchment_path, plusflow_path)
+
+@benchmark("nhdplus.create_sparse_connectivity", "nhdplus", NETWORK_EDGES)
+def bench_sparse_connectivity(edges, random):
+    plusflow = generators.plusflow(edges, random, include_terminals=True)
+    return lambda: nhdplus.create_sparse_connectivity(plusflow)
+
+@benchmark("nhdplus.create_connectivity_matrix", "nhdplus",
+    {'small': 500, 'medium': 2000, 'large': 5000})
+def bench_connectivity_matrix(edges, random):
+    plusflow, catchments = network(edges, random)
+    return lambda: nhdplus.create_connectivity_matrix(plusflow)
+
+@benchmark("nhdplus.create_global_connectivity_matrix", "nhdplus",
+    {'small': 200, 'medium': 1000, 'large': 2000})
+def bench_global_connectivity(edges, random):
+    plusflow, catchments = network(edges, random)
+    local = nhdplus.create_connectivity_matrix(plusflow)
+    return lambda: nhdplus.create_global_connectivity_matrix(local)
+
+@benchmark("nhdplus.Reachability", "nhdplus",
+    {'small': 1000, 'medium': 10000, 'large': 30000})
+def bench_reachability(edges, random):
+    plusflow, catchments = network(edges, random)
+    local = nhdplus.create_sparse_connectivity(plusflow)
+    return lambda: nhdplus.create_global_connectivity_matrix(local,
+        as_frame=False)
+
+@benchmark("nhdplus.create_network_index", "nhdplus", NETWORK_EDGES)
+def bench_network_index(edges, random):
+    plusflow, catchments = network(edges, random)
+    local = nhdplus.create_sparse_connectivity(plusflow)
+    return lambda: nhdplus.create_network_index(local)
+
+@benchmark("nhdplus.NetworkIndex.is_upstream", "nhdplus", NETWORK_EDGES)
+def bench_network_index_queries(edges, random):
+    plusflow, catchments = network(edges, random)
+    index = nhdplus.create_network_index(
+        nhdplus.create_sparse_connectivity(plusflow))
+    pairs = random.choice(index.comids, size=(1000, 2))
+    def query():
+        for from_comid, to_comid in pairs:
+            index.is_upstream(from_comid, to_comid)
+    return query
+
+@benchmark("nhdplus.calculate_drainage_areas", "nhdplus",
+    {'small': 50, 'medium': 100, 'large': 200})
+def bench_drainage_areas(edges, random):
+    plusflow, catchments = network(edges, random)
+    closure = nhdplus.create_global_connectivity_matrix(
+        nhdplus.create_connectivity_matrix(plusflow))
+    return lambda: nhdplus.calculate_drainage_areas(catchments, closure)
+
+@benchmark("nhdplus.accumulate_drainage_areas", "nhdplus", NETWORK_EDGES)
+def bench_accumulate_drainage_areas(edges, random):
+    plusflow, catchments = network(edges, random)
+    local = nhdplus.create_sparse_connectivity(plusflow)
+    return lambda: nhdplus.accumulate_drainage_areas(catchments, local)
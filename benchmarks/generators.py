@@ -0,0 +1,219 @@
+"""
+Seeded generators of synthetic inputs shaped like the data sets waterkit
+reads: USGS daily flow records, NHDPlus PlusFlow and catchment tables, US
+Drought Monitor downloads and NASS crop tables.
+
+Each generator takes a numpy RandomState so that the same seed always gives
+the same data.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+DROUGHT_LEVELS = ["D0", "D1", "D2", "D3", "D4"]
+
+COMMODITIES = [
+    "HAY", "HAYLAGE", "WHEAT", "BARLEY", "OATS", "CORN", "POTATOES",
+    "SUGARBEETS", "BEANS", "PEAS", "LENTILS", "CANOLA", "SAFFLOWER",
+    "MINT", "VEGETABLE TOTALS", "ORCHARDS",
+]
+
+def flow_record(years, random, start_year=1950, name='flow'):
+    """
+    Generate a daily flow record of a snowmelt-dominated river covering a
+    number of whole water years, as a Series indexed by date.
+
+    Parameters
+    ----------
+    years : int
+        Number of water years in the record.
+    random : RandomState
+        Source of random numbers.
+    start_year : int
+        The first water year.
+    """
+    index = pd.date_range("%d-10-01" % (start_year - 1),
+        "%d-09-30" % (start_year + years - 1), freq='D', name='date')
+    dayofyear = np.asarray(index.dayofyear, dtype=float)
+    year_scale = random.lognormal(0.0, 0.3, size=years + 1)
+    scale = year_scale[np.asarray(index.year) - index.year[0]]
+    # Base flow with a snowmelt peak in early June.
+    seasonal = 150.0 + 1800.0 * scale * np.exp(-((dayofyear - 160) / 30.0) ** 2)
+    # Autocorrelated multiplicative noise.
+    kernel = 0.8 ** np.arange(30)
+    noise = np.convolve(random.normal(0.0, 0.1, size=len(index)),
+        kernel / np.sqrt((kernel ** 2).sum()))[:len(index)]
+    return pd.Series(seasonal * np.exp(noise), index=index, name=name)
+
+def flow_records(years, sites, random, start_year=1950):
+    """Generate flow records for several sites as a DataFrame with one
+    column per site.
+    """
+    return pd.concat([flow_record(years, random, start_year, name=str(site))
+                      for site in range(sites)], axis=1)
+
+def plusflow(edges, random, divergence=0.02, max_reach=50,
+    include_terminals=False):
+    """
+    Generate a river network shaped like the NHDPlus PlusFlow table, with a
+    FROMCOMID, TOCOMID and DIRECTION column for each edge.
+
+    The network drains to a single outlet. Each flowline flows into one
+    flowline generated before it, and a fraction of flowlines also divert
+    into a second one, so the network is acyclic but not a tree.
+
+    Parameters
+    ----------
+    edges : int
+        Approximate number of edges. Duplicate divergences are dropped, so
+        the table may have slightly fewer.
+    random : RandomState
+        Source of random numbers.
+    divergence : float
+        Fraction of flowlines with a second downstream edge.
+    max_reach : int
+        Flowlines connect to one of the previous max_reach flowlines, which
+        controls how deep the network is.
+    include_terminals : bool
+        Add the rows with a FROMCOMID or TOCOMID of 0 that PlusFlow uses for
+        headwaters and terminal flowlines.
+    """
+    n_nodes = max(2, int(round(edges / (1.0 + divergence))) + 1)
+    comids = 1000000 + np.cumsum(random.randint(1, 20, size=n_nodes))
+    nodes = np.arange(1, n_nodes)
+    parents = np.maximum(nodes - random.randint(1, max_reach + 1,
+        size=len(nodes)), 0)
+    n_divergent = max(0, edges - len(nodes))
+    divergent = random.randint(2, n_nodes, size=n_divergent) \
+        if n_divergent and n_nodes > 2 else np.array([], dtype=int)
+    divergent_parents = np.maximum(divergent - random.randint(1,
+        max_reach + 1, size=len(divergent)), 0)
+    # Avoid duplicating the main edge of a divergent flowline.
+    duplicate = divergent_parents == parents[divergent - 1]
+    divergent_parents[duplicate] = np.maximum(
+        divergent_parents[duplicate] - 1, 0)
+    keep = divergent_parents != parents[divergent - 1]
+    from_nodes = np.concatenate([nodes, divergent[keep]])
+    to_nodes = np.concatenate([parents, divergent_parents[keep]])
+    table = pd.DataFrame({
+        'FROMCOMID': comids[from_nodes],
+        'TOCOMID': comids[to_nodes],
+        'DIRECTION': 709,
+    }, columns=['FROMCOMID', 'TOCOMID', 'DIRECTION']).drop_duplicates(
+        ['FROMCOMID', 'TOCOMID'])
+    if include_terminals:
+        headwaters = np.setdiff1d(np.arange(n_nodes), to_nodes)
+        terminals = pd.DataFrame({
+            'FROMCOMID': np.concatenate([np.zeros(len(headwaters), int),
+                [comids[0]]]),
+            'TOCOMID': np.concatenate([comids[headwaters], [0]]),
+            'DIRECTION': 709,
+        }, columns=['FROMCOMID', 'TOCOMID', 'DIRECTION'])
+        table = pd.concat([table, terminals], ignore_index=True)
+    return table
+
+def catchments(comids, random):
+    """
+    Generate an NHDPlus catchment table with a FEATUREID, GRIDCODE and
+    AreaSqKM column for each COMID.
+    """
+    comids = np.asarray(comids)
+    return pd.DataFrame({
+        'FEATUREID': comids,
+        'GRIDCODE': np.arange(1, len(comids) + 1),
+        'AreaSqKM': random.lognormal(1.0, 1.0, size=len(comids)),
+    }, columns=['FEATUREID', 'GRIDCODE', 'AreaSqKM'])
+
+def network_comids(plusflow_table):
+    """Get the sorted COMIDs appearing in a PlusFlow table."""
+    comids = np.union1d(plusflow_table['FROMCOMID'].values,
+        plusflow_table['TOCOMID'].values)
+    return comids[comids != 0]
+
+def usdm_table(weeks, random, start_date="2000-01-04"):
+    """
+    Generate a US Drought Monitor percent of area table with one release per
+    week, newest first as in the downloads. Columns D0 to D4 hold the
+    cumulative percent of area in each level or worse.
+
+    Parameters
+    ----------
+    weeks : int
+        Number of weekly releases.
+    random : RandomState
+        Source of random numbers.
+    start_date : string
+        Date of the first release.
+    """
+    dates = pd.date_range(start_date, periods=weeks, freq='7D')
+    # A slowly varying drought severity drives the cumulative levels.
+    severity = np.clip(np.cumsum(random.normal(0.0, 0.15, size=weeks)),
+        -1.0, 4.5)
+    levels = np.arange(len(DROUGHT_LEVELS))
+    cumulative = 100.0 / (1.0 + np.exp(
+        2.0 * (levels[np.newaxis, :] - severity[:, np.newaxis])))
+    cumulative = np.round(cumulative, 2)
+    table = pd.DataFrame(cumulative, columns=DROUGHT_LEVELS)
+    table.insert(0, 'NONE', np.round(100.0 - cumulative[:, 0], 2))
+    table.insert(0, 'State', 'MT')
+    table.insert(0, 'County', 'Gallatin County')
+    table.insert(0, 'FIPS', '30031')
+    table.insert(0, 'releaseDate', dates.strftime("%Y-%m-%d"))
+    table['validStart'] = dates.strftime("%Y-%m-%d")
+    table['validEnd'] = (dates + pd.Timedelta(days=6)).strftime("%Y-%m-%d")
+    table['domStatisticFormatID'] = 1
+    return table.iloc[::-1].reset_index(drop=True)
+
+def usdm_csv(weeks, random, start_date="2000-01-04"):
+    """Generate a US Drought Monitor download as CSV text."""
+    buffer = StringIO()
+    usdm_table(weeks, random, start_date).to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+def nass_table(years, random, counties=1, commodities=COMMODITIES,
+    start_year=1950):
+    """
+    Generate a NASS quick stats table of harvested acres and sales with the
+    columns of waterkit.econ.analysis.NASS_COLUMNS.
+
+    Parameters
+    ----------
+    years : int
+        Number of years.
+    random : RandomState
+        Source of random numbers.
+    counties : int
+        Number of counties.
+    commodities : list
+        Commodity names.
+    start_year : int
+        The first year.
+    """
+    year_values = np.arange(start_year, start_year + years)
+    county_names = ["COUNTY %d" % i for i in range(counties)]
+    keys = pd.MultiIndex.from_product(
+        [county_names, year_values, commodities, ['ACRES', '$']],
+        names=['county_name', 'year', 'commodity_desc', 'unit_desc'])
+    table = keys.to_frame(index=False) if hasattr(keys, 'to_frame') \
+        else pd.DataFrame(list(keys), columns=keys.names)
+    acres = random.lognormal(7.0, 1.5, size=len(table) // 2)
+    price = random.lognormal(5.5, 0.5, size=len(table) // 2)
+    values = np.empty(len(table))
+    values[0::2] = np.round(acres)
+    values[1::2] = np.round(acres * price)
+    table['Value'] = values
+    table['statisticcat_desc'] = np.where(table['unit_desc'] == 'ACRES',
+        'AREA HARVESTED', 'SALES')
+    table['source_desc'] = 'CENSUS'
+    table['sector_desc'] = 'CROPS'
+    table['group_desc'] = 'FIELD CROPS'
+    table['class_desc'] = 'ALL CLASSES'
+    table['prodn_practice_desc'] = 'ALL PRODUCTION PRACTICES'
+    table['util_practice_desc'] = 'ALL UTILIZATION PRACTICES'
+    table['agg_level_desc'] = 'COUNTY'
+    table['state_alpha'] = 'MT'
+    return table
@@ -0,0 +1,205 @@
+"""
+Registry, timing and reporting for the benchmark suite.
+
+A benchmark is a setup function registered with the benchmark decorator. It
+is called with a size parameter and a seeded RandomState, builds its inputs,
+and returns a function of no arguments that runs the code being measured.
+Only that function is timed.
+"""
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from waterkit.tools import instrument
+
+timer = getattr(time, 'perf_counter', time.time)
+
+SIZES = ['small', 'medium', 'large']
+
+BENCHMARKS = []
+
+class Benchmark(object):
+    """A registered benchmark.
+
+    Parameters
+    ----------
+    name : string
+        Unique name, usually the module and function measured.
+    group : string
+        Subsystem the benchmark belongs to.
+    setup : callable
+        Function of (size parameter, RandomState) that returns the function
+        to time.
+    sizes : dict
+        Size parameter for each of small, medium and large. A size missing
+        from the dict is not run, which keeps slow algorithms to sizes they
+        can finish.
+    """
+    def __init__(self, name, group, setup, sizes):
+        self.name = name
+        self.group = group
+        self.setup = setup
+        self.sizes = sizes
+
+def benchmark(name, group, sizes):
+    """Decorator that registers a setup function as a benchmark."""
+    def register(setup):
+        BENCHMARKS.append(Benchmark(name, group, setup, sizes))
+        return setup
+    return register
+
+def measure(function, repeat=5, min_time=0.2, trace_memory=True):
+    """
+    Time a function of no arguments.
+
+    The function is called repeat times, or until min_time seconds have
+    passed, whichever takes longer. Peak memory of one extra call is measured
+    with tracemalloc, or without it, as on Python 2, by the growth of the
+    process peak resident set size. That growth is 0 when the call stays
+    below an earlier peak, so it is only comparable between fresh processes.
+
+    Returns a dict with the number of calls, the minimum, median and mean
+    time in seconds, the peak memory in bytes or None, and the memory method
+    used (see waterkit.tools.instrument.memory_method).
+    """
+    times = []
+    gc.collect()
+    start = timer()
+    while len(times) < repeat or (timer() - start < min_time and
+        len(times) < 100 * repeat):
+        begin = timer()
+        function()
+        times.append(timer() - begin)
+    peak = None
+    method = instrument.memory_method() if trace_memory else None
+    if method == 'tracemalloc':
+        tracemalloc = instrument.tracemalloc
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    elif method == 'max_rss':
+        gc.collect()
+        base = instrument.max_rss()
+        function()
+        peak = instrument.max_rss() - base
+    return {
+        'calls': len(times),
+        'min': min(times),
+        'median': float(np.median(times)),
+        'mean': float(np.mean(times)),
+        'peak_bytes': peak,
+        'memory_method': method,
+    }
+
+def get_metadata(seed):
+    """Describe the code and environment a benchmark run measured."""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD']).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'seed': seed,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'memory_method': instrument.memory_method(),
+    }
+
+def run(benchmarks=None, sizes=('small',), seed=0, repeat=5, min_time=0.2,
+    pattern=None, trace_memory=True, log=sys.stderr):
+    """
+    Run benchmarks and return the results as a JSON-serializable dict.
+
+    Parameters
+    ----------
+    benchmarks : list
+        Benchmarks to run. Defaults to all registered benchmarks.
+    sizes : list
+        Sizes to run, from small, medium and large.
+    seed : int
+        Seed for the synthetic data generators.
+    repeat : int
+        Minimum number of timed calls.
+    min_time : float
+        Minimum total time in seconds spent in timed calls.
+    pattern : string
+        Only run benchmarks whose name contains this string.
+    trace_memory : bool
+        Measure peak memory of each benchmark.
+    """
+    if benchmarks is None:
+        benchmarks = BENCHMARKS
+    if trace_memory and instrument.memory_method() is None:
+        log.write("Memory cannot be measured on this platform\n")
+    results = []
+    for bench in benchmarks:
+        if pattern and pattern not in bench.name:
+            continue
+        for size in sizes:
+            if size not in bench.sizes:
+                continue
+            parameter = bench.sizes[size]
+            result = {
+                'name': bench.name,
+                'group': bench.group,
+                'size': size,
+                'parameter': parameter,
+            }
+            log.write("%s [%s=%s] ... " % (bench.name, size, parameter))
+            log.flush()
+            try:
+                function = bench.setup(parameter, np.random.RandomState(seed))
+                result.update(measure(function, repeat, min_time,
+                    trace_memory))
+                log.write("%.6fs\n" % result['min'])
+            except Exception as e:
+                result['error'] = "%s: %s" % (type(e).__name__, e)
+                log.write("error: %s\n" % result['error'])
+            results.append(result)
+    return {'meta': get_metadata(seed), 'results': results}
+
+def save(results, path):
+    """Save benchmark results to a JSON file."""
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load(path):
+    """Load benchmark results saved with save."""
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compare two sets of benchmark results.
+
+    Returns a DataFrame indexed by benchmark name and size with the minimum
+    time of each run, their ratio, and a status of regression, improvement
+    or unchanged depending on whether the ratio differs from 1 by more than
+    threshold.
+    """
+    def frame(results):
+        rows = [r for r in results['results'] if 'error' not in r]
+        table = pd.DataFrame(rows, columns=['name', 'size', 'min',
+            'peak_bytes'])
+        return table.set_index(['name', 'size'])
+    result = frame(baseline).join(frame(current), how='inner',
+        lsuffix='_baseline', rsuffix='_current')
+    result['ratio'] = result['min_current'] / result['min_baseline']
+    result['status'] = np.where(result['ratio'] > 1 + threshold,
+        'regression', np.where(result['ratio'] < 1 - threshold,
+        'improvement', 'unchanged'))
+    return result
@@ -0,0 +1,68 @@
+"""
+Run the benchmark suite, or compare two result files.
+
+    python -m benchmarks.run --size small,medium --output results.json
+    python -m benchmarks.run --compare baseline.json results.json
+"""
+import argparse
+import importlib
+import sys
+
+from benchmarks import harness
+
+SUITES = [
+    'benchmarks.bench_flow',
+    'benchmarks.bench_nhdplus',
+    'benchmarks.bench_climate',
+    'benchmarks.bench_econ',
+]
+
+def load_suites(log=sys.stderr):
+    """Import the benchmark modules, reporting any that cannot be imported
+    because an optional dependency is missing.
+    """
+    for suite in SUITES:
+        try:
+            importlib.import_module(suite)
+        except ImportError as e:
+            log.write("Skipping %s: %s\n" % (suite, e))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run waterkit benchmarks.")
+    parser.add_argument("--size", default="small",
+        help="Comma-separated sizes to run: small, medium, large")
+    parser.add_argument("--filter", help="Only run benchmarks whose name "
+        "contains this string")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--no-memory", action="store_true",
+        help="Skip peak memory measurement")
+    parser.add_argument("--output", help="JSON file to write results to")
+    parser.add_argument("--compare", nargs=2,
+        metavar=("BASELINE", "CURRENT"),
+        help="Compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1,
+        help="Relative change in time reported as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        comparison = harness.compare(harness.load(args.compare[0]),
+            harness.load(args.compare[1]), args.threshold)
+        sys.stdout.write(comparison.to_string() + "\n")
+        return 1 if (comparison['status'] == 'regression').any() else 0
+
+    sizes = [size.strip() for size in args.size.split(',')]
+    for size in sizes:
+        if size not in harness.SIZES:
+            parser.error("Unknown size: %s" % size)
+    load_suites()
+    results = harness.run(sizes=sizes, seed=args.seed, repeat=args.repeat,
+        min_time=args.min_time, pattern=args.filter,
+        trace_memory=not args.no_memory)
+    if args.output:
+        harness.save(results, args.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,18 @@
 #! /usr/bin/env python
 
+import os
+import re
+
 from setuptools import setup
 
+def read_version():
+    """Read __version__ from waterkit/__init__.py without importing it."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'waterkit', '__init__.py')
+    with open(path) as f:
+        return re.search(r"^__version__ = '([^']+)'", f.read(),
+            re.MULTILINE).group(1)
+
 requirements = [
     'setuptools',
     # Choose numpy for ArcGIS 10.2
@@ -14,7 +25,6 @@ requirements = [
     'pandas==0.17.1',
     'matplotlib==1.4.3',
     'pyparsing==2.0.3',
-    'dbfread==2.0.4',
     'networkx==1.9.1',
     'xlrd==0.9.3',
     'openpyxl==1.8.6',
@@ -22,12 +32,23 @@ requirements = [
 
 setup(
     name='waterkit',
-    version='0.1',
+    version=read_version(),
     description='Water data analysis kit.',
     author='Will Dicharry',
     author_email='wdicharry@gmail.com',
     install_requires=requirements,
-    packages=['waterkit'],
+    packages=[
+        'waterkit',
+        'waterkit.climate',
+        'waterkit.econ',
+        'waterkit.flow',
+        'waterkit.tools',
+    ],
+    entry_points={
+        'console_scripts': [
+            'waterkit-batch = waterkit.flow.batch:main',
+        ],
+    },
     test_suite="nose.collector",
     tests_require=["nose"],
 )
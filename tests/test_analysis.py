@@ -2,12 +2,14 @@
 Test cases for the waterkit.analysis module.
 """
 
+import json
 import unittest
 
 from waterkit.flow import analysis
 
 from utils import *
 
+import numpy as np
 import pandas as pd
 
 from datetime import date
@@ -95,3 +97,272 @@ class VolumeGapTest(unittest.TestCase):
         data = test_data()
         result = analysis.annual_volume_target(data, 0, 1, 2.0)
         self.assertItemsEqual([150, 120], result)
+
+class DeficitPctTest(unittest.TestCase):
+    def test_annual_deficit_pct_by_wateryear(self):
+        index = pd.date_range("2014-09-29", "2014-10-02", freq="D")
+        series = pd.Series([-1.0, 1.0, 1.0, -1.0], index=index)
+        result = analysis.annual_deficit_pct(series)
+        self.assertEqual([2014, 2015], list(result.index))
+        self.assertEqual([0.5, 0.5], list(result))
+
+class SnapIndicatorsTest(unittest.TestCase):
+    def setUp(self):
+        self.data = test_data()
+        self.data.loc[date(2015, 10, 1)] = [-3, 12]
+        self.data.loc[date(2015, 10, 2)] = [1, 12]
+        self.data.index = pd.DatetimeIndex(self.data.index)
+        self.data = self.data.sort_index()
+        self.indicators = analysis.SnapIndicators(self.data, 0, 1, 2.0)
+
+    def assertFramesEqual(self, expected, actual):
+        self.assertEqual(list(expected.index), list(actual.index))
+        self.assertEqual(list(expected.columns), list(actual.columns))
+        np.testing.assert_almost_equal(np.array(expected), np.array(actual))
+
+    def assertSeriesEqual(self, expected, actual):
+        self.assertEqual(list(expected.index), list(actual.index))
+        np.testing.assert_almost_equal(np.array(expected), np.array(actual))
+
+    def test_deficit_pct(self):
+        self.assertSeriesEqual(
+            analysis.monthly_deficit_pct(self.data, 0),
+            self.indicators.monthly_deficit_pct)
+        self.assertSeriesEqual(
+            analysis.annual_deficit_pct(self.data, 0),
+            self.indicators.annual_deficit_pct)
+
+    def test_monthly_volumes(self):
+        self.assertFramesEqual(
+            analysis.monthly_volume_deficit(self.data, 0, 2.0),
+            self.indicators.monthly_volume_deficit)
+        self.assertFramesEqual(
+            analysis.monthly_volume_target(self.data, 0, 1, 2.0),
+            self.indicators.monthly_volume_target)
+        self.assertFramesEqual(
+            analysis.monthly_volume_deficit_pct(self.data, 0, 1, 2.0),
+            self.indicators.monthly_volume_deficit_pct)
+
+    def test_annual_volumes(self):
+        self.assertSeriesEqual(
+            analysis.annual_volume_deficit(self.data, 0, 2.0),
+            self.indicators.annual_volume_deficit)
+        self.assertSeriesEqual(
+            analysis.annual_volume_target(self.data, 0, 1, 2.0),
+            self.indicators.annual_volume_target)
+        self.assertSeriesEqual(
+            analysis.annual_volume_deficit_pct(self.data, 0, 1, 2.0),
+            self.indicators.annual_volume_deficit_pct)
+
+class DeficitAccumulatorTest(unittest.TestCase):
+    def setUp(self):
+        self.data = test_data()
+        self.data.loc[date(2015, 10, 1)] = [-3, 12]
+        self.data.loc[date(2015, 10, 2)] = [1, 12]
+        self.data.index = pd.DatetimeIndex(self.data.index)
+        self.data = self.data.sort_index()
+        self.expected = analysis.SnapIndicators(self.data, 0, 1, 2.0)
+
+    def assertIndicatorsEqual(self, expected, actual):
+        for attribute in ['monthly_deficit_pct', 'annual_deficit_pct',
+            'monthly_volume_deficit', 'monthly_volume_deficit_pct',
+            'annual_volume_deficit', 'annual_volume_target',
+            'annual_volume_deficit_pct']:
+            expected_value = getattr(expected, attribute)
+            actual_value = getattr(actual, attribute)
+            self.assertEqual(list(expected_value.index),
+                list(actual_value.index))
+            np.testing.assert_almost_equal(np.array(expected_value),
+                np.array(actual_value))
+
+    def test_incremental_updates(self):
+        accumulator = analysis.DeficitAccumulator.from_history(
+            self.data[:10], 0, 1, 2.0)
+        for day in range(10, len(self.data)):
+            accumulator.update(self.data[day:day + 1])
+        self.assertIndicatorsEqual(self.expected, accumulator.indicators())
+
+    def test_overlapping_dates(self):
+        accumulator = analysis.DeficitAccumulator.from_history(
+            self.data[:10], 0, 1, 2.0)
+        self.assertRaises(ValueError, accumulator.update, self.data[9:12])
+
+    def test_serialize_state(self):
+        accumulator = analysis.DeficitAccumulator.from_history(
+            self.data[:10], 0, 1, 2.0)
+        restored = analysis.DeficitAccumulator.from_dict(
+            json.loads(json.dumps(accumulator.to_dict())))
+        restored.update(self.data[10:])
+        self.assertIndicatorsEqual(self.expected, restored.indicators())
+
+class ScenarioIndicatorsTest(unittest.TestCase):
+    def setUp(self):
+        self.data = test_data()
+        self.data.index = pd.DatetimeIndex(self.data.index)
+        self.data = self.data.sort_index()
+        self.shifted = self.data.copy()
+        self.shifted[0] = self.shifted[0] + 3
+        gap = np.vstack([self.data[0], self.shifted[0]])
+        target = np.vstack([self.data[1], self.shifted[1]])
+        self.indicators = analysis.ScenarioIndicators(gap, target,
+            self.data.index, ['base', 'shifted'], 2.0)
+
+    def assertScenarioEqual(self, expected, actual):
+        expected = expected.dropna()
+        actual = actual.dropna()
+        self.assertEqual(list(expected.index), list(actual.index))
+        np.testing.assert_almost_equal(np.array(expected), np.array(actual))
+
+    def test_matches_single_scenario(self):
+        for name, data in [('base', self.data), ('shifted', self.shifted)]:
+            expected = analysis.SnapIndicators(data, 0, 1, 2.0)
+            for attribute in ['monthly_deficit_pct', 'annual_deficit_pct',
+                'annual_volume_deficit', 'annual_volume_target',
+                'annual_volume_deficit_pct']:
+                self.assertScenarioEqual(getattr(expected, attribute),
+                    getattr(self.indicators, attribute)[name])
+            monthly = self.indicators.monthly_volume_deficit.loc[name]
+            self.assertEqual(list(expected.monthly_volume_deficit.index),
+                list(monthly.index))
+            np.testing.assert_almost_equal(
+                np.array(expected.monthly_volume_deficit),
+                np.array(monthly[expected.monthly_volume_deficit.columns]))
+
+    def test_to_frame(self):
+        result = self.indicators.to_frame()
+        self.assertEqual(['scenario', 'wateryear'], list(result.index.names))
+        self.assertEqual(-23.0 * 2.0,
+            result.loc[('base', 2015), 'volume_deficit'])
+        self.assertEqual(['base', 'shifted'],
+            sorted(set(result.index.get_level_values('scenario'))))
+
+class IntegrateMonthlyTest(unittest.TestCase):
+    def setUp(self):
+        index = pd.DatetimeIndex([date(2015, 1, 1), date(2015, 1, 2),
+            date(2015, 3, 1), date(2016, 1, 1)])
+        self.series = pd.Series([1.0, 2.0, np.nan, 4.0], index=index)
+
+    def test_frame(self):
+        result = analysis.integrate_monthly(self.series, dt=2.0)
+        self.assertEqual([2015, 2016], list(result.index))
+        self.assertEqual([1, 3], list(result.columns))
+        self.assertEqual(6.0, result.loc[2015, 1])
+        self.assertEqual(8.0, result.loc[2016, 1])
+        self.assertTrue(np.isnan(result.loc[2016, 3]))
+        # A month with only NaN readings is missing, not zero.
+        self.assertTrue(np.isnan(result.loc[2015, 3]))
+
+    def test_array(self):
+        table, years = analysis.integrate_monthly(self.series, as_array=True)
+        self.assertEqual((2, 12), table.shape)
+        self.assertEqual([2015, 2016], list(years))
+        self.assertEqual(3.0, table[0, 0])
+        self.assertTrue(np.isnan(table[0, 1]))
+
+class RasterTest(unittest.TestCase):
+    def setUp(self):
+        index = pd.date_range("2015-02-27", "2016-03-02", freq="D")
+        self.data = pd.DataFrame({
+            "flow": np.arange(len(index), dtype=float),
+            "gap": -np.arange(len(index), dtype=float),
+        }, index=index)
+
+    def test_raster_table(self):
+        table = analysis.create_raster_table(self.data, "flow")
+        self.assertEqual([2015, 2016], list(table.index))
+        self.assertEqual(366, len(table.columns))
+        self.assertEqual(0.0, table.loc[2015, 58])
+        self.assertTrue(np.isnan(table.loc[2015, 366]))
+        self.assertEqual(self.data.loc["2016-03-01", "flow"], table.loc[2016, 61])
+
+    def test_align_leap_days(self):
+        raster = analysis.create_raster(self.data, ["flow"], leap_days="align")
+        march_first = raster["flow"][:, 60]
+        self.assertEqual(self.data.loc["2015-03-01", "flow"], march_first[0])
+        self.assertEqual(self.data.loc["2016-03-01", "flow"], march_first[1])
+        self.assertTrue(np.isnan(raster["flow"][0, 59]))
+
+    def test_drop_leap_days(self):
+        raster = analysis.create_raster(self.data, ["flow"], leap_days="drop")
+        self.assertEqual(365, len(raster.days))
+        self.assertEqual(self.data.loc["2016-03-01", "flow"], raster["flow"][1, 59])
+        self.assertEqual(self.data.loc["2016-02-28", "flow"], raster["flow"][1, 58])
+
+    def test_multiple_attributes(self):
+        raster = analysis.create_raster(self.data, ["flow", "gap"])
+        self.assertEqual((2, 2, 366), raster.values.shape)
+        self.assertEqual(self.data["gap"].min(), raster.min("gap"))
+        self.assertEqual(self.data["flow"].max(), raster.max("flow"))
+        totals = analysis.create_yearly_totals(self.data, ["flow", "gap"])
+        self.assertEqual(self.data.loc["2015", "flow"].sum(), totals.loc[2015, 0])
+        self.assertEqual(self.data.loc["2016", "gap"].sum(), totals.loc[2016, 1])
+
+class LowFlowTest(unittest.TestCase):
+    def setUp(self):
+        index = pd.date_range("2014-10-01", "2016-09-30", freq="D")
+        self.series = pd.Series(100.0, index=index)
+        self.series["2015-08-01":"2015-08-07"] = 10.0
+        self.series["2016-09-29":"2016-09-30"] = 40.0
+
+    def test_rolling_means(self):
+        means = analysis.rolling_means(np.array([1.0, 2.0, 3.0, np.nan, 5.0]),
+            [1, 2])
+        np.testing.assert_equal(np.array([1.0, 2.0, 3.0, np.nan, 5.0]), means[0])
+        np.testing.assert_equal(np.array([np.nan, 1.5, 2.5, np.nan, np.nan]),
+            means[1])
+
+    def test_annual_low_flows(self):
+        result = analysis.annual_low_flows(self.series, [1, 7, 30])
+        self.assertEqual([2015, 2016], list(result.index))
+        self.assertEqual(10.0, result.loc[2015, 1])
+        self.assertEqual(10.0, result.loc[2015, 7])
+        self.assertAlmostEqual((7 * 10.0 + 23 * 100.0) / 30, result.loc[2015, 30])
+        self.assertEqual(40.0, result.loc[2016, 1])
+        self.assertAlmostEqual((2 * 40.0 + 5 * 100.0) / 7, result.loc[2016, 7])
+
+    def test_annual_low_flows_multiple_gages(self):
+        frame = pd.DataFrame({"a": self.series, "b": self.series * 2})
+        result = analysis.annual_low_flows(frame, [1, 7])
+        self.assertEqual(20.0, result.loc[2015, ("b", 7)])
+        self.assertEqual(10.0, result.loc[2015, ("a", 1)])
+
+    def test_annual_minimum_calendar_year(self):
+        result = analysis.annual_minimum(self.series, 7)
+        self.assertEqual([2014, 2015, 2016], list(result.index))
+        self.assertEqual(10.0, result.loc[2015])
+
+    def test_low_flow_frequency(self):
+        minima = pd.Series([10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0])
+        self.assertAlmostEqual(10.0,
+            analysis.low_flow_frequency(minima, 10, method='empirical'))
+        logs = np.log10(minima)
+        estimate = analysis.low_flow_frequency(minima, 10)
+        self.assertTrue(0 < estimate < 10 ** logs.mean())
+        self.assertEqual(0.0, analysis.low_flow_frequency(
+            pd.Series([0.0, 0.0, 5.0, 6.0]), 10))
+
+class DeltaMatrixTest(unittest.TestCase):
+    def setUp(self):
+        self.series = pd.Series([1.0, 4.0, 9.0], index=[2000, 2001, 2002])
+
+    def test_matrix(self):
+        result = analysis.delta_matrix(self.series)
+        self.assertEqual([2000, 2001, 2002], list(result.index))
+        self.assertEqual(3.0, result.loc[2000, 2001])
+        self.assertEqual(-5.0, result.loc[2002, 2001])
+        self.assertEqual(0.0, result.loc[2001, 2001])
+
+    def test_condensed(self):
+        result = analysis.delta_matrix(self.series, condensed=True,
+            dtype=np.float32)
+        self.assertEqual(np.float32, result.dtype)
+        np.testing.assert_equal(np.array([3.0, 8.0, 5.0]), result)
+
+    def test_blocks(self):
+        full = np.array(analysis.delta_matrix(self.series))
+        tiled = np.empty((3, 3))
+        for rows, columns, tile in analysis.delta_matrix_blocks(self.series, 2):
+            i = list(self.series.index).index(rows[0])
+            j = list(self.series.index).index(columns[0])
+            tiled[i:i + len(rows), j:j + len(columns)] = tile
+        np.testing.assert_equal(full, tiled)
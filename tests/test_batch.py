@@ -0,0 +1,101 @@
+"""
+Tests for the batch gap indicator pipeline.
+"""
+import unittest
+
+import os
+import shutil
+import tempfile
+
+from waterkit.flow import batch, rasterflow, usgs_cache, usgs_data
+
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+RDB_FILE = os.path.join(THIS_DIR, "test_usgs_data.rdb")
+
+def local_fetch(site_id, start_date, end_date,
+    parameter_code=usgs_data.FLOW_PARAMETER_CODE, parameter_name='flow'):
+    """Read gage data from the local RDB file for one known site."""
+    if site_id != "06043500":
+        raise IOError("Unknown site %s" % site_id)
+    data = usgs_data.read_rdb(RDB_FILE, parameter_name)
+    return data[start_date:end_date]
+
+class ParseTest(unittest.TestCase):
+    def test_parse_sites(self):
+        self.assertEqual(["06043500", "06045000"],
+            batch.parse_sites("06043500, 06045000"))
+        self.assertEqual(4,
+            len(batch.parse_sites("waterkit.flow.gallatin:USGS_SITES")))
+
+    def test_parse_target(self):
+        flat = batch.parse_target("50")
+        self.assertEqual(50.0, flat.value)
+        graded = batch.parse_target("05-15/07-15=800,07-16/09-30=400")
+        self.assertTrue(isinstance(graded, rasterflow.GradedFlowTarget))
+        self.assertEqual(800, graded.get_target_flow(150))
+        self.assertEqual(400, graded.get_target_flow(220))
+        self.assertRaises(ValueError, batch.parse_target, "05-15=800")
+
+    def test_parse_season(self):
+        self.assertEqual(("05-15", "09-30"), batch.parse_season("05-15/09-30"))
+        self.assertEqual(None, batch.parse_season(None))
+
+class RunTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, "output")
+        cache = usgs_cache.GageDataCache(
+            os.path.join(self.directory, "cache"), fetch=local_fetch)
+        self.options = {
+            'output': self.output,
+            'start': "1950-01-01",
+            'end': "1950-02-28",
+            'target': rasterflow.FlatFlowTarget(200),
+            'season': None,
+            'multiplier': 1.0,
+            'unit_multiplier': 1.9835,
+            'parameter_code': usgs_data.FLOW_PARAMETER_CODE,
+            'parameter_name': 'flow',
+            'cache': cache,
+        }
+        self.log = open(os.devnull, 'w')
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.directory)
+
+    def test_failures_are_isolated(self):
+        failures = batch.run(["06043500", "00000000"], self.options,
+            workers=1, log=self.log, backoff=0.0)
+        self.assertEqual(["00000000"], list(failures.keys()))
+        self.assertTrue(os.path.isdir(os.path.join(self.output, "06043500")))
+        self.assertFalse(os.path.exists(os.path.join(self.output, "00000000")))
+        results = batch.read_results(self.output)
+        self.assertEqual(["06043500"],
+            list(set(results.index.get_level_values('site'))))
+
+    def test_resume_skips_finished_sites(self):
+        batch.run(["06043500"], self.options, workers=1, log=self.log)
+        daily = os.path.join(self.output, "06043500", batch.DAILY_DIR)
+        modified = os.path.getmtime(daily)
+        failures = batch.run(["06043500"], self.options, workers=1,
+            log=self.log)
+        self.assertEqual({}, failures)
+        self.assertEqual(modified, os.path.getmtime(daily))
+
+    def test_downloads_in_parent(self):
+        calls = []
+        def fetch(site_id, start_date, end_date, parameter_code=None,
+            parameter_name='flow'):
+            calls.append(site_id)
+            return local_fetch("06043500", start_date, end_date,
+                parameter_code, parameter_name)
+        self.options['cache'] = usgs_cache.GageDataCache(
+            os.path.join(self.directory, "cache"), fetch=fetch)
+        sites = ["06043500", "06045000", "06048000"]
+        failures = batch.run(sites, self.options, workers=2, log=self.log)
+        self.assertEqual({}, failures)
+        # The fetch calls are only visible here if they ran in this process.
+        self.assertEqual(sorted(sites), sorted(calls))
+        for site in sites:
+            self.assertTrue(os.path.isdir(os.path.join(self.output, site)))
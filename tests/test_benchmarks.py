@@ -0,0 +1,68 @@
+"""
+Tests for the benchmark data generators and harness.
+"""
+import unittest
+
+import numpy as np
+
+from benchmarks import generators, harness
+from waterkit.tools import instrument
+
+class GeneratorsTest(unittest.TestCase):
+    def test_flow_record_is_seeded(self):
+        first = generators.flow_record(3, np.random.RandomState(1))
+        second = generators.flow_record(3, np.random.RandomState(1))
+        self.assertEqual(365 * 3 + 1, len(first))
+        np.testing.assert_equal(first.values, second.values)
+        self.assertTrue((first > 0).all())
+
+    def test_plusflow_is_acyclic(self):
+        table = generators.plusflow(1000, np.random.RandomState(0))
+        self.assertTrue(950 <= len(table) <= 1000)
+        # Every edge flows toward a COMID generated earlier.
+        self.assertTrue((table['TOCOMID'] < table['FROMCOMID']).all())
+        self.assertFalse(table.duplicated(['FROMCOMID', 'TOCOMID']).any())
+
+    def test_usdm_levels_are_cumulative(self):
+        table = generators.usdm_table(20, np.random.RandomState(0))
+        levels = table[generators.DROUGHT_LEVELS].values
+        self.assertTrue((np.diff(levels, axis=1) <= 0).all())
+        self.assertTrue(table['releaseDate'].iloc[0] >
+            table['releaseDate'].iloc[-1])
+
+    def test_nass_table(self):
+        table = generators.nass_table(5, np.random.RandomState(0), counties=2)
+        self.assertEqual(5 * 2 * len(generators.COMMODITIES) * 2, len(table))
+        self.assertEqual(set(['ACRES', '$']), set(table['unit_desc']))
+
+class HarnessTest(unittest.TestCase):
+    def test_run_and_compare(self):
+        calls = []
+        bench = harness.Benchmark("sum", "test",
+            lambda n, random: lambda: calls.append(random.rand(n).sum()),
+            {'small': 10})
+        results = harness.run([bench], sizes=['small', 'large'], repeat=3,
+            min_time=0.0)
+        self.assertEqual(1, len(results['results']))
+        result = results['results'][0]
+        self.assertEqual(10, result['parameter'])
+        self.assertTrue(result['calls'] >= 3)
+        comparison = harness.compare(results, results)
+        self.assertEqual(['unchanged'], list(comparison['status']))
+
+    def test_memory_method(self):
+        result = harness.measure(lambda: list(range(1000)), repeat=1,
+            min_time=0.0)
+        self.assertEqual(instrument.memory_method(), result['memory_method'])
+        if result['memory_method'] is not None:
+            self.assertTrue(result['peak_bytes'] >= 0)
+        result = harness.measure(lambda: None, repeat=1, min_time=0.0,
+            trace_memory=False)
+        self.assertEqual(None, result['peak_bytes'])
+
+    def test_errors_are_recorded(self):
+        def setup(n, random):
+            raise ValueError("bad input")
+        bench = harness.Benchmark("broken", "test", setup, {'small': 1})
+        results = harness.run([bench], min_time=0.0)
+        self.assertTrue('bad input' in results['results'][0]['error'])
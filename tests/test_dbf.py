@@ -0,0 +1,109 @@
+"""
+Tests for the columnar DBF reader.
+"""
+import unittest
+
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from waterkit.flow import nhdplus
+from waterkit.tools import dbf
+
+def write_test_dbf(path):
+    """
+    Write a DBF file by hand with a numeric, float, text, date and logical
+    field. The third of its four records is deleted.
+    """
+    fields = [
+        (b"COMID", b"N", 9, 0),
+        (b"AREASQKM", b"N", 10, 3),
+        (b"NAME", b"C", 8, 0),
+        (b"DATE", b"D", 8, 0),
+        (b"FLAG", b"L", 1, 0),
+    ]
+    records = [
+        b" " + b"      101" + b"     1.500" + b"Missouri" + b"20150601" + b"T",
+        b" " + b"      102" + b"          " + b"Gallatin" + b"        " + b"?",
+        b"*" + b"      103" + b"     9.000" + b"Deleted " + b"20150603" + b"F",
+        b" " + b"      104" + b"    12.250" + b"Madison " + b"20151231" + b"n",
+    ]
+    record_length = 1 + sum(length for _, _, length, _ in fields)
+    header_length = 32 + 32 * len(fields) + 1
+    with open(path, 'wb') as f:
+        f.write(struct.pack("<BBBBIHH20x", 3, 116, 1, 1, len(records),
+            header_length, record_length))
+        for name, type_code, length, decimal_count in fields:
+            f.write(struct.pack("<11sc4xBB14x", name, type_code, length,
+                decimal_count))
+        f.write(b"\r")
+        for record in records:
+            f.write(record)
+        f.write(b"\x1a")
+
+class ReadDbfTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.dbf")
+        write_test_dbf(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_header(self):
+        with open(self.path, 'rb') as f:
+            header = dbf.read_header(f)
+        self.assertEqual(4, header.records)
+        self.assertEqual(37, header.record_length)
+        self.assertEqual(['COMID', 'AREASQKM', 'NAME', 'DATE', 'FLAG'],
+            header.field_names)
+        self.assertEqual([1, 10, 20, 28, 36],
+            [field.offset for field in header.fields])
+
+    def test_read_all(self):
+        data = dbf.read_dbf(self.path)
+        self.assertEqual(['COMID', 'AREASQKM', 'NAME', 'DATE', 'FLAG'],
+            list(data.columns))
+        self.assertEqual([101, 102, 104], list(data['COMID']))
+        self.assertEqual(np.int64, data['COMID'].dtype)
+        np.testing.assert_equal([1.5, np.nan, 12.25], data['AREASQKM'].values)
+        self.assertEqual(['Missouri', 'Gallatin', 'Madison'],
+            list(data['NAME']))
+        self.assertEqual(pd.Timestamp("2015-06-01"), data['DATE'][0])
+        self.assertTrue(pd.isnull(data['DATE'][1]))
+        self.assertEqual([True, None, False], list(data['FLAG']))
+
+    def test_columns(self):
+        data = nhdplus.read_dbf(self.path, ['NAME', 'COMID'])
+        self.assertEqual(['NAME', 'COMID'], list(data.columns))
+        self.assertEqual([101, 102, 104], list(data['COMID']))
+
+    def test_missing_column(self):
+        with self.assertRaises(KeyError):
+            dbf.read_dbf(self.path, ['COMID', 'FTYPE'])
+
+    def test_chunks(self):
+        chunks = list(dbf.iter_dbf(self.path, ['COMID'], chunksize=2))
+        self.assertEqual([2, 1], [len(chunk) for chunk in chunks])
+        data = dbf.read_dbf(self.path, ['COMID'], chunksize=2)
+        self.assertEqual([101, 102, 104], list(data['COMID']))
+        self.assertEqual([0, 1, 2], list(data.index))
+
+    def test_write_round_trip(self):
+        frame = pd.DataFrame({
+            'FEATUREID': [5, 12345, 77],
+            'AreaSqKM': [0.25, 103.125, 7.0],
+            'NAME': ['a', 'bc', ''],
+            'FLAG': [True, False, True],
+        }, columns=['FEATUREID', 'AreaSqKM', 'NAME', 'FLAG'])
+        path = os.path.join(self.directory, "written.dbf")
+        dbf.write_dbf(path, frame)
+        data = dbf.read_dbf(path)
+        self.assertEqual(list(frame['FEATUREID']), list(data['FEATUREID']))
+        np.testing.assert_allclose(frame['AreaSqKM'], data['AreaSqKM'])
+        self.assertEqual(list(frame['NAME']), list(data['NAME']))
+        self.assertEqual(list(frame['FLAG']), list(data['FLAG']))
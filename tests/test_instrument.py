@@ -0,0 +1,83 @@
+"""
+Tests for the opt-in instrumentation layer.
+"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from waterkit.tools import instrument
+
+@instrument.instrumented()
+def make_frame(n):
+    with instrument.span("inner") as span:
+        values = np.arange(n)
+        span.set_rows(n)
+    return pd.DataFrame({'value': values})
+
+class InstrumentTest(unittest.TestCase):
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+
+    def test_disabled_records_nothing(self):
+        make_frame(10)
+        self.assertFalse(instrument.is_enabled())
+        self.assertEqual([], instrument.events())
+
+    def test_nested_spans(self):
+        instrument.enable()
+        make_frame(10)
+        make_frame(20)
+        events = instrument.events()
+        self.assertEqual(["inner", "test_instrument.make_frame"] * 2,
+            [event['name'] for event in events])
+        self.assertEqual([1, 0, 1, 0], [event['depth'] for event in events])
+        self.assertEqual([10, 10, 20, 20], [event['rows'] for event in events])
+        self.assertEqual("make_frame", make_frame.__name__)
+
+    def test_summary(self):
+        instrument.enable()
+        make_frame(10)
+        make_frame(20)
+        instrument.disable()
+        summary = instrument.summary()
+        self.assertEqual(2, summary.loc["inner", "calls"])
+        self.assertEqual(30, summary.loc["inner", "rows"])
+
+    def test_chrome_trace(self):
+        instrument.enable()
+        make_frame(10)
+        trace = instrument.chrome_trace()['traceEvents']
+        self.assertEqual(2, len(trace))
+        self.assertEqual("X", trace[0]['ph'])
+        self.assertEqual(10, trace[0]['args']['rows'])
+
+    def test_errors_are_recorded(self):
+        instrument.enable()
+        def fail():
+            with instrument.span("failing"):
+                raise ValueError()
+        self.assertRaises(ValueError, fail)
+        self.assertEqual("ValueError", instrument.events()[0]['error'])
+
+    @unittest.skipIf(instrument.tracemalloc is None, "tracemalloc unavailable")
+    def test_memory(self):
+        instrument.enable(memory=True)
+        make_frame(100000)
+        events = instrument.events()
+        self.assertTrue(events[0]['peak_bytes'] >= 100000 * 4)
+        self.assertTrue(events[1]['peak_bytes'] >= events[0]['peak_bytes'])
+
+    @unittest.skipIf(instrument.resource is None, "resource unavailable")
+    def test_memory_without_tracemalloc(self):
+        tracemalloc = instrument.tracemalloc
+        instrument.tracemalloc = None
+        try:
+            self.assertEqual('max_rss', instrument.memory_method())
+            instrument.enable(memory=True)
+            make_frame(100000)
+        finally:
+            instrument.tracemalloc = tracemalloc
+        for event in instrument.events():
+            self.assertTrue(event['peak_bytes'] >= 0)
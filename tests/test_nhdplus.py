@@ -0,0 +1,232 @@
+"""
+Tests for the NHDPlus network tools.
+"""
+import unittest
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from waterkit.flow import nhdplus
+from waterkit.tools import dbf
+
+from benchmarks import generators
+
+def sample_plusflow():
+    """
+    A small network draining to COMID 1. COMID 6 diverts into both 4 and 5.
+
+        7 -> 6 -> 4 -> 2 -> 1
+             6 -> 5 -> 3 -> 1
+                       8 -> 3
+    """
+    return pd.DataFrame({
+        'FROMCOMID': [2, 3, 4, 5, 6, 6, 7, 8],
+        'TOCOMID': [1, 1, 2, 3, 4, 5, 6, 3],
+    }, columns=['FROMCOMID', 'TOCOMID'])
+
+class GlobalConnectivityTest(unittest.TestCase):
+    def setUp(self):
+        self.local = nhdplus.create_connectivity_matrix(sample_plusflow())
+
+    def test_dense_closure(self):
+        closure = nhdplus.create_global_connectivity_matrix(self.local)
+        self.assertEqual(list(range(1, 9)), list(closure.index))
+        self.assertEqual(list(range(1, 9)), list(closure.columns))
+        # Check against repeated squaring of the local matrix.
+        expected = np.eye(8, dtype=int) + self.local.values
+        for i in range(8):
+            expected = (expected.dot(expected) > 0).astype(int)
+        np.testing.assert_equal(expected, closure.values)
+
+    def test_reachability(self):
+        reachability = nhdplus.create_global_connectivity_matrix(self.local,
+            as_frame=False)
+        self.assertEqual(8, len(reachability))
+        self.assertTrue(reachability.is_connected(7, 1))
+        self.assertTrue(reachability.is_connected(6, 3))
+        self.assertFalse(reachability.is_connected(8, 2))
+        self.assertFalse(reachability.is_connected(1, 7))
+        self.assertEqual([1, 2, 3, 4, 5, 6, 7],
+            list(reachability.downstream(7)))
+        self.assertEqual([3, 5, 6, 7, 8], list(reachability.upstream(3)))
+        frame = reachability.to_frame()
+        np.testing.assert_equal(
+            nhdplus.create_global_connectivity_matrix(self.local).values,
+            frame.values)
+        self.assertEqual('FROMCOMID', frame.index.name)
+        self.assertEqual('TOCOMID', frame.columns.name)
+
+    def test_terminals(self):
+        plusflow = pd.concat([sample_plusflow(), pd.DataFrame({
+            'FROMCOMID': [0, 0, 1],
+            'TOCOMID': [7, 8, 0],
+        })], ignore_index=True)
+        local = nhdplus.create_connectivity_matrix(plusflow)
+        self.assertEqual(list(range(1, 9)), list(local.index))
+        np.testing.assert_equal(self.local.values, local.values)
+        expected = nhdplus.create_global_connectivity_matrix(self.local)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "PlusFlow.dbf")
+            dbf.write_dbf(path, plusflow)
+            closure = nhdplus.read_global_connectivity(path)
+        finally:
+            shutil.rmtree(directory)
+        np.testing.assert_equal(expected.values, closure.values)
+        # A dense matrix that still has a row and column for 0.
+        with_zero = nhdplus.create_connectivity_matrix(plusflow,
+            drop_terminals=False)
+        self.assertEqual(0, with_zero.index[0])
+        closure = nhdplus.create_global_connectivity_matrix(with_zero)
+        np.testing.assert_equal(expected.values, closure.values)
+
+    def test_cycle(self):
+        plusflow = sample_plusflow()
+        plusflow.loc[len(plusflow)] = [1, 7]
+        local = nhdplus.create_connectivity_matrix(plusflow)
+        self.assertRaises(ValueError,
+            nhdplus.create_global_connectivity_matrix, local)
+
+    def test_drainage_area(self):
+        catchments = pd.DataFrame({
+            'FEATUREID': np.arange(1, 9),
+            'AreaSqKM': np.arange(1, 9) * 1.0,
+        })
+        reachability = nhdplus.create_global_connectivity_matrix(self.local,
+            as_frame=False)
+        self.assertEqual(3 + 5 + 6 + 7 + 8,
+            nhdplus.calculate_drainage_area(3, catchments, reachability))
+
+class SparseConnectivityTest(unittest.TestCase):
+    def setUp(self):
+        self.plusflow = sample_plusflow()
+        self.sparse = nhdplus.create_connectivity_matrix(self.plusflow,
+            sparse=True)
+
+    def test_matches_dense(self):
+        dense = nhdplus.create_connectivity_matrix(self.plusflow)
+        self.assertEqual(8, len(self.sparse))
+        self.assertEqual(8, self.sparse.nnz)
+        self.assertEqual(list(dense.index), list(self.sparse.comids))
+        np.testing.assert_equal(dense.values, self.sparse.to_frame().values)
+
+    def test_terminals_and_duplicates(self):
+        plusflow = pd.concat([self.plusflow, pd.DataFrame({
+            'FROMCOMID': [0, 1, 7],
+            'TOCOMID': [7, 0, 6],
+        })], ignore_index=True)
+        sparse = nhdplus.create_sparse_connectivity(plusflow)
+        self.assertEqual(list(range(1, 9)), list(sparse.comids))
+        self.assertEqual(8, sparse.nnz)
+
+    def test_neighbors(self):
+        self.assertEqual([4, 5], list(self.sparse.downstream_neighbors(6)))
+        self.assertEqual([2, 3], list(self.sparse.transpose().downstream_neighbors(1)))
+        self.assertRaises(KeyError, self.sparse.positions, [1, 42])
+
+    def test_global_connectivity(self):
+        dense = nhdplus.create_global_connectivity_matrix(
+            nhdplus.create_connectivity_matrix(self.plusflow))
+        sparse = nhdplus.create_global_connectivity_matrix(self.sparse)
+        np.testing.assert_equal(dense.values, sparse.values)
+
+    def test_graph(self):
+        g = nhdplus.to_directed_acyclic_graph(self.sparse)
+        self.assertEqual(8, g.number_of_nodes())
+        self.assertTrue(g.has_edge(6, 5))
+
+class DrainageAreaTest(unittest.TestCase):
+    def setUp(self):
+        self.catchments = pd.DataFrame({
+            'FEATUREID': np.arange(8, 0, -1),
+            'AreaSqKM': np.arange(8, 0, -1) * 1.0,
+        })
+        self.local = nhdplus.create_sparse_connectivity(sample_plusflow())
+
+    def test_equal_split(self):
+        areas = nhdplus.accumulate_drainage_areas(self.catchments, self.local)
+        self.assertEqual(list(range(8, 0, -1)), list(areas.index))
+        self.assertEqual(36.0, areas[1])
+        self.assertEqual(13.0, areas[6])
+        self.assertEqual(10.5, areas[4])
+        self.assertEqual(22.5, areas[3])
+
+    def test_full_split(self):
+        areas = nhdplus.accumulate_drainage_areas(self.catchments, self.local,
+            'full')
+        self.assertEqual(17.0, areas[4])
+        self.assertEqual(49.0, areas[1])
+
+    def test_fractions(self):
+        areas = nhdplus.accumulate_drainage_areas(self.catchments, self.local,
+            pd.Series({4: 0.8, 5: 0.2}))
+        np.testing.assert_almost_equal(14.4, areas[4])
+        np.testing.assert_almost_equal(7.6, areas[5])
+        np.testing.assert_almost_equal(36.0, areas[1])
+
+    def test_matches_closure_on_tree(self):
+        plusflow = sample_plusflow()
+        tree = plusflow[~((plusflow['FROMCOMID'] == 6) &
+            (plusflow['TOCOMID'] == 5))]
+        local = nhdplus.create_connectivity_matrix(tree)
+        expected = nhdplus.calculate_drainage_areas(self.catchments,
+            nhdplus.create_global_connectivity_matrix(local))
+        areas = nhdplus.accumulate_drainage_areas(self.catchments, local)
+        np.testing.assert_almost_equal(expected['AreaSqKM'].values,
+            areas.values)
+
+class NetworkIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.plusflow = sample_plusflow()
+        self.local = nhdplus.create_sparse_connectivity(self.plusflow)
+        self.index = nhdplus.create_network_index(self.local)
+        self.reachability = nhdplus.create_global_connectivity_matrix(
+            self.local, as_frame=False)
+
+    def test_matches_reachability(self):
+        self.assertFalse(self.index.is_tree)
+        for a in range(1, 9):
+            self.assertEqual(list(self.reachability.upstream(a)),
+                list(self.index.upstream_of(a)))
+            for b in range(1, 9):
+                self.assertEqual(self.reachability.is_connected(a, b),
+                    self.index.is_upstream(a, b))
+
+    def test_tree(self):
+        tree = self.plusflow[~((self.plusflow['FROMCOMID'] == 6) &
+            (self.plusflow['TOCOMID'] == 5))]
+        index = nhdplus.create_network_index(
+            nhdplus.create_connectivity_matrix(tree))
+        self.assertTrue(index.is_tree)
+        self.assertTrue(index.is_upstream(7, 1))
+        self.assertFalse(index.is_upstream(7, 3))
+        self.assertFalse(index.is_upstream(1, 7))
+        self.assertEqual([3, 5, 8], list(index.upstream_of(3)))
+
+    def test_downstream_path(self):
+        self.assertEqual([7, 6, 4, 2, 1],
+            list(self.index.downstream_path(7)))
+        self.assertEqual([1], list(self.index.downstream_path(1)))
+
+    def test_unknown_comid(self):
+        with self.assertRaises(KeyError):
+            self.index.is_upstream(7, 9)
+
+    def test_generated_network(self):
+        plusflow = generators.plusflow(300, np.random.RandomState(1),
+            divergence=0.1, max_reach=5)
+        local = nhdplus.create_sparse_connectivity(plusflow)
+        index = nhdplus.create_network_index(local)
+        reachability = nhdplus.create_global_connectivity_matrix(local,
+            as_frame=False)
+        random = np.random.RandomState(2)
+        for a, b in random.choice(local.comids, size=(500, 2)):
+            self.assertEqual(reachability.is_connected(a, b),
+                index.is_upstream(a, b))
+        for comid in random.choice(local.comids, size=20):
+            self.assertEqual(list(reachability.upstream(comid)),
+                list(index.upstream_of(comid)))
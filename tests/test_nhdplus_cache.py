@@ -0,0 +1,133 @@
+"""
+Tests for the NHDPlus network cache.
+"""
+import unittest
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import waterkit
+
+from waterkit.flow import nhdplus, nhdplus_cache
+from waterkit.tools import dbf
+
+from tests.test_nhdplus import sample_plusflow
+
+def catchment_table():
+    return pd.DataFrame({
+        'FEATUREID': np.arange(1, 9),
+        'AreaSqKM': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0],
+    }, columns=['FEATUREID', 'AreaSqKM'])
+
+class CountingReader(object):
+    """Wraps nhdplus.read_dbf to count the files that are parsed."""
+    def __init__(self):
+        self.calls = []
+        self.read_dbf = nhdplus.read_dbf
+
+    def __call__(self, filename, columns=None):
+        self.calls.append(os.path.basename(filename))
+        return self.read_dbf(filename, columns)
+
+class NetworkCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.plusflow = os.path.join(self.directory, "PlusFlow.dbf")
+        self.catchments = os.path.join(self.directory, "Catchment.dbf")
+        dbf.write_dbf(self.plusflow, sample_plusflow())
+        dbf.write_dbf(self.catchments, catchment_table())
+        self.cache = nhdplus_cache.NetworkCache(
+            os.path.join(self.directory, "cache"))
+        self.reader = CountingReader()
+        nhdplus.read_dbf = self.reader
+
+    def tearDown(self):
+        nhdplus.read_dbf = self.reader.read_dbf
+        shutil.rmtree(self.directory)
+
+    def test_connectivity(self):
+        expected = nhdplus.create_sparse_connectivity(sample_plusflow())
+        for i in range(2):
+            connectivity = self.cache.connectivity(self.plusflow)
+            np.testing.assert_equal(expected.comids, connectivity.comids)
+            np.testing.assert_equal(expected.indptr, connectivity.indptr)
+            np.testing.assert_equal(expected.indices, connectivity.indices)
+        self.assertEqual(["PlusFlow.dbf"], self.reader.calls)
+
+    def test_topological_order(self):
+        order = list(self.cache.topological_order(self.plusflow))
+        self.assertEqual(8, len(order))
+        for source, target in sample_plusflow().values:
+            self.assertLess(order.index(source), order.index(target))
+
+    def test_reachability(self):
+        expected = nhdplus.create_global_connectivity_matrix(
+            nhdplus.create_connectivity_matrix(sample_plusflow()))
+        closure = nhdplus.read_global_connectivity(self.plusflow,
+            cache=self.cache)
+        np.testing.assert_equal(expected.values, closure.values)
+
+    def test_network_index(self):
+        index = self.cache.network_index(self.plusflow)
+        self.assertTrue(index.is_upstream(7, 5))
+        self.assertEqual([3, 5, 6, 7, 8], list(index.upstream_of(3)))
+
+    def test_drainage_areas(self):
+        expected = nhdplus.accumulate_drainage_areas(catchment_table(),
+            nhdplus.create_sparse_connectivity(sample_plusflow()))
+        for i in range(2):
+            areas = self.cache.drainage_areas(self.catchments, self.plusflow)
+            self.assertEqual(list(expected.index), list(areas.index))
+            np.testing.assert_allclose(expected.values, areas.values)
+        self.assertEqual(2, len(self.reader.calls))
+
+    def test_memory_map(self):
+        self.cache.connectivity(self.plusflow)
+        cache = nhdplus_cache.NetworkCache(self.cache.directory,
+            mmap_mode='r')
+        connectivity = cache.connectivity(self.plusflow)
+        self.assertFalse(connectivity.indices.flags.writeable)
+
+    def test_source_change(self):
+        self.cache.drainage_areas(self.catchments, self.plusflow)
+        catchments = catchment_table()
+        catchments['AreaSqKM'] *= 2
+        dbf.write_dbf(self.catchments, catchments)
+        stat = os.stat(self.catchments)
+        os.utime(self.catchments, (stat.st_atime, stat.st_mtime + 10))
+        areas = self.cache.drainage_areas(self.catchments, self.plusflow)
+        self.assertEqual(2 * 36.0, areas[1])
+        # Only the changed catchment table was parsed again.
+        self.assertEqual(3, len(self.reader.calls))
+
+    def test_version_change(self):
+        self.cache.connectivity(self.plusflow)
+        version = waterkit.__version__
+        waterkit.__version__ = version + ".dev"
+        try:
+            self.cache.connectivity(self.plusflow)
+        finally:
+            waterkit.__version__ = version
+        self.assertEqual(2, len(self.reader.calls))
+        self.assertEqual(2, len(self.cache.entries()))
+
+    def test_format_change(self):
+        self.cache.connectivity(self.plusflow)
+        cache_format = nhdplus_cache.CACHE_FORMAT
+        nhdplus_cache.CACHE_FORMAT = cache_format + 1
+        try:
+            self.cache.connectivity(self.plusflow)
+        finally:
+            nhdplus_cache.CACHE_FORMAT = cache_format
+        self.assertEqual(2, len(self.reader.calls))
+
+    def test_clear(self):
+        self.cache.read_dbf(self.catchments)
+        self.assertEqual(1, len(self.cache.entries()))
+        self.assertTrue(self.cache.size() > 0)
+        self.cache.clear()
+        self.assertEqual([], self.cache.entries())
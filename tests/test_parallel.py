@@ -0,0 +1,86 @@
+"""Unit tests for the tools.parallel module"""
+import unittest
+
+import errno
+import socket
+import threading
+
+from waterkit.tools import parallel
+
+class Flaky(object):
+    """Callable that fails a fixed number of times before succeeding."""
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise socket.error("temporary failure")
+        return value * 2
+
+class RetryTest(unittest.TestCase):
+    def test_succeeds_after_retries(self):
+        function = Flaky(2)
+        result = parallel.call_with_retry(function, (3,), retries=2, backoff=0.0)
+        self.assertEqual(6, result)
+        self.assertEqual(3, function.calls)
+
+    def test_raises_when_retries_exhausted(self):
+        function = Flaky(2)
+        self.assertRaises(socket.error, parallel.call_with_retry, function,
+            (3,), retries=1, backoff=0.0)
+
+    def test_permanent_errors_are_not_retried(self):
+        calls = []
+        def function(value):
+            calls.append(value)
+            raise ValueError("bad site id")
+        self.assertRaises(ValueError, parallel.call_with_retry, function,
+            (3,), retries=2, backoff=0.0)
+        self.assertEqual(1, len(calls))
+
+    def test_is_transient(self):
+        self.assertTrue(parallel.is_transient(socket.error("reset")))
+        self.assertTrue(parallel.is_transient(socket.timeout("timed out")))
+        self.assertTrue(parallel.is_transient(parallel.URLError("refused")))
+        self.assertTrue(parallel.is_transient(parallel.HTTPError(
+            "http://example.com", 503, "Unavailable", None, None)))
+        self.assertFalse(parallel.is_transient(parallel.HTTPError(
+            "http://example.com", 404, "Not Found", None, None)))
+        self.assertFalse(parallel.is_transient(
+            IOError(errno.ENOENT, "No such file or directory")))
+        self.assertFalse(parallel.is_transient(KeyError("flow")))
+
+class MapConcurrentTest(unittest.TestCase):
+    def test_preserves_order(self):
+        result = parallel.map_concurrent(lambda x: x * x, range(20), max_workers=4)
+        self.assertEqual([x * x for x in range(20)], result)
+
+    def test_empty(self):
+        self.assertEqual([], parallel.map_concurrent(lambda x: x, []))
+
+class HostLimiterTest(unittest.TestCase):
+    def test_get_host(self):
+        self.assertEqual("waterservices.usgs.gov",
+            parallel.get_host("http://waterservices.usgs.gov/nwis/dv/?a=b"))
+        self.assertEqual("localhost",
+            parallel.get_host("http://localhost:8000/dv/"))
+
+    def test_limit(self):
+        limiter = parallel.HostLimiter(max_connections=2)
+        active = []
+        peak = []
+        lock = threading.Lock()
+        def request(i):
+            with limiter.limit("http://example.com/%d" % i):
+                with lock:
+                    active.append(i)
+                    peak.append(len(active))
+                threading.Event().wait(0.01)
+                with lock:
+                    active.remove(i)
+        parallel.map_concurrent(request, range(8), max_workers=8)
+        self.assertTrue(max(peak) <= 2)
@@ -3,7 +3,7 @@ import unittest
 import pandas as pd
 import numpy as np
 
-from waterkit.flow import rasterflow
+from waterkit.flow import analysis, rasterflow
 
 from datetime import datetime
 
@@ -15,6 +15,11 @@ class FlatFlowTargetTest(unittest.TestCase):
         for day in range(1, 366):
             self.assertEqual(5, self.target.get_target_flow(day))
 
+    def test_get_target_flows(self):
+        days = np.arange(1, 367)
+        np.testing.assert_equal(np.repeat(5.0, 366),
+            self.target.get_target_flows(days))
+
     def test_as_daily_timeseries_no_effective_date(self):
         series = self.target.as_daily_timeseries(
             begin=datetime(2016, 1, 1),
@@ -40,6 +45,34 @@ class SeriesFlowTargetTest(unittest.TestCase):
         self.target = rasterflow.SeriesFlowTarget(
             pd.Series(values, index=dates))
 
+    def test_get_target_flows(self):
+        np.testing.assert_equal(np.array([1.0, 3.0, np.nan]),
+            self.target.get_target_flows(np.array([1, 3, 100])))
+        np.testing.assert_equal(np.array([0.0]),
+            self.target.get_target_flows(np.array([100]), default=0.0))
+
+    def test_get_target_flow_uses_day_of_year_mean(self):
+        dates = [datetime(2014, 1, 1), datetime(2015, 1, 1),
+            datetime(2015, 1, 2)]
+        target = rasterflow.SeriesFlowTarget(
+            pd.Series([1.0, 3.0, 5.0], index=dates))
+        self.assertEqual(2.0, target.get_target_flow(1))
+        self.assertEqual(5.0, target.get_target_flow(2))
+        self.assertEqual(0.0, target.get_target_flow(3, default=0.0))
+
+    def test_get_target_flows_percentile(self):
+        dates = [datetime(year, 1, 1) for year in range(2010, 2015)]
+        target = rasterflow.SeriesFlowTarget(
+            pd.Series([1.0, 2.0, 3.0, 4.0, 5.0], index=dates))
+        self.assertEqual(3.0, target.get_target_flow(1, statistic=50))
+        self.assertEqual(5.0, target.get_target_flow(1, statistic=100))
+
+    def test_replacing_series_invalidates_cache(self):
+        self.assertEqual(1.0, self.target.get_target_flow(1))
+        dates = [datetime(2015, 1, d) for d in range(1, 6)]
+        self.target.series = pd.Series([10, 20, 30, 40, 50], index=dates)
+        self.assertEqual(10.0, self.target.get_target_flow(1))
+
     def test_as_daily_timeseries_no_effective_date(self):
         series = self.target.as_daily_timeseries(
             begin=datetime(2015, 1, 2),
@@ -56,3 +89,77 @@ class SeriesFlowTargetTest(unittest.TestCase):
         )
         expected = np.array([0, 3, 4])
         np.testing.assert_equal(expected, np.array(series))
+
+
+class GradedFlowTargetTest(unittest.TestCase):
+    def setUp(self):
+        self.target = rasterflow.GradedFlowTarget([
+            (("5-15", "7-14"), 800.0),
+            (("7-15", "9-30"), 400.0),
+        ])
+
+    def test_lookup_table_matches_get_target_flow(self):
+        table = self.target.get_lookup_table(0.0)
+        for day in range(0, 367):
+            self.assertEqual(self.target.get_target_flow(day, 0.0), table[day])
+
+    def test_get_target_flows_matches_get_target_flow(self):
+        self.target.add(("12-01", "01-31"), 50.0)
+        days = np.arange(-1, 369)
+        expected = [self.target.get_target_flow(day) for day in days]
+        np.testing.assert_equal(np.array(expected),
+            self.target.get_target_flows(days))
+
+    def test_get_target_flows_empty(self):
+        target = rasterflow.GradedFlowTarget()
+        np.testing.assert_equal(np.array([0.0, 0.0]),
+            target.get_target_flows(np.array([1, 2]), default=0.0))
+
+    def test_lookup_table_updated_after_add(self):
+        self.target.get_lookup_table()
+        self.target.add(("10-01", "10-31"), 100.0)
+        day = datetime(2000, 10, 15).timetuple().tm_yday
+        self.assertEqual(100.0, self.target.get_lookup_table()[day])
+
+    def test_as_daily_timeseries_with_effective_date_and_term(self):
+        series = self.target.as_daily_timeseries(
+            begin=datetime(2014, 1, 1),
+            end=datetime(2017, 12, 31),
+            effective_date=datetime(2015, 6, 1),
+            term=1
+        )
+        effective = pd.Timestamp(datetime(2015, 6, 1))
+        end = effective + pd.Timedelta(days=365)
+        for date, value in series.iteritems():
+            if date < effective or date > end:
+                expected = 0.0
+            else:
+                expected = self.target.get_target_flow(date.dayofyear, 0.0)
+            self.assertEqual(expected, value)
+
+class EvaluateTargetsTest(unittest.TestCase):
+    def setUp(self):
+        index = pd.date_range("2015-01-01", "2016-12-31", freq="D")
+        self.flow = pd.Series(
+            10 + 5 * np.sin(np.arange(len(index)) / 30.0), index=index)
+        graded = rasterflow.GradedFlowTarget()
+        graded.add(("01-01", "06-30"), 12)
+        graded.add(("07-01", "12-31"), 8)
+        self.targets = [rasterflow.FlatFlowTarget(9), graded]
+
+    def test_target_matrix(self):
+        matrix = rasterflow.target_matrix(self.flow.index, self.targets, 2.0)
+        self.assertEqual((2, len(self.flow)), matrix.shape)
+        for row, target in enumerate(self.targets):
+            expected = target.as_daily_timeseries_aligned(self.flow.index)
+            np.testing.assert_equal(2.0 * np.array(expected), matrix[row])
+
+    def test_matches_gap_attributes(self):
+        result = rasterflow.evaluate_targets(self.flow, self.targets,
+            names=['flat', 'graded'], unit_multiplier=1.9835)
+        for name, target in zip(['flat', 'graded'], self.targets):
+            data = pd.DataFrame({'flow': self.flow})
+            rasterflow.add_gap_attributes(data, 'flow', target, 1.0)
+            expected = analysis.annual_volume_deficit(data, 'flow-gap', 1.9835)
+            np.testing.assert_almost_equal(np.array(expected),
+                np.array(result.annual_volume_deficit[name].dropna()))
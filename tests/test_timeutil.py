@@ -0,0 +1,83 @@
+"""Unit tests for the flow.timeutil module"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from waterkit.flow import timeutil
+
+class WaterYearTest(unittest.TestCase):
+    def setUp(self):
+        self.index = pd.date_range("2014-09-29", "2015-10-02", freq="D")
+
+    def test_matches_scalar(self):
+        expected = [timeutil.get_wateryear(d) for d in self.index]
+        np.testing.assert_equal(np.array(expected),
+            timeutil.get_wateryears(self.index))
+
+    def test_start_month(self):
+        years = timeutil.get_wateryears(self.index, start_month=7)
+        expected = [timeutil.get_wateryear(d, start_month=7) for d in self.index]
+        np.testing.assert_equal(np.array(expected), years)
+        self.assertEqual(2015, years[0])
+
+    def test_calendar_year(self):
+        np.testing.assert_equal(np.asarray(self.index.year),
+            timeutil.get_wateryears(self.index, start_month=1))
+
+class CalendarIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = pd.date_range("2015-09-30", "2016-03-01", freq="D")
+
+    def test_codes(self):
+        calendar = timeutil.get_calendar(self.index)
+        np.testing.assert_equal(np.asarray(self.index.year), calendar.year)
+        np.testing.assert_equal(np.asarray(self.index.month), calendar.month)
+        np.testing.assert_equal(np.asarray(self.index.day), calendar.day)
+        np.testing.assert_equal(np.asarray(self.index.dayofyear),
+            calendar.dayofyear)
+        np.testing.assert_equal(timeutil.get_wateryears(self.index),
+            calendar.wateryear)
+        self.assertEqual(np.int16, calendar.year.dtype)
+        self.assertEqual(np.int8, calendar.month.dtype)
+
+    def test_memoized_by_identity(self):
+        calendar = timeutil.get_calendar(self.index)
+        self.assertTrue(calendar is timeutil.get_calendar(self.index))
+        other = pd.date_range("2015-09-30", "2016-03-01", freq="D")
+        self.assertFalse(calendar is timeutil.get_calendar(other))
+        self.assertFalse(calendar is
+            timeutil.get_calendar(self.index, wateryear_start_month=7))
+
+class SeasonTest(unittest.TestCase):
+    def setUp(self):
+        self.index = pd.date_range("2015-01-01", "2016-12-31", freq="D")
+
+    def test_inclusive_bounds(self):
+        season = timeutil.Season("05-15", "09-30")
+        selected = self.index[season.contains(self.index)]
+        self.assertEqual(pd.Timestamp("2015-05-15"), selected[0])
+        self.assertEqual(pd.Timestamp("2016-09-30"), selected[-1])
+        self.assertEqual(2 * 139, len(selected))
+        self.assertEqual(139, season.length())
+
+    def test_exclusive_bounds(self):
+        season = timeutil.Season(timeutil.DayOfYear(5, 15),
+            timeutil.DayOfYear(9, 30), inclusive=(False, False))
+        selected = self.index[season.contains(self.index)]
+        self.assertEqual(pd.Timestamp("2015-05-16"), selected[0])
+        self.assertEqual(137, season.length())
+
+    def test_wraps_new_year(self):
+        season = timeutil.Season("11-01", "03-31")
+        mask = season.contains(self.index)
+        self.assertTrue(mask[self.index.get_loc(pd.Timestamp("2015-12-31"))])
+        self.assertTrue(mask[self.index.get_loc(pd.Timestamp("2016-02-29"))])
+        self.assertFalse(mask[self.index.get_loc(pd.Timestamp("2015-04-01"))])
+        self.assertEqual(151, season.length())
+        self.assertEqual(152, season.length(leap_year=True))
+
+    def test_filter(self):
+        data = pd.Series(1.0, index=self.index)
+        season = timeutil.Season("03-01", "03-31")
+        self.assertEqual(62, len(season.filter(data)))
@@ -0,0 +1,94 @@
+"""
+Tests for the local USGS download cache.
+"""
+import unittest
+
+import os
+import shutil
+import tempfile
+
+from waterkit.flow import usgs_cache, usgs_data
+from waterkit.tools import parallel
+
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+RDB_FILE = os.path.join(THIS_DIR, "test_usgs_data.rdb")
+
+class LocalFetcher(object):
+    """Stand-in for usgs_data.get_gage_data that reads a local RDB file."""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, site_id, start_date, end_date,
+        parameter_code=usgs_data.FLOW_PARAMETER_CODE, parameter_name='flow'):
+        self.calls.append((start_date, end_date))
+        data = usgs_data.read_rdb(RDB_FILE, parameter_name)
+        return data[start_date:end_date]
+
+class GageDataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fetch = LocalFetcher()
+        self.cache = usgs_cache.GageDataCache(self.directory, fetch=self.fetch)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_second_read_uses_cache(self):
+        first = self.cache.get_gage_data("06043500", "1950-01-01", "1950-01-31")
+        second = self.cache.get_gage_data("06043500", "1950-01-05", "1950-01-20")
+        self.assertEqual(1, len(self.fetch.calls))
+        self.assertEqual(31, len(first))
+        self.assertEqual(16, len(second))
+        self.assertEqual(["flow"], list(second.columns))
+        self.assertEqual(first.loc["1950-01-05", "flow"],
+            second.loc["1950-01-05", "flow"])
+
+    def test_fetches_only_missing_tail(self):
+        self.cache.get_gage_data("06043500", "1950-01-01", "1950-01-31")
+        data = self.cache.get_gage_data("06043500", "1950-01-01", "1950-02-28")
+        self.assertEqual([("1950-01-01", "1950-01-31"),
+            ("1950-02-01", "1950-02-28")], self.fetch.calls)
+        self.assertEqual(59, len(data))
+        self.assertTrue(data.index.is_monotonic)
+
+    def test_refetches_unpublished_tail(self):
+        # The test record ends on 1950-02-28.
+        self.cache.get_gage_data("06043500", "1950-02-01", "1950-03-31")
+        data = self.cache.get_gage_data("06043500", "1950-02-01", "1950-03-31")
+        self.assertEqual([("1950-02-01", "1950-03-31"),
+            ("1950-03-01", "1950-03-31")], self.fetch.calls)
+        self.assertEqual(28, len(data))
+
+    def test_eviction(self):
+        self.cache.get_gage_data("06043500", "1950-01-01", "1950-01-31")
+        self.cache.max_bytes = 1
+        self.cache.get_gage_data("06043500", "1950-01-01", "1950-01-31",
+            parameter_code="00010")
+        self.assertEqual(1, len(self.cache.entries()))
+
+    def test_does_not_refetch_unpublished_head(self):
+        # The test record starts on 1950-01-01.
+        self.cache.get_gage_data("06043500", "1949-12-01", "1950-01-31")
+        self.cache.get_gage_data("06043500", "1949-12-01", "1950-01-31")
+        self.assertEqual([("1949-12-01", "1950-01-31")], self.fetch.calls)
+
+    def test_records_requested_head(self):
+        self.cache.get_gage_data("06043500", "1950-01-15", "1950-01-31")
+        self.cache.get_gage_data("06043500", "1949-12-01", "1950-01-31")
+        data = self.cache.get_gage_data("06043500", "1949-11-01",
+            "1950-01-31")
+        self.assertEqual([("1950-01-15", "1950-01-31"),
+            ("1949-12-01", "1950-01-14"), ("1949-11-01", "1949-11-30")],
+            self.fetch.calls)
+        self.assertEqual(31, len(data))
+
+    def test_concurrent_reads(self):
+        # Threads sharing the cache download each entry only once.
+        requests = [("06043500", code) for code in ["00060", "00010"] * 4]
+        results = parallel.map_concurrent(lambda request:
+            self.cache.get_gage_data(request[0], "1950-01-01", "1950-01-31",
+                parameter_code=request[1]), requests, max_workers=8)
+        self.assertEqual([31] * 8, [len(result) for result in results])
+        self.assertEqual(2, len(self.fetch.calls))
+        self.assertEqual([], [name for name in os.listdir(self.directory)
+            if ".tmp" in name])
@@ -0,0 +1,64 @@
+"""
+Tests for reading USGS RDB data.
+"""
+import unittest
+
+import os
+
+import numpy as np
+
+from waterkit.flow import usgs_data
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+RDB_FILE = os.path.join(THIS_DIR, "test_usgs_data.rdb")
+
+MULTI_SITE_RDB = "\n".join([
+    "# Data provided for site 06043500",
+    "agency_cd\tsite_no\tdatetime\t01_00060_00003\t01_00060_00003_cd",
+    "5s\t15s\t20d\t14n\t10s",
+    "USGS\t06043500\t2015-01-01\t250\tA",
+    "USGS\t06043500\t2015-01-02\tIce\t",
+    "USGS\t06043500\t2015-01-03\t260\tP",
+    "#",
+    "# Data provided for site 06052500",
+    "agency_cd\tsite_no\tdatetime\t02_00060_00003\t02_00060_00003_cd",
+    "5s\t15s\t20d\t14n\t10s",
+    "USGS\t06052500\t2015-01-01\t900\tA",
+    "USGS\t06052500\t2015-01-02\tEqp\tA",
+]) + "\n"
+
+class ReadRdbTest(unittest.TestCase):
+    def test_read_file(self):
+        data = usgs_data.read_rdb(RDB_FILE)
+        self.assertEqual(["flow"], list(data.columns))
+        self.assertEqual("date", data.index.name)
+        self.assertEqual(59, len(data))
+        self.assertEqual(300.0, data.loc["1950-01-01", "flow"])
+        self.assertTrue(np.isnan(data.loc["1950-01-10", "flow"]))
+
+    def test_read_qualifiers(self):
+        data = usgs_data.read_rdb(RDB_FILE, qualifiers=True)
+        self.assertEqual("category", str(data["flow_cd"].dtype))
+        self.assertEqual("Ice", data.loc["1950-01-10", "flow_cd"])
+        self.assertEqual("A:e", data.loc["1950-01-01", "flow_cd"])
+        self.assertEqual("A", data.loc["1950-01-02", "flow_cd"])
+
+    def test_read_sites(self):
+        sites = usgs_data.read_rdb_sites(StringIO(MULTI_SITE_RDB),
+            qualifiers=True)
+        self.assertEqual(set(["06043500", "06052500"]), set(sites.keys()))
+        self.assertEqual(3, len(sites["06043500"]))
+        self.assertEqual(900.0, sites["06052500"]["flow"].iloc[0])
+        self.assertEqual("Eqp", sites["06052500"]["flow_cd"].iloc[1])
+        self.assertEqual("Ice", sites["06043500"]["flow_cd"].iloc[1])
+
+    def test_iter_chunks(self):
+        chunks = list(usgs_data.iter_rdb(StringIO(MULTI_SITE_RDB),
+            chunksize=2))
+        self.assertEqual([2, 1, 2], [len(chunk) for chunk in chunks])
+        self.assertEqual("06052500", chunks[-1]["site_no"].iloc[0])
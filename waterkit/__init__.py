@@ -1,3 +1,4 @@
 """
 Package for working with water data.
-"""
\ No newline at end of file
+"""
+__version__ = '0.1'
@@ -1,6 +1,6 @@
 import pandas as pd
 
-from waterkit.flow.timeutil import get_wateryear
+from waterkit.flow.timeutil import as_season, get_wateryears
 import waterkit.flow.analysis as flow_analysis
 
 import usdm
@@ -44,9 +44,9 @@ class DroughtYearFromFlowAnalysis(DroughtYearAnalysis):
         Flow data in cfs as a series indexed by date.
     quantile : number
         Quantile to use when identifying drought years.
-    season : tuple
-        Interval of waterkit.flow.DayOfYear objects specifying the begin and
-        end days of the season.
+    season : Season or tuple
+        A waterkit.flow.timeutil.Season, or an interval of DayOfYear objects
+        specifying the first and last days of the season.
     year_window : int
         The number of years to use when calcluating the volume threshold based
         on the specified quantile value.
@@ -54,20 +54,19 @@ class DroughtYearFromFlowAnalysis(DroughtYearAnalysis):
     def __init__(self, flowdata, quantile=0.1,
         season=None, year_window=20):
         if season:
-            # Don't use a leap year here to calculate the season day of year.
+            # Don't use a leap year here to calculate the season length.
             # We want to include all years that have the full collection of
             # days for the season, regardless of whether or not that year is
             # a leap year.
-            begin_day = season[0].get_dayofyear(leap_year=False)
-            end_day = season[1].get_dayofyear(leap_year=False)
-            season_length = end_day - begin_day - 1
+            season_length = as_season(season).length(leap_year=False)
         else:
             season_length = 365
         self.flowdata = flowdata
         self.quantile = quantile
-        groups = self.flowdata.groupby(get_wateryear)
+        groups = self.flowdata.groupby(get_wateryears(self.flowdata.index))
         full_years = groups.filter(lambda g: g.count() >= season_length)
-        volumes = full_years.groupby(get_wateryear).sum() * flow_analysis.CFS_TO_AFD
+        volumes = full_years.groupby(get_wateryears(full_years.index)).sum() \
+            * flow_analysis.CFS_TO_AFD
         self.volumes = volumes
         self.year_window = year_window
 
@@ -96,10 +95,12 @@ class DroughtYearFromUsdmAnalysis(DroughtYearAnalysis):
         self.usdmdata = usdm.read_usdm_download(usdmfile)
         self.area_threshold = area_threshold
         self.time_threshold = time_threshold
-        groups = self.usdmdata[level].groupby(timeutil.get_wateryear)
+        levels = self.usdmdata[level]
+        groups = levels.groupby(get_wateryears(levels.index))
         full_years = groups.filter(lambda g: g.count() >= 365)
         drought_days = full_years > 100.0 * area_threshold
-        self.fractions = drought_days.groupby(timeutil.get_wateryear).sum() / 365
+        self.fractions = drought_days.groupby(
+            get_wateryears(drought_days.index)).sum() / 365
 
     def label_years(self):
         return self.fractions.map(
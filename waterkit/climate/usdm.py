@@ -2,6 +2,9 @@
 
 import pandas as pd
 
+from waterkit.tools.instrument import instrumented
+
+@instrumented()
 def read_usdm_download(csv_file, attribute="percentCurrent"):
     """Read a CSV file downloaded from
     http://droughtmonitor.unl.edu/MapsAndData/MapsandDataServices/StatisticalData/PercentofArea.aspx
@@ -5,6 +5,8 @@ import locale
 import json
 from urllib import urlencode, quote_plus, urlopen
 
+from waterkit.tools.instrument import instrumented
+
 def read_nass_data(url):
     locale.setlocale(locale.LC_NUMERIC, "")
 
@@ -57,6 +59,7 @@ class NASSDataSource(object):
         """
         self.apikey = apikey
 
+    @instrumented("usda_data.NASSDataSource.fetch")
     def fetch(self, params):
         """
         Fetch data with the given parameters.
@@ -1,41 +1,160 @@
+import json
+
 import numpy as np
 import pandas as pd
 
-from timeutil import get_wateryear
+from timeutil import get_calendar, get_wateryears
 
 from waterkit.tools import stats
+from waterkit.tools.instrument import instrumented
 
 CFS_TO_AFD = 1.9835
 
+class RasterTable(object):
+    """Dense table of daily values by year and day of year for one or more
+    attributes.
+
+    Parameters
+    ==========
+    values : ndarray
+        Array of shape (attributes, years, days).
+    present : ndarray
+        Boolean array of shape (years, days) marking cells that have a row in
+        the source data.
+    years : ndarray
+        Year label of each row.
+    days : ndarray
+        Day of year label of each column.
+    attributes : list
+        Attribute name of each layer.
+    """
+    def __init__(self, values, present, years, days, attributes):
+        self.values = values
+        self.present = present
+        self.years = years
+        self.days = days
+        self.attributes = list(attributes)
+        self._limits = {}
+
+    def __getitem__(self, attribute):
+        """Get the (years, days) array for an attribute."""
+        return self.values[self.attributes.index(attribute)]
+
+    def to_frame(self, attribute, ascending=True):
+        """Get an attribute as a DataFrame indexed by year with a column for
+        each day of the year that appears in the data.
+        """
+        columns = self.present.any(axis=0)
+        frame = pd.DataFrame(self[attribute][:, columns],
+            index=pd.Index(self.years, name='year'),
+            columns=pd.Index(self.days[columns], name='dayofyear'))
+        return frame.sort_index(ascending=ascending)
+
+    def to_dict(self):
+        """Get a dict of (years, days) arrays keyed by attribute."""
+        return dict(zip(self.attributes, self.values))
+
+    def _limit(self, attribute):
+        if attribute not in self._limits:
+            values = self[attribute]
+            finite = values[~np.isnan(values)]
+            if len(finite):
+                self._limits[attribute] = (finite.min(), finite.max())
+            else:
+                self._limits[attribute] = (np.nan, np.nan)
+        return self._limits[attribute]
+
+    def min(self, attribute):
+        """Get the minimum value of an attribute, ignoring missing values."""
+        return self._limit(attribute)[0]
+
+    def max(self, attribute):
+        """Get the maximum value of an attribute, ignoring missing values."""
+        return self._limit(attribute)[1]
+
+@instrumented()
+def create_raster(data, attributes, leap_days='keep'):
+    """
+    Build a RasterTable of one or more attributes by year and day of year.
+
+    Values are written directly into a preallocated array without copying or
+    pivoting the input.
+
+    Parameters
+    ==========
+    data : DataFrame
+        Daily values indexed by date.
+    attributes : string or list
+        Column or columns to include.
+    leap_days : string
+        How to place days around February 29. 'keep' uses the day of year,
+        so dates after February in leap years are one column to the right of
+        the same dates in other years. 'align' uses 366 columns on the leap
+        year calendar, so each date always falls in the same column and
+        February 29 is empty in other years. 'drop' removes February 29 and
+        uses 365 columns.
+    """
+    if isinstance(attributes, basestring):
+        attributes = [attributes]
+    calendar = get_calendar(data.index)
+    years, year_positions = calendar.factorize('year')
+    dayofyear = calendar.dayofyear.astype(np.intp)
+    leap = calendar.leap
+    if leap_days == 'keep':
+        n_days = 366
+        columns = dayofyear - 1
+        keep = None
+    elif leap_days == 'align':
+        n_days = 366
+        columns = calendar.aligned_dayofyear.astype(np.intp) - 1
+        keep = None
+    elif leap_days == 'drop':
+        n_days = 365
+        columns = dayofyear - 1 - (leap & (dayofyear > 60))
+        keep = ~(leap & (dayofyear == 60))
+        year_positions = year_positions[keep]
+        columns = columns[keep]
+    else:
+        raise ValueError("leap_days must be 'keep', 'align' or 'drop'")
+
+    values = np.empty((len(attributes), len(years), n_days))
+    values.fill(np.nan)
+    for i, attribute in enumerate(attributes):
+        column = np.asarray(data[attribute], dtype=float)
+        values[i, year_positions, columns] = \
+            column if keep is None else column[keep]
+    present = np.zeros((len(years), n_days), dtype=bool)
+    present[year_positions, columns] = True
+    return RasterTable(values, present, years.astype(int),
+        np.arange(1, n_days + 1), attributes)
+
 def create_raster_table(data, value, ascending = True):
     """
     Creates the raster table from the dataframe using
     year and day of year as indices and the specified
     value attribute as the value.
     """
-    pivot_frame = data.copy()
-    pivot_frame['year'] = pivot_frame.index.year
-    pivot_frame['dayofyear'] = pivot_frame.index.dayofyear
-    return pivot_frame.pivot(
-        index='year',
-        columns='dayofyear',
-        values = value
-    ).sort_index(ascending=ascending)
+    return create_raster(data, [value]).to_frame(value, ascending=ascending)
 
 def create_yearly_totals(data, attributes):
     """
     Sum yearly totals for a given set of attribute.
     """
-    sums = map(lambda a: create_raster_table(data, a).sum(axis = 1), attributes)
-    result = pd.concat(sums, axis = 1)
-    return result
+    raster = create_raster(data, attributes)
+    sums = np.where(np.isnan(raster.values), 0.0, raster.values).sum(axis=2)
+    return pd.DataFrame(sums.T, index=pd.Index(raster.years, name='year'))
 
+@instrumented()
 def monthly_deficit_pct(data, attribute):
     """Get a DataFrame containing the percentage of days in deficit."""
-    days_in_deficit = data[data[attribute] < 0][attribute].groupby(lambda x: x.month).count()
-    total_days = data[attribute].groupby(lambda x: x.month).count()
+    series = data[attribute]
+    months = get_calendar(data.index).month
+    deficit = np.asarray(series < 0)
+    days_in_deficit = series[deficit].groupby(months[deficit]).count()
+    total_days = series.groupby(months).count()
     return (days_in_deficit / total_days).dropna()
 
+@instrumented()
 def annual_deficit_pct(data, attribute=None):
     """Calculate the temporal deficit for all recorded years.
 
@@ -47,8 +166,9 @@ def annual_deficit_pct(data, attribute=None):
         If input data is a DataFrame, indicates the column to use.
     """
     series = data[attribute] if attribute else data
-    days_in_deficit = series[series < 0].groupby(get_wateryear).count()
-    total_days = series.groupby(get_wateryear).count();
+    deficit = series[series < 0]
+    days_in_deficit = deficit.groupby(get_wateryears(deficit.index)).count()
+    total_days = series.groupby(get_wateryears(series.index)).count()
     return days_in_deficit / total_days
 
 def compare_scenarios(data_i, data_f, attribute):
@@ -73,7 +193,8 @@ def compare_series(series, names=None):
         result.columns = names
     return result
 
-def integrate_monthly(series, dt=1.0):
+@instrumented()
+def integrate_monthly(series, dt=1.0, as_array=False):
     """
     Integrate an attribute on a monthly basis and return a pivoted DataFrame
     containing the integral value in a table by year and month.
@@ -84,19 +205,31 @@ def integrate_monthly(series, dt=1.0):
         Daily values indexed by measurement date
     dt : float
         Time delta for daily integration.
+    as_array : boolean
+        Return a tuple of a dense (years x 12) ndarray and an array of year
+        labels instead of a DataFrame. Year and month combinations without
+        any non-NaN values are NaN.
     """
-    # Get a DataFrame containing the integrated values multi-indexed
-    # by year and month.
-    year_month_multiindex = series.groupby(lambda x: x.year).apply(
-        lambda g: g.groupby(lambda x: x.month).sum()
-    ) * dt
-    # Pivot the resulting Series on the year/month multi-index to construct
-    # a DataFrame indexed by year and with a column for each month.
-    year_month_multiindex.index.names = ['year', 'month']
-    year_month_multiindex.name = "monthly"
-    return year_month_multiindex.reset_index().pivot(
-        index='year', columns='month', values="monthly")
+    years, cells = _year_month_cells(get_calendar(series.index))
+    n_cells = len(years) * 12
+    values = np.asarray(series, dtype=float)[np.newaxis, :]
+    missing = np.isnan(values)
+    sums = _group_sums(np.where(missing, 0.0, values),
+        cells, n_cells).reshape(len(years), 12) * dt
+    present = np.bincount(cells, minlength=n_cells).reshape(len(years), 12) > 0
+    # Like a groupby sum, months with only NaN values are NaN, not 0.
+    valid = np.bincount(cells, weights=(~missing[0]).astype(float),
+        minlength=n_cells).reshape(len(years), 12) > 0
+    table = np.where(valid, sums, np.nan)
+    if as_array:
+        return table, years
+    # Only include the months that appear in the data.
+    months = present.any(axis=0)
+    return pd.DataFrame(table[:, months],
+        index=pd.Index(years, name='year'),
+        columns=pd.Index(np.arange(1, 13)[months], name='month'))
 
+@instrumented()
 def integrate_annually(series, dt=1.0):
     """
     Integrate an attribute on an annual basis and return a Series containing
@@ -109,8 +242,9 @@ def integrate_annually(series, dt=1.0):
     dt :
         Time delta for daily integration.
     """
-    return series.groupby(get_wateryear).sum() * dt
+    return series.groupby(get_wateryears(series.index)).sum() * dt
 
+@instrumented()
 def monthly_volume_deficit(data, gap_attribute, unit_multiplier=1.0):
     """
     Returns a DataFrame indexed by year and with columns containing the
@@ -133,6 +267,7 @@ def monthly_volume_deficit(data, gap_attribute, unit_multiplier=1.0):
     return integrate_monthly(
         unit_multiplier * data[data[gap_attribute] < 0][gap_attribute])
 
+@instrumented()
 def monthly_volume_target(data, gap_attribute, target_attribute,
     unit_multiplier=1.0):
     """
@@ -154,6 +289,7 @@ def monthly_volume_target(data, gap_attribute, target_attribute,
     return integrate_monthly(
         unit_multiplier * data[data[gap_attribute] < 0][target_attribute])
 
+@instrumented()
 def annual_volume_deficit(data, gap_attribute, unit_multiplier=1.0):
     """
     Get a Series indexed by year containing the volume deficit measured over
@@ -171,6 +307,7 @@ def annual_volume_deficit(data, gap_attribute, unit_multiplier=1.0):
     return integrate_annually(
         unit_multiplier * data[data[gap_attribute] < 0][gap_attribute])
 
+@instrumented()
 def annual_volume_target(data, gap_attribute, target_attribute,
     unit_multiplier=1.0):
     """
@@ -191,6 +328,7 @@ def annual_volume_target(data, gap_attribute, target_attribute,
     return integrate_annually(
         unit_multiplier * data[data[gap_attribute] < 0][target_attribute])
 
+@instrumented()
 def monthly_volume_deficit_pct(data, gap_attribute, target_attribute,
     unit_multiplier=1.0):
     """
@@ -218,6 +356,7 @@ def monthly_volume_deficit_pct(data, gap_attribute, target_attribute,
         unit_multiplier=unit_multiplier)
     return deficit / target
 
+@instrumented()
 def annual_volume_deficit_pct(data, gap_attribute, target_attribute,
     unit_multiplier=1.0):
     """
@@ -244,10 +383,682 @@ def annual_volume_deficit_pct(data, gap_attribute, target_attribute,
         target_attribute, unit_multiplier=unit_multiplier)
     return deficit / target
 
-def delta_matrix(series):
-    """Compute a matrix of difference values between all items in a series"""
-    d = {i: series - series.loc[i] for i in series.index}
-    return pd.DataFrame.from_dict(d, orient='index')
+def _year_month_cells(calendar):
+    """Get the sorted years of a calendar and the dense (year, month) cell
+    position of each date, numbered year_position * 12 + month - 1.
+    """
+    years, year_positions = calendar.factorize('year')
+    cells = year_positions * 12 + (calendar.month.astype(np.intp) - 1)
+    return years.astype(int), cells
+
+def _group_sums(values, positions, n_groups):
+    """Sum each row of a 2-D array into groups.
+
+    Parameters
+    ==========
+    values : ndarray
+        Array of shape (rows, n) to sum.
+    positions : ndarray
+        Integer group of each of the n columns, between 0 and n_groups - 1.
+    n_groups : int
+        Number of groups.
+
+    Returns an array of shape (rows, n_groups).
+    """
+    rows = values.shape[0]
+    offsets = (np.arange(rows) * n_groups)[:, np.newaxis]
+    flat = (positions[np.newaxis, :] + offsets).ravel()
+    sums = np.bincount(flat, weights=values.ravel().astype(float),
+        minlength=rows * n_groups)
+    return sums.reshape(rows, n_groups)
+
+class _DeficitTotals(object):
+    """Deficit statistics for one or more gap series, totaled by year and
+    month in a single pass over the data.
+
+    Totals are stored per (calendar year, month) cell with shape
+    (series, years, 12). Water year totals are derived from the cells, since
+    a water year is a whole number of calendar months.
+
+    Parameters
+    ==========
+    gap : ndarray
+        Daily gap values of shape (series, days).
+    target : ndarray
+        Daily target values of shape (series, days).
+    calendar : CalendarIndex
+        Calendar codes for the days.
+    unit_multiplier : float
+        Multiplication factor to convert input units to acre-feet per day.
+    """
+    def __init__(self, gap, target, calendar, unit_multiplier=1.0):
+        years, cells = _year_month_cells(calendar)
+        n_cells = len(years) * 12
+        shape = (gap.shape[0], len(years), 12)
+        with np.errstate(invalid='ignore'):
+            deficit = gap < 0
+
+        self.years = years
+        self.present = np.bincount(
+            cells, minlength=n_cells).reshape(shape[1:]) > 0
+        self.days = _group_sums(~np.isnan(gap), cells, n_cells).reshape(shape)
+        self.deficit_days = _group_sums(
+            deficit, cells, n_cells).reshape(shape)
+        self.volume_deficit = unit_multiplier * _group_sums(
+            np.where(deficit, gap, 0.0), cells, n_cells).reshape(shape)
+        self.volume_target = unit_multiplier * _group_sums(
+            np.where(deficit & ~np.isnan(target), target, 0.0),
+            cells, n_cells).reshape(shape)
+        self._set_wateryears(calendar.wateryear_start_month)
+
+    @classmethod
+    def from_cells(cls, years, present, days, deficit_days, volume_deficit,
+        volume_target, wateryear_start_month):
+        """Create totals from arrays of cell values that have already been
+        accumulated, with the shapes of the attributes of the same name.
+        """
+        totals = cls.__new__(cls)
+        totals.years = years
+        totals.present = present
+        totals.days = days
+        totals.deficit_days = deficit_days
+        totals.volume_deficit = volume_deficit
+        totals.volume_target = volume_target
+        totals._set_wateryears(wateryear_start_month)
+        return totals
+
+    def _set_wateryears(self, start_month):
+        if start_month > 1:
+            offsets = (np.arange(1, 13) >= start_month).astype(int)
+        else:
+            offsets = np.zeros(12, dtype=int)
+        cell_wateryears = self.years[:, np.newaxis] + offsets
+        self.wateryears, self._cell_wateryears = np.unique(
+            cell_wateryears.ravel(), return_inverse=True)
+
+    def annual(self, cell_values):
+        """Total cell values of shape (series, years, 12) by water year."""
+        flat = cell_values.reshape(cell_values.shape[0], -1)
+        return _group_sums(flat, self._cell_wateryears, len(self.wateryears))
+
+    def monthly_table(self, cell_values, row):
+        """Build a DataFrame of cell values for one series, indexed by year
+        and with a column for each month, containing only the years and months
+        in which a deficit was recorded.
+        """
+        recorded = self.deficit_days[row] > 0
+        years = recorded.any(axis=1)
+        months = recorded.any(axis=0)
+        table = np.where(recorded, cell_values[row], np.nan)
+        return pd.DataFrame(table[years][:, months],
+            index=pd.Index(self.years[years], name='year'),
+            columns=pd.Index(np.arange(1, 13)[months], name='month'))
+
+    def annual_series(self, annual_values, row, name=None):
+        """Build a Series of water year values for one series, containing
+        only the years in which a deficit was recorded.
+        """
+        recorded = self.annual(self.deficit_days)[row] > 0
+        return pd.Series(annual_values[row][recorded],
+            index=self.wateryears[recorded], name=name)
+
+class SnapIndicators(object):
+    """Compute every SNAP deficit indicator for a flow record in one pass.
+
+    Each attribute holds the same result as the function of the same name in
+    this module:
+
+    - monthly_deficit_pct
+    - annual_deficit_pct
+    - monthly_volume_deficit
+    - monthly_volume_target
+    - monthly_volume_deficit_pct
+    - annual_volume_deficit
+    - annual_volume_target
+    - annual_volume_deficit_pct
+
+    Parameters
+    ==========
+    data : DataFrame
+        Water data containing both target and gap attributes.
+    gap_attribute: string
+        Name of the column containing the deficit values.
+    target_attribute : string
+        Name of the column containing the target values.
+    unit_multiplier : float
+        Multiplication factor to convert input units to acre-feet per day.
+        Applies to the volume indicators.
+    """
+    @instrumented("analysis.SnapIndicators", rows=None)
+    def __init__(self, data, gap_attribute, target_attribute,
+        unit_multiplier=1.0):
+        gap = np.asarray(data[gap_attribute], dtype=float)[np.newaxis, :]
+        target = np.asarray(data[target_attribute], dtype=float)[np.newaxis, :]
+        self._summarize(_DeficitTotals(gap, target, get_calendar(data.index),
+            unit_multiplier), gap_attribute, target_attribute)
+
+    @classmethod
+    def from_totals(cls, totals, gap_attribute, target_attribute):
+        """Create the indicators from the first series of a _DeficitTotals."""
+        indicators = cls.__new__(cls)
+        indicators._summarize(totals, gap_attribute, target_attribute)
+        return indicators
+
+    def _summarize(self, totals, gap_attribute, target_attribute):
+        month_deficit_days = totals.deficit_days[0].sum(axis=0)
+        month_days = totals.days[0].sum(axis=0)
+        recorded = month_deficit_days > 0
+        self.monthly_deficit_pct = pd.Series(
+            month_deficit_days[recorded] / month_days[recorded],
+            index=np.arange(1, 13)[recorded], name=gap_attribute)
+
+        annual_deficit_days = totals.annual(totals.deficit_days)[0]
+        annual_days = totals.annual(totals.days)[0]
+        present = totals.annual(totals.present[np.newaxis, :, :])[0] > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            annual_pct = np.where(annual_deficit_days > 0,
+                annual_deficit_days / annual_days, np.nan)
+        self.annual_deficit_pct = pd.Series(annual_pct[present],
+            index=totals.wateryears[present], name=gap_attribute)
+
+        self.monthly_volume_deficit = totals.monthly_table(
+            totals.volume_deficit, 0)
+        self.monthly_volume_target = totals.monthly_table(
+            totals.volume_target, 0)
+        self.monthly_volume_deficit_pct = \
+            self.monthly_volume_deficit.abs() / self.monthly_volume_target
+
+        self.annual_volume_deficit = totals.annual_series(
+            totals.annual(totals.volume_deficit), 0, gap_attribute)
+        self.annual_volume_target = totals.annual_series(
+            totals.annual(totals.volume_target), 0, target_attribute)
+        self.annual_volume_deficit_pct = \
+            self.annual_volume_deficit.abs() / self.annual_volume_target
+
+class DeficitAccumulator(object):
+    """Running deficit totals for a flow record that grows one batch of days
+    at a time.
+
+    Day counts and volume sums are kept per (calendar year, month) cell, the
+    same cells used by SnapIndicators, so appending new days only updates the
+    cells they fall in. The state can be saved as JSON and restored, so that
+    a long history is only read once.
+
+    Parameters
+    ==========
+    gap_attribute: string
+        Name of the column containing the deficit values.
+    target_attribute : string
+        Name of the column containing the target values.
+    unit_multiplier : float
+        Multiplication factor to convert input units to acre-feet per day.
+    wateryear_start_month : int
+        Month in which the water year begins.
+    """
+    FIELDS = ['present', 'days', 'deficit_days', 'volume_deficit',
+        'volume_target']
+
+    def __init__(self, gap_attribute, target_attribute, unit_multiplier=1.0,
+        wateryear_start_month=10):
+        self.gap_attribute = gap_attribute
+        self.target_attribute = target_attribute
+        self.unit_multiplier = unit_multiplier
+        self.wateryear_start_month = wateryear_start_month
+        self.first_year = None
+        self.last_date = None
+        self.cells = dict((field, np.zeros((0, 12))) for field in self.FIELDS)
+
+    @classmethod
+    def from_history(cls, data, gap_attribute, target_attribute,
+        unit_multiplier=1.0, wateryear_start_month=10):
+        """Create an accumulator seeded with a historical record."""
+        accumulator = cls(gap_attribute, target_attribute, unit_multiplier,
+            wateryear_start_month)
+        accumulator.update(data)
+        return accumulator
+
+    def _grow(self, last_year):
+        n_years = last_year - self.first_year + 1
+        missing = n_years - self.cells['days'].shape[0]
+        if missing > 0:
+            for field in self.FIELDS:
+                self.cells[field] = np.vstack(
+                    [self.cells[field], np.zeros((missing, 12))])
+
+    def update(self, data):
+        """Add new days of data to the totals.
+
+        The dates must be in increasing order and later than any date already
+        added. A ValueError is raised otherwise, since the days would be
+        counted twice.
+
+        Parameters
+        ==========
+        data : DataFrame
+            New days containing both the gap and target attributes.
+        """
+        if len(data) == 0:
+            return self
+        index = pd.DatetimeIndex(data.index)
+        if np.any(np.diff(index.asi8) <= 0):
+            raise ValueError("Dates must be unique and in increasing order")
+        if self.last_date is not None and index[0] <= self.last_date:
+            raise ValueError("Data from %s overlaps data already added up to %s"
+                % (index[0].date(), self.last_date.date()))
+
+        calendar = get_calendar(index, self.wateryear_start_month)
+        if self.first_year is None:
+            self.first_year = int(calendar.year[0])
+        self._grow(int(calendar.year[-1]))
+        cells = (calendar.year.astype(np.intp) - self.first_year) * 12 + \
+            (calendar.month.astype(np.intp) - 1)
+        first_cell = cells[0]
+        cells = cells - first_cell
+        n_cells = cells[-1] + 1
+
+        gap = np.asarray(data[self.gap_attribute], dtype=float)
+        target = np.asarray(data[self.target_attribute], dtype=float)
+        with np.errstate(invalid='ignore'):
+            deficit = gap < 0
+        sums = {
+            'present': np.ones(len(gap)),
+            'days': ~np.isnan(gap),
+            'deficit_days': deficit,
+            'volume_deficit': self.unit_multiplier * np.where(
+                deficit, gap, 0.0),
+            'volume_target': self.unit_multiplier * np.where(
+                deficit & ~np.isnan(target), target, 0.0),
+        }
+        for field in self.FIELDS:
+            flat = self.cells[field].reshape(-1)
+            flat[first_cell:first_cell + n_cells] += np.bincount(cells,
+                weights=sums[field].astype(float), minlength=n_cells)
+        self.last_date = index[-1]
+        return self
+
+    def totals(self):
+        """Get the accumulated totals as a _DeficitTotals."""
+        years = np.arange(self.cells['days'].shape[0])
+        if self.first_year is not None:
+            years = years + self.first_year
+        values = dict((field, self.cells[field][np.newaxis, :, :])
+            for field in self.FIELDS)
+        return _DeficitTotals.from_cells(years, self.cells['present'] > 0,
+            values['days'], values['deficit_days'], values['volume_deficit'],
+            values['volume_target'], self.wateryear_start_month)
+
+    def indicators(self):
+        """Get the SNAP indicators of all the data added so far."""
+        return SnapIndicators.from_totals(self.totals(), self.gap_attribute,
+            self.target_attribute)
+
+    def to_dict(self):
+        """Get the state of the accumulator as a JSON-serializable dict."""
+        state = {
+            'gap_attribute': self.gap_attribute,
+            'target_attribute': self.target_attribute,
+            'unit_multiplier': self.unit_multiplier,
+            'wateryear_start_month': self.wateryear_start_month,
+            'first_year': self.first_year,
+            'last_date': self.last_date.strftime("%Y-%m-%d")
+                if self.last_date is not None else None,
+        }
+        for field in self.FIELDS:
+            state[field] = self.cells[field].tolist()
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        """Restore an accumulator from the output of to_dict."""
+        accumulator = cls(state['gap_attribute'], state['target_attribute'],
+            state['unit_multiplier'], state['wateryear_start_month'])
+        accumulator.first_year = state['first_year']
+        if state['last_date'] is not None:
+            accumulator.last_date = pd.Timestamp(state['last_date'])
+        for field in cls.FIELDS:
+            accumulator.cells[field] = np.array(state[field],
+                dtype=float).reshape(-1, 12)
+        return accumulator
+
+    def save(self, path):
+        """Save the state of the accumulator to a JSON file."""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        """Load an accumulator saved with save."""
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+class ScenarioIndicators(object):
+    """Compute SNAP deficit indicators for many flow targets evaluated against
+    the same flow record.
+
+    The gap and target values of every scenario are totaled together as
+    arrays of shape (scenarios, days), so the cost of adding a scenario is a
+    row of array arithmetic rather than a separate pass over the record.
+    Results are DataFrames with a column, or an index level, named scenario.
+
+    Attributes
+    ==========
+    monthly_deficit_pct : DataFrame
+        Fraction of days in deficit by month, with a column for each scenario.
+    annual_deficit_pct : DataFrame
+        Fraction of days in deficit by water year, with a column for each
+        scenario. NaN for years in which a scenario recorded no deficit.
+    monthly_volume_deficit, monthly_volume_target,
+    monthly_volume_deficit_pct : DataFrame
+        Indexed by scenario and year with a column for each month, with the
+        same values as the function of the same name for each scenario.
+    annual_volume_deficit, annual_volume_target,
+    annual_volume_deficit_pct : DataFrame
+        Indexed by water year with a column for each scenario. NaN for years
+        in which a scenario recorded no deficit.
+
+    Parameters
+    ==========
+    gap : ndarray
+        Daily gap values of shape (scenarios, days).
+    target : ndarray
+        Daily target values of shape (scenarios, days).
+    index : DatetimeIndex
+        Dates of the days.
+    names : list
+        Name of each scenario. Defaults to its position.
+    unit_multiplier : float
+        Multiplication factor to convert input units to acre-feet per day.
+        Applies to the volume indicators.
+    """
+    @instrumented("analysis.ScenarioIndicators", rows=None)
+    def __init__(self, gap, target, index, names=None, unit_multiplier=1.0):
+        gap = np.atleast_2d(np.asarray(gap, dtype=float))
+        target = np.atleast_2d(np.asarray(target, dtype=float))
+        if names is None:
+            names = range(gap.shape[0])
+        if len(names) != gap.shape[0]:
+            raise ValueError("Expected %d scenario names, got %d" %
+                (gap.shape[0], len(names)))
+        self.names = pd.Index(list(names), name='scenario')
+        totals = _DeficitTotals(gap, target, get_calendar(index),
+            unit_multiplier)
+        self._totals = totals
+
+        month_deficit_days = totals.deficit_days.sum(axis=1)
+        month_days = totals.days.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            monthly_pct = np.where(month_deficit_days > 0,
+                month_deficit_days / month_days, np.nan)
+        months = (month_deficit_days > 0).any(axis=0)
+        self.monthly_deficit_pct = pd.DataFrame(monthly_pct[:, months].T,
+            index=pd.Index(np.arange(1, 13)[months], name='month'),
+            columns=self.names)
+
+        annual_deficit_days = totals.annual(totals.deficit_days)
+        annual_days = totals.annual(totals.days)
+        present = totals.annual(totals.present[np.newaxis, :, :])[0] > 0
+        recorded = annual_deficit_days > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            annual_pct = np.where(recorded,
+                annual_deficit_days / annual_days, np.nan)
+        self.annual_deficit_pct = self._annual_frame(annual_pct, present)
+
+        self.monthly_volume_deficit = self._monthly_frame(
+            totals.volume_deficit)
+        self.monthly_volume_target = self._monthly_frame(totals.volume_target)
+        self.monthly_volume_deficit_pct = \
+            self.monthly_volume_deficit.abs() / self.monthly_volume_target
+
+        years = recorded.any(axis=0)
+        self.annual_volume_deficit = self._annual_frame(np.where(recorded,
+            totals.annual(totals.volume_deficit), np.nan), years)
+        self.annual_volume_target = self._annual_frame(np.where(recorded,
+            totals.annual(totals.volume_target), np.nan), years)
+        self.annual_volume_deficit_pct = \
+            self.annual_volume_deficit.abs() / self.annual_volume_target
+
+    def _annual_frame(self, values, years):
+        return pd.DataFrame(values[:, years].T,
+            index=pd.Index(self._totals.wateryears[years], name='wateryear'),
+            columns=self.names)
+
+    def _monthly_frame(self, cell_values):
+        totals = self._totals
+        recorded = totals.deficit_days > 0
+        table = np.where(recorded, cell_values, np.nan)
+        months = recorded.any(axis=(0, 1))
+        rows = recorded.any(axis=2).ravel()
+        n_years = len(totals.years)
+        index = pd.MultiIndex.from_arrays([
+            self.names.take(np.repeat(np.arange(len(self.names)), n_years)),
+            np.tile(totals.years, len(self.names))],
+            names=['scenario', 'year'])
+        return pd.DataFrame(table.reshape(-1, 12)[rows][:, months],
+            index=index[rows],
+            columns=pd.Index(np.arange(1, 13)[months], name='month'))
+
+    def to_frame(self):
+        """Get the annual indicators as a tidy DataFrame indexed by scenario
+        and water year, with a column for each indicator. Only years in which
+        a scenario recorded a deficit are included.
+        """
+        columns = [
+            ('deficit_pct', self.annual_deficit_pct),
+            ('volume_deficit', self.annual_volume_deficit),
+            ('volume_target', self.annual_volume_target),
+            ('volume_deficit_pct', self.annual_volume_deficit_pct),
+        ]
+        stacked = []
+        for name, frame in columns:
+            s = frame.stack(dropna=False)
+            s.name = name
+            stacked.append(s)
+        result = pd.concat(stacked, axis=1)
+        result = result.reorder_levels(['scenario', 'wateryear']).sort_index()
+        return result[result['volume_deficit'].notnull()]
+
+@instrumented()
+def delta_matrix(series, condensed=False, dtype=None):
+    """Compute a matrix of difference values between all items in a series
+
+    Entry (i, j) holds series[j] - series[i].
+
+    Parameters
+    ==========
+    series : Series
+        The values to compare.
+    condensed : boolean
+        Return only the upper triangle (i < j) as a flat ndarray, ordered row
+        by row, instead of a DataFrame.
+    dtype : dtype
+        Data type of the result, e.g. numpy.float32 to halve memory use.
+    """
+    values = np.asarray(series, dtype=dtype if dtype else float)
+    if condensed:
+        n = len(values)
+        result = np.empty(n * (n - 1) // 2, dtype=values.dtype)
+        start = 0
+        for i in range(n - 1):
+            end = start + n - i - 1
+            np.subtract(values[i + 1:], values[i], out=result[start:end])
+            start = end
+        return result
+    return pd.DataFrame(values[np.newaxis, :] - values[:, np.newaxis],
+        index=series.index, columns=series.index)
+
+def delta_matrix_blocks(series, block_size=1024, dtype=None):
+    """Generate the delta matrix of a series in square tiles.
+
+    Yields (row_labels, column_labels, tile) tuples covering the full matrix,
+    where each tile is an ndarray of at most block_size x block_size entries
+    holding series[j] - series[i]. Only one tile is held in memory at a time.
+
+    Parameters
+    ==========
+    series : Series
+        The values to compare.
+    block_size : int
+        Maximum number of rows and columns per tile.
+    dtype : dtype
+        Data type of the tiles.
+    """
+    values = np.asarray(series, dtype=dtype if dtype else float)
+    labels = series.index
+    n = len(values)
+    for row in range(0, n, block_size):
+        rows = values[row:row + block_size]
+        for column in range(0, n, block_size):
+            columns = values[column:column + block_size]
+            yield (labels[row:row + block_size],
+                labels[column:column + block_size],
+                columns[np.newaxis, :] - rows[:, np.newaxis])
+
+# Default averaging windows, in days, for low flow statistics.
+LOW_FLOW_WINDOWS = (1, 3, 7, 30, 90)
+
+def rolling_means(values, windows=LOW_FLOW_WINDOWS):
+    """Compute trailing rolling means for several windows at once.
+
+    All windows are computed from a single cumulative sum. A window that is
+    incomplete at the start of the record or that contains a missing value
+    is NaN.
+
+    Parameters
+    ==========
+    values : ndarray
+        Daily values of shape (days,) or (days, series).
+    windows : sequence of int
+        Window lengths in days.
+
+    Returns an array of shape (len(windows),) + values.shape.
+    """
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    padding = np.zeros((1,) + values.shape[1:])
+    sums = np.concatenate(
+        [padding, np.cumsum(np.where(missing, 0.0, values), axis=0)])
+    gaps = np.concatenate([padding, np.cumsum(missing, axis=0)])
+    result = np.empty((len(windows),) + values.shape)
+    result.fill(np.nan)
+    for i, window in enumerate(windows):
+        if window > len(values):
+            continue
+        window_sums = sums[window:] - sums[:-window]
+        window_gaps = gaps[window:] - gaps[:-window]
+        result[i, window - 1:] = np.where(
+            window_gaps > 0, np.nan, window_sums / window)
+    return result
+
+@instrumented()
+def annual_low_flows(data, windows=LOW_FLOW_WINDOWS, year_start_month=10):
+    """Calculate the annual minimum of rolling mean flows for several windows.
+
+    Rolling windows run continuously across year boundaries and are assigned
+    to the year in which they end. Missing dates are treated as missing
+    values.
+
+    Parameters
+    ==========
+    data : Series or DataFrame
+        Daily flows indexed by date. A DataFrame holds one gage per column.
+    windows : sequence of int
+        Window lengths in days.
+    year_start_month : int
+        First month of the year used for grouping: 10 for water years or 1
+        for calendar years. Any month can be used, so 4 groups by climatic
+        year (April through March).
+
+    Returns a DataFrame indexed by year with a column per window for a Series,
+    or with (gage, window) columns for a DataFrame. As for water years, each
+    year is labeled by the calendar year in which it ends, so the climatic
+    year from April 1950 to March 1951 is labeled 1951, whereas USGS labels
+    it 1950 by the year in which it starts.
+    """
+    windows = list(windows)
+    daily = data.sort_index().asfreq('D')
+    values = np.asarray(daily, dtype=float)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    means = rolling_means(values, windows)
+
+    calendar = get_calendar(daily.index, year_start_month)
+    years, positions = calendar.factorize('wateryear')
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(positions)) + 1])
+    # Shape (windows, years, gages)
+    minima = np.fmin.reduceat(means, starts, axis=1)
+
+    index = pd.Index(years.astype(int), name='year')
+    if isinstance(data, pd.Series):
+        return pd.DataFrame(minima[:, :, 0].T, index=index, columns=windows)
+    columns = pd.MultiIndex.from_product([data.columns, windows])
+    return pd.DataFrame(
+        minima.transpose(1, 2, 0).reshape(len(years), -1),
+        index=index, columns=columns)
+
+def _normal_quantile(p):
+    """Approximate the standard normal quantile function.
+
+    Uses the rational approximation of Abramowitz and Stegun 26.2.23, with an
+    absolute error below 4.5e-4.
+    """
+    q = min(p, 1.0 - p)
+    t = np.sqrt(-2.0 * np.log(q))
+    z = t - (2.515517 + 0.802853 * t + 0.010328 * t ** 2) / \
+        (1.0 + 1.432788 * t + 0.189269 * t ** 2 + 0.001308 * t ** 3)
+    return -z if p < 0.5 else z
+
+def low_flow_frequency(minima, recurrence=10, method='lp3'):
+    """Estimate the annual low flow with a given recurrence interval.
+
+    Applied to annual 7-day minima with a recurrence of 10 years, this gives
+    the 7Q10 statistic.
+
+    Parameters
+    ==========
+    minima : Series, ndarray or DataFrame
+        Annual minimum flows. A DataFrame is evaluated column by column.
+    recurrence : number
+        Recurrence interval in years.
+    method : string
+        'lp3' fits a log-Pearson type III distribution using the Wilson-
+        Hilferty frequency factor, with a conditional probability adjustment
+        for years of zero flow. 'empirical' interpolates between Weibull
+        plotting positions.
+    """
+    if isinstance(minima, pd.DataFrame):
+        return minima.apply(
+            lambda column: low_flow_frequency(column, recurrence, method))
+    values = np.asarray(minima, dtype=float)
+    values = np.sort(values[~np.isnan(values)])
+    p = 1.0 / recurrence
+    if len(values) == 0:
+        return np.nan
+    if method == 'empirical':
+        positions = np.arange(1, len(values) + 1) / (len(values) + 1.0)
+        return np.interp(p, positions, values)
+    elif method != 'lp3':
+        raise ValueError("method must be 'lp3' or 'empirical'")
+
+    positive = values[values > 0]
+    zero_fraction = 1.0 - len(positive) / float(len(values))
+    if p <= zero_fraction:
+        return 0.0
+    p = (p - zero_fraction) / (1.0 - zero_fraction)
+    n = len(positive)
+    if n < 3:
+        return np.nan
+    logs = np.log10(positive)
+    mean = logs.mean()
+    std = logs.std(ddof=1)
+    if std == 0:
+        return 10 ** mean
+    skew = n * ((logs - mean) ** 3).sum() / ((n - 1) * (n - 2) * std ** 3)
+    z = _normal_quantile(p)
+    if abs(skew) < 1e-6:
+        k = z
+    else:
+        k = (2.0 / skew) * ((1.0 + skew * z / 6.0 - skew ** 2 / 36.0) ** 3 - 1.0)
+    return 10 ** (mean + k * std)
 
 def annual_minimum(series, period, by_wateryear=False):
     """Calculate the annual minimum of the rolling average
@@ -261,15 +1072,13 @@ def annual_minimum(series, period, by_wateryear=False):
     by_wateryear : boolean
         Compute the value by water year rather than by calendar year
     """
-    if by_wateryear:
-        group_f = lambda x: x.year if x.month < 10 else x.year + 1
-    else:
-        group_f = lambda x: x.year
-    return series.groupby(group_f).apply(pd.rolling_mean, period).groupby(group_f).min()
+    lowflows = annual_low_flows(series, [period],
+        year_start_month=10 if by_wateryear else 1)
+    return lowflows[period]
 
 def low_flow_trend_cfs_per_year(series, period, by_wateryear=False):
     """Calculate the low flow trend as a measure of cfs/year.
     """
-    lowflow = annual_minimum(series, period, by_wateryear)
+    lowflow = annual_minimum(series, period, by_wateryear).dropna()
     model = stats.OLSRegressionModel(lowflow)
     return model.slope
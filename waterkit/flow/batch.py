@@ -0,0 +1,324 @@
+"""
+Batch processing of flow gap indicators for many USGS gages.
+
+For each site, daily flow is read with rasterflow.read_usgs_data, gaps are
+computed against a flow target, and the SNAP deficit indicators are
+summarized by water year.
+
+Downloads run on a pool of threads in the parent process. Because of this,
+usgs_data.HOST_LIMITER bounds the requests of the whole run, and a single
+process owns the download cache. Only the computation and writing of each
+site's results is fanned out to a pool of worker processes.
+
+Each site's results are written to a columnar directory under the output
+directory (see waterkit.tools.columnar) containing the daily flow, target
+and gap values, with the annual indicators stored beside it. A site whose
+output already exists is skipped, so an interrupted run can be resumed by
+running the same command again. A failure at one site is recorded and does
+not stop the others.
+
+Example:
+
+    waterkit-batch --sites waterkit.flow.gallatin:USGS_SITES \\
+        --target "05-15/07-15=800,07-16/09-30=400" --season 05-15/09-30 \\
+        --start 1950-01-01 --end 2015-12-31 --output gallatin-gaps
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import traceback
+
+import pandas as pd
+
+import analysis
+import rasterflow
+import usgs_cache
+import usgs_data
+
+from waterkit.tools import columnar, parallel
+
+DAILY_DIR = "daily"
+ANNUAL_DIR = "annual"
+FAILURES_FILE = "failures.json"
+
+def parse_sites(spec):
+    """
+    Get a list of site ids from a specification, which is either a
+    module:attribute reference to a list such as
+    waterkit.flow.gallatin:USGS_SITES, the path of a file with one site id per
+    line, or a comma-separated list of site ids.
+    """
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            return [line.strip() for line in f
+                    if line.strip() and not line.startswith('#')]
+    elif ':' in spec:
+        module_name, attribute = spec.split(':', 1)
+        return list(getattr(importlib.import_module(module_name), attribute))
+    else:
+        return [site.strip() for site in spec.split(',') if site.strip()]
+
+def parse_target(spec):
+    """
+    Create a flow target from a specification. A number gives a
+    FlatFlowTarget. A comma-separated list of MM-DD/MM-DD=value intervals
+    gives a GradedFlowTarget. The path of a CSV file of dates and values gives
+    a SeriesFlowTarget.
+    """
+    try:
+        return rasterflow.FlatFlowTarget(float(spec))
+    except ValueError:
+        pass
+    if os.path.isfile(spec):
+        series = pd.read_csv(spec, index_col=0, parse_dates=True).iloc[:, 0]
+        return rasterflow.SeriesFlowTarget(series)
+    target = rasterflow.GradedFlowTarget()
+    for item in spec.split(','):
+        try:
+            interval, value = item.split('=')
+            begin, end = interval.split('/')
+            target.add((begin.strip(), end.strip()), float(value))
+        except ValueError:
+            raise ValueError("Invalid target interval: %s" % item)
+    return target
+
+def parse_season(spec):
+    """Get a (begin, end) season tuple from a MM-DD/MM-DD specification."""
+    if not spec:
+        return None
+    begin, end = spec.split('/')
+    return (begin.strip(), end.strip())
+
+def annual_indicators(data, parameter_name, unit_multiplier):
+    """
+    Summarize the SNAP deficit indicators of one site as a DataFrame indexed
+    by water year.
+    """
+    indicators = analysis.SnapIndicators(data, parameter_name + '-gap',
+        parameter_name + '-target', unit_multiplier)
+    result = pd.DataFrame({
+        'deficit_pct': indicators.annual_deficit_pct,
+        'volume_deficit': indicators.annual_volume_deficit,
+        'volume_target': indicators.annual_volume_target,
+        'volume_deficit_pct': indicators.annual_volume_deficit_pct,
+    }, columns=['deficit_pct', 'volume_deficit', 'volume_target',
+        'volume_deficit_pct'])
+    result.index.name = 'wateryear'
+    return result
+
+def site_path(output, site_id):
+    """Get the output directory of a site."""
+    return os.path.join(output, site_id)
+
+def _open_cache(cache):
+    if isinstance(cache, basestring):
+        return usgs_cache.GageDataCache(cache)
+    return cache
+
+def fetch_site(site_id, options, cache=None):
+    """
+    Download the daily values of a site, through a usgs_cache.GageDataCache
+    if one is given.
+    """
+    source = cache if cache else usgs_data
+    return source.get_gage_data(site_id, options['start'], options['end'],
+        parameter_code=options['parameter_code'],
+        parameter_name=options['parameter_name'])
+
+def evaluate_site(site_id, data, options):
+    """
+    Compute and write the results for a site from its downloaded daily
+    values. Returns None on success or a string describing the error.
+    """
+    path = site_path(options['output'], site_id)
+    tmp_path = path + ".partial"
+    try:
+        parameter_name = options['parameter_name']
+        if len(data) == 0:
+            raise ValueError("No data returned for site %s" % site_id)
+        data = rasterflow.calculate_gap_values(data, parameter_name,
+            options['target'], options['multiplier'])
+        if options['season']:
+            data = rasterflow.filter_season(data, options['season'])
+        annual = annual_indicators(data, parameter_name,
+            options['unit_multiplier'])
+
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        attrs = {
+            'site_id': site_id,
+            'start': options['start'],
+            'end': options['end'],
+        }
+        columnar.write_frame(os.path.join(tmp_path, DAILY_DIR), data, attrs)
+        columnar.write_frame(os.path.join(tmp_path, ANNUAL_DIR),
+            annual.reset_index(), attrs)
+        # The site directory appears only once all of its output is written.
+        os.rename(tmp_path, path)
+        return None
+    except Exception:
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return traceback.format_exc()
+
+def _evaluate_site(args):
+    site_id, data, error, options = args
+    if error is not None:
+        return site_id, error
+    return site_id, evaluate_site(site_id, data, options)
+
+def _fetch_sites(site_ids, options, cache, fetch_workers, retries, backoff):
+    """
+    Download sites on a pool of threads, a batch at a time, yielding an
+    evaluation task for each. A site that fails to download yields its
+    error instead of data.
+    """
+    def fetch(site_id):
+        try:
+            data = parallel.call_with_retry(fetch_site,
+                (site_id, options, cache), retries, backoff)
+            return site_id, data, None, options
+        except Exception:
+            return site_id, None, traceback.format_exc(), options
+    for i in range(0, len(site_ids), fetch_workers):
+        for task in parallel.map_concurrent(fetch,
+            site_ids[i:i + fetch_workers], max_workers=fetch_workers):
+            yield task
+
+def run(site_ids, options, workers=4, log=sys.stderr, fetch_workers=8,
+    retries=3, backoff=1.0):
+    """
+    Process sites, skipping sites that already have output. Returns a dict
+    of error descriptions keyed by the id of each site that failed.
+
+    Parameters
+    ----------
+    site_ids : list
+        The USGS site ids.
+    options : dict
+        Keyword options produced by main: output, start, end, target, season,
+        multiplier, unit_multiplier, parameter_code, parameter_name and cache.
+        The cache is the directory of a usgs_cache.GageDataCache, a cache
+        object, or None.
+    workers : int
+        Number of processes that evaluate and write results.
+    log : file
+        Stream for progress messages.
+    fetch_workers : int
+        Number of threads downloading in the parent process. Requests to
+        each host are further limited by usgs_data.HOST_LIMITER.
+    retries : int
+        Number of retries of a download that fails with a transient error.
+    backoff : float
+        Seconds to wait before the first retry, doubling on each retry.
+    """
+    output = options['output']
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    pending = [site for site in site_ids
+               if not os.path.isdir(site_path(output, site))]
+    skipped = len(site_ids) - len(pending)
+    if skipped:
+        log.write("Skipping %d sites with existing output\n" % skipped)
+
+    failures = {}
+    def record(site_id, error):
+        if error is None:
+            log.write("%s: done\n" % site_id)
+        else:
+            log.write("%s: failed\n%s\n" % (site_id, error))
+            failures[site_id] = error
+
+    cache = _open_cache(options['cache'])
+    # Workers do not download, so they do not need the cache.
+    worker_options = dict(options, cache=None)
+    tasks = _fetch_sites(pending, worker_options, cache, fetch_workers,
+        retries, backoff)
+    if workers > 1 and len(pending) > 1:
+        pool = multiprocessing.Pool(min(workers, len(pending)))
+        try:
+            for site_id, error in pool.imap_unordered(_evaluate_site, tasks):
+                record(site_id, error)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            record(*_evaluate_site(task))
+
+    with open(os.path.join(output, FAILURES_FILE), 'w') as f:
+        json.dump(failures, f, indent=2, sort_keys=True)
+    return failures
+
+def read_results(output, site_ids=None):
+    """
+    Read the annual indicators written by a batch run into a single
+    DataFrame indexed by site and water year.
+    """
+    if site_ids is None:
+        site_ids = sorted(name for name in os.listdir(output)
+            if os.path.isdir(os.path.join(output, name, ANNUAL_DIR)))
+    frames = []
+    for site_id in site_ids:
+        annual, attrs = columnar.read_frame(
+            os.path.join(site_path(output, site_id), ANNUAL_DIR))
+        annual['site'] = site_id
+        frames.append(annual.set_index(['site', 'wateryear']))
+    return pd.concat(frames)
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Compute flow gap indicators for many USGS gages.")
+    parser.add_argument("--sites", required=True,
+        help="Comma-separated site ids, a file of site ids, or a "
+             "module:attribute list such as waterkit.flow.gallatin:USGS_SITES")
+    parser.add_argument("--target", required=True,
+        help="Flat target value, MM-DD/MM-DD=value intervals, or a CSV file "
+             "of daily target values")
+    parser.add_argument("--start", required=True, help="Start date")
+    parser.add_argument("--end", required=True, help="End date")
+    parser.add_argument("--output", required=True, help="Output directory")
+    parser.add_argument("--season", help="Season to keep, as MM-DD/MM-DD")
+    parser.add_argument("--workers", type=int,
+        default=multiprocessing.cpu_count(),
+        help="Number of processes evaluating sites")
+    parser.add_argument("--fetch-workers", type=int, default=8,
+        help="Number of threads downloading sites")
+    parser.add_argument("--multiplier", type=float, default=1.0,
+        help="Multiplier applied to flow and target values")
+    parser.add_argument("--unit-multiplier", type=float,
+        default=analysis.CFS_TO_AFD,
+        help="Factor converting flow units to acre-feet per day")
+    parser.add_argument("--parameter-code",
+        default=rasterflow.usgs_data.FLOW_PARAMETER_CODE)
+    parser.add_argument("--parameter-name", default='flow')
+    parser.add_argument("--cache", help="Directory of a local download cache")
+    return parser
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    options = {
+        'output': args.output,
+        'start': args.start,
+        'end': args.end,
+        'target': parse_target(args.target),
+        'season': parse_season(args.season),
+        'multiplier': args.multiplier,
+        'unit_multiplier': args.unit_multiplier,
+        'parameter_code': args.parameter_code,
+        'parameter_name': args.parameter_name,
+        'cache': args.cache,
+    }
+    site_ids = parse_sites(args.sites)
+    failures = run(site_ids, options, workers=args.workers,
+        fetch_workers=args.fetch_workers)
+    sys.stderr.write("%d of %d sites failed\n" % (len(failures), len(site_ids)))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,34 +5,20 @@ import pandas as pd
 import numpy as np
 import networkx as nx
 
-from dbfread import DBF
+from waterkit.tools import dbf
+from waterkit.tools.instrument import instrumented
 
+@instrumented()
 def read_dbf(filename, columns = None):
     """
     Read a dBASE file with attributes into a pandas DataFrame.
-    """
-    """
-    dbf = ps.open(filename)
 
-    if not columns:
-        columns = dbf.header
-    data = {col: dbf.by_col(col) for col in columns}
-    return pd.DataFrame(data)
+    Only the given columns are decoded, straight into typed arrays. Use
+    waterkit.tools.dbf.iter_dbf to stream a large file in chunks.
     """
-    dbf = DBF(filename, load = True)
-    if not columns:
-        columns = dbf.field_names
-    records = {}
-    for record in dbf.records:
-        for key in record.keys():
-            if not records.has_key(key):
-                records[key] = [record[key]]
-            else:
-                records[key].append(record[key])
-    return pd.DataFrame(records)
-
-
+    return dbf.read_dbf(filename, columns)
 
+@instrumented()
 def subset_plusflow(plusflow, nhdplus_table):
     """
     Get a subset of the plusflow dataset using a given
@@ -41,7 +27,142 @@ def subset_plusflow(plusflow, nhdplus_table):
     return pd.merge(plusflow, nhdplus_table, how='inner',
                     left_on='FROMCOMID', right_on='FEATUREID')
 
-def create_connectivity_matrix(plusflow):
+class SparseConnectivity(object):
+    """Local connectivity of a flow network in compressed sparse row form.
+
+    The flowlines are numbered by their position in the sorted comids array.
+    The downstream neighbors of the flowline at position i are at positions
+    indices[indptr[i]:indptr[i + 1]].
+
+    Parameters
+    ----------
+    comids : ndarray
+        Sorted COMIDs of the flowlines.
+    indptr : ndarray
+        Row pointer of length len(comids) + 1.
+    indices : ndarray
+        Positions of the downstream flowlines of each row.
+    """
+    def __init__(self, comids, indptr, indices):
+        self.comids = np.asarray(comids)
+        self.indptr = np.asarray(indptr, dtype=np.intp)
+        self.indices = np.asarray(indices, dtype=np.intp)
+
+    @classmethod
+    def from_edges(cls, from_comids, to_comids, comids=None):
+        """
+        Create the connectivity from arrays of upstream and downstream COMIDs
+        of each edge. Duplicate edges are stored once.
+
+        Parameters
+        ----------
+        from_comids, to_comids : array-like
+            The COMIDs at each end of the edges.
+        comids : array-like
+            COMIDs to include even if they have no edges.
+        """
+        from_comids = np.asarray(from_comids)
+        to_comids = np.asarray(to_comids)
+        all_comids = np.union1d(from_comids, to_comids)
+        if comids is not None:
+            all_comids = np.union1d(all_comids, np.asarray(comids))
+        n = len(all_comids)
+        sources = np.searchsorted(all_comids, from_comids)
+        targets = np.searchsorted(all_comids, to_comids)
+        keys = np.unique(sources.astype(np.int64) * n + targets)
+        sources, targets = np.divmod(keys, n)
+        indptr = np.zeros(n + 1, dtype=np.intp)
+        np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+        return cls(all_comids, indptr, targets)
+
+    def __len__(self):
+        return len(self.comids)
+
+    @property
+    def nnz(self):
+        """Number of edges."""
+        return len(self.indices)
+
+    def positions(self, comids):
+        """Get the positions of COMIDs, raising a KeyError for unknown ones."""
+        comids = np.asarray(comids)
+        flat = np.atleast_1d(comids)
+        positions = np.searchsorted(self.comids, flat)
+        found = np.zeros(len(flat), dtype=bool)
+        inside = positions < len(self.comids)
+        found[inside] = self.comids[positions[inside]] == flat[inside]
+        if not found.all():
+            raise KeyError(flat[~found][0])
+        return positions.reshape(comids.shape)
+
+    def edges(self):
+        """Get the source and target positions of every edge."""
+        sources = np.repeat(np.arange(len(self.comids)), np.diff(self.indptr))
+        return sources, self.indices
+
+    def downstream_neighbors(self, comid):
+        """Get the COMIDs that a COMID flows into directly."""
+        position = self.positions(comid)
+        return self.comids[
+            self.indices[self.indptr[position]:self.indptr[position + 1]]]
+
+    def transpose(self):
+        """Get the connectivity with every edge reversed."""
+        sources, targets = self.edges()
+        order = np.lexsort((sources, targets))
+        indptr = np.zeros(len(self.comids) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(targets, minlength=len(self.comids)),
+            out=indptr[1:])
+        return SparseConnectivity(self.comids, indptr, sources[order])
+
+    def to_frame(self):
+        """
+        Get the dense connectivity matrix in the layout of
+        create_connectivity_matrix. Only practical for small networks.
+        """
+        n = len(self.comids)
+        matrix = np.zeros((n, n), dtype=int)
+        sources, targets = self.edges()
+        matrix[sources, targets] = 1
+        return pd.DataFrame(matrix,
+            index=pd.Index(self.comids, name='FROMCOMID'),
+            columns=pd.Index(self.comids, name='TOCOMID'))
+
+@instrumented()
+def create_sparse_connectivity(plusflow, drop_terminals=True):
+    """
+    Create a SparseConnectivity from the NHDPlusV2 PlusFlow dataset in a
+    single vectorized pass over the FROMCOMID and TOCOMID columns.
+
+    Parameters
+    ----------
+    plusflow : DataFrame
+        The PlusFlow table.
+    drop_terminals : bool
+        PlusFlow marks headwater and terminal flowlines with a FROMCOMID or
+        TOCOMID of 0. If True, those edges are dropped but the flowline is
+        kept, so that 0 does not join every headwater and outlet together.
+    """
+    from_comids = np.asarray(plusflow['FROMCOMID'])
+    to_comids = np.asarray(plusflow['TOCOMID'])
+    if drop_terminals:
+        from_comids, to_comids, comids = _drop_terminals(from_comids,
+            to_comids)
+        return SparseConnectivity.from_edges(from_comids, to_comids, comids)
+    return SparseConnectivity.from_edges(from_comids, to_comids)
+
+def _drop_terminals(from_comids, to_comids):
+    """
+    Remove the PlusFlow edges from or to COMID 0. Returns the remaining
+    edges and the COMIDs of all flowlines, including those whose only edges
+    were terminal.
+    """
+    terminal = (from_comids == 0) | (to_comids == 0)
+    comids = np.union1d(from_comids, to_comids)
+    return from_comids[~terminal], to_comids[~terminal], comids[comids != 0]
+
+@instrumented()
+def create_connectivity_matrix(plusflow, sparse=False, drop_terminals=True):
     """
     Create the connectivity matrix from the NHDPlusV2 PlusFlow dataset.
     In the resulting matrix, the rows will be the COMID (FEATUREID) of
@@ -49,67 +170,467 @@ def create_connectivity_matrix(plusflow):
     be the COMID (FEATUREID) of the Flowline feature water is flowing
     to. In the language of the PlusFlow dataset, the rows are the
     features in FROMCOMID and the columns are the features in TOCOMID.
+
+    If sparse is True, a SparseConnectivity is returned instead of a dense
+    DataFrame. See create_sparse_connectivity for drop_terminals.
+    """
+    if sparse:
+        return create_sparse_connectivity(plusflow, drop_terminals)
+    # Every feature appears as both a row and a column, sorted by COMID,
+    # with the number of edges between each pair.
+    from_comids = np.asarray(plusflow['FROMCOMID'])
+    to_comids = np.asarray(plusflow['TOCOMID'])
+    if drop_terminals:
+        from_comids, to_comids, featureids = _drop_terminals(from_comids,
+            to_comids)
+    else:
+        featureids = np.union1d(from_comids, to_comids)
+    n = len(featureids)
+    counts = np.bincount(
+        np.searchsorted(featureids, from_comids) * n +
+        np.searchsorted(featureids, to_comids), minlength=n * n)
+    return pd.DataFrame(counts.reshape(n, n),
+        index=pd.Index(featureids, name='FROMCOMID'),
+        columns=pd.Index(featureids, name='TOCOMID'))
+
+def _connectivity_edges(connectivity):
+    """
+    Get the sorted COMIDs of a connectivity matrix and its edges as arrays of
+    source and target positions in that order.
+    """
+    if isinstance(connectivity, SparseConnectivity):
+        sources, targets = connectivity.edges()
+        return connectivity.comids, sources, targets
+    # A COMID of 0 marks headwaters and outlets rather than a flowline.
+    rows, columns = np.nonzero(connectivity.values)
+    from_comids, to_comids, unused = _drop_terminals(
+        np.asarray(connectivity.index)[rows],
+        np.asarray(connectivity.columns)[columns])
+    comids = np.union1d(np.asarray(connectivity.index),
+        np.asarray(connectivity.columns))
+    comids = comids[comids != 0]
+    sources = np.searchsorted(comids, from_comids)
+    targets = np.searchsorted(comids, to_comids)
+    return comids, sources, targets
+
+def _compressed_rows(n, sources, targets):
+    """Get the CSR row pointer and column indices of a set of edges."""
+    order = np.argsort(sources, kind='mergesort')
+    indptr = np.zeros(n + 1, dtype=np.intp)
+    np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+    return indptr, np.asarray(targets, dtype=np.intp)[order]
+
+def _gather_rows(indptr, indices, rows):
+    """Get the concatenated column indices of a set of CSR rows."""
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+        counts)
+    return indices[np.repeat(starts, counts) + offsets]
+
+def _topological_levels(n, sources, targets):
+    """
+    Group the nodes of a directed graph into levels, such that the source of
+    every edge is in an earlier level than its target. Nodes are released
+    one level at a time, so the number of Python iterations is the length of
+    the longest path.
+
+    Raises a ValueError if the graph contains a cycle.
+    """
+    indptr, indices = _compressed_rows(n, sources, targets)
+    indegree = np.bincount(targets, minlength=n)
+    frontier = np.flatnonzero(indegree == 0)
+    levels = []
+    released = 0
+    while len(frontier):
+        levels.append(frontier)
+        released += len(frontier)
+        successors, counts = np.unique(
+            _gather_rows(indptr, indices, frontier), return_counts=True)
+        indegree[successors] -= counts
+        frontier = successors[indegree[successors] == 0]
+    if released < n:
+        raise ValueError("The flow network contains a cycle")
+    return levels
+
+def _topological_order(n, sources, targets):
+    """
+    Order the nodes of a directed graph so that the source of every edge comes
+    before its target.
+    """
+    levels = _topological_levels(n, sources, targets)
+    return np.concatenate(levels) if levels else np.array([], dtype=np.intp)
+
+def _edges_by_level(n, sources, targets):
+    """
+    Group the edges of a directed acyclic graph by the topological level of
+    their source. Returns a list with an array of edge indices for each
+    level, from the most upstream level down.
+    """
+    levels = _topological_levels(n, sources, targets)
+    source_level = np.empty(n, dtype=np.intp)
+    for i, level in enumerate(levels):
+        source_level[level] = i
+    edge_levels = source_level[sources]
+    order = np.argsort(edge_levels, kind='mergesort')
+    bounds = np.searchsorted(edge_levels[order], np.arange(len(levels) + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(len(levels))]
+
+def _bit_positions(bits):
+    """Get the positions of the set bits of an integer in increasing order."""
+    if not bits:
+        return np.array([], dtype=np.intp)
+    digits = np.frombuffer(bin(bits)[:1:-1].encode('ascii'), dtype=np.uint8)
+    return np.flatnonzero(digits == ord('1'))
+
+def _closure(n, order, sources, targets):
+    """
+    Get the set of nodes reachable from each node, including itself, as a
+    list of integer bitsets. Nodes are visited in reverse topological order,
+    so each set is the union of the sets of its successors.
     """
-    matrix = pd.crosstab(plusflow['FROMCOMID'], plusflow['TOCOMID'])
+    indptr, indices = _compressed_rows(n, sources, targets)
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+    reachable = [0] * n
+    for node in order[::-1].tolist():
+        bits = 1 << node
+        for successor in indices[indptr[node]:indptr[node + 1]]:
+            bits |= reachable[successor]
+        reachable[node] = bits
+    return reachable
 
-    # The load may not result in a square matrix. We complete it here.
-    rows = set(matrix.index)
-    columns = set(matrix.columns)
-    featureids = rows.union(columns)
+class Reachability(object):
+    """Transitive closure of a flow network.
 
-    # Add missing rows
-    for featureid in featureids.difference(rows):
-        matrix.loc[featureid,:] = 0
+    Stores for each COMID the set of COMIDs its water reaches as a bitset
+    over the positions of the sorted COMIDs, which takes far less memory
+    than a dense matrix for a river network. Every COMID reaches itself.
+    The reverse sets, of COMIDs upstream of each one, are built on first use.
 
-    # Sort the rows by name
-    matrix = matrix.reindex_axis(sorted(matrix.index))
+    Parameters
+    ----------
+    comids : ndarray
+        Sorted COMIDs of the network.
+    sources : ndarray
+        Position of the upstream COMID of each edge.
+    targets : ndarray
+        Position of the downstream COMID of each edge.
+    order : ndarray
+        Topological order of the positions, if already known.
+    """
+    def __init__(self, comids, sources, targets, order=None):
+        self.comids = np.asarray(comids)
+        self._sources = np.asarray(sources, dtype=np.intp)
+        self._targets = np.asarray(targets, dtype=np.intp)
+        if order is None:
+            order = _topological_order(len(self.comids), self._sources,
+                self._targets)
+        self._order = np.asarray(order, dtype=np.intp)
+        self._downstream = _closure(len(self.comids), self._order,
+            self._sources, self._targets)
+        self._upstream = None
+
+    def __len__(self):
+        return len(self.comids)
+
+    def _position(self, comid):
+        position = np.searchsorted(self.comids, comid)
+        if position >= len(self.comids) or self.comids[position] != comid:
+            raise KeyError(comid)
+        return position
+
+    def _upstream_sets(self):
+        if self._upstream is None:
+            self._upstream = _closure(len(self.comids), self._order[::-1],
+                self._targets, self._sources)
+        return self._upstream
 
-    # Add missing columns
-    for featureid in featureids.difference(columns):
-        matrix.loc[:,featureid] = 0
+    def is_connected(self, from_comid, to_comid):
+        """Check whether water flows from one COMID to another."""
+        return bool(self._downstream[self._position(from_comid)] >>
+            self._position(to_comid) & 1)
 
-    # Sort the columns by name.
-    matrix = matrix.reindex_axis(sorted(matrix.columns), axis = 1)
+    def downstream(self, comid):
+        """Get the sorted COMIDs reached by water from a COMID."""
+        return self.comids[_bit_positions(
+            self._downstream[self._position(comid)])]
 
-    return matrix
+    def upstream(self, comid):
+        """Get the sorted COMIDs whose water reaches a COMID."""
+        return self.comids[_bit_positions(
+            self._upstream_sets()[self._position(comid)])]
 
-def create_global_connectivity_matrix(connectivity):
+    def count(self):
+        """Get the number of connected pairs, including each COMID with
+        itself.
+        """
+        return sum(bin(bits).count('1') for bits in self._downstream)
+
+    def to_frame(self):
+        """
+        Get the closure as a dense DataFrame in the layout of
+        create_connectivity_matrix, with 1 where water flows from the row
+        COMID to the column COMID. Only practical for small networks.
+        """
+        n = len(self.comids)
+        matrix = np.zeros((n, n), dtype=int)
+        for row, bits in enumerate(self._downstream):
+            matrix[row, _bit_positions(bits)] = 1
+        return pd.DataFrame(matrix,
+            index=pd.Index(self.comids, name='FROMCOMID'),
+            columns=pd.Index(self.comids, name='TOCOMID'))
+
+@instrumented()
+def create_global_connectivity_matrix(connectivity, as_frame=True):
     """
     Create a matrix with global connectivity values given a local connectivity
     matrix. This will produce a connectivity matrix specifying if any path
     exists from one region to another, regardless of spatial adjacency.
-    """
-    # Global connectivity is the transitive closure of local connectivity.
-    g = np.copy(connectivity.as_matrix())
 
-    n = len(g)
-    for k in range(n):
-        for i in range(n):
-            for j in range(n):
-                g[i, j] = g[i, j] or \
-                    (g[i, k] and g[k, j])
+    The transitive closure is computed by visiting the network once in
+    topological order and combining the reachable sets of downstream
+    features, which requires the network to be acyclic.
 
-    # Every catchment is connected to itself.
-    for k in range(n): g[k, k]= 1
-
-    return pd.DataFrame(g, index = connectivity.index, columns = connectivity.columns)
+    Parameters
+    ----------
+    connectivity : DataFrame or SparseConnectivity
+        Local connectivity matrix from create_connectivity_matrix.
+    as_frame : bool
+        If True, return a dense DataFrame with a row and column for every
+        feature, which is only practical for small networks. Otherwise,
+        return a Reachability object.
+    """
+    reachability = Reachability(*_connectivity_edges(connectivity))
+    if as_frame:
+        return reachability.to_frame()
+    return reachability
 
-def read_global_connectivity(plusflow_dataset):
+@instrumented()
+def read_global_connectivity(plusflow_dataset, as_frame=True, cache=None):
     """
     Read a global connectivity matrix indicating if there is
     a path for water to flow from one region to another.
+    See create_global_connectivity_matrix for as_frame.
+
+    If cache is a nhdplus_cache.NetworkCache, the PlusFlow table, its
+    connectivity and topological order are read from it when possible.
     """
-    data = read_dbf(plusflow_dataset)
-    local = create_connectivity_matrix(data)
-    glbl = create_global_connectivity_matrix(local)
+    if cache is not None:
+        reachability = cache.reachability(plusflow_dataset)
+        return reachability.to_frame() if as_frame else reachability
+    data = read_dbf(plusflow_dataset, ['FROMCOMID', 'TOCOMID'])
+    local = create_connectivity_matrix(data, sparse=not as_frame)
+    glbl = create_global_connectivity_matrix(local, as_frame)
     return glbl
 
+class NetworkIndex(object):
+    """Index of a flow network for upstream and downstream queries.
+
+    Each flowline keeps one downstream edge, the first in COMID order, which
+    makes the network a forest draining to its outlets. The forest is
+    labeled with pre-order intervals: a flowline is upstream along the
+    forest of every flowline whose interval contains its label, and the
+    flowlines upstream of a flowline are a contiguous run of the pre-order.
+    For a network without divergences these labels answer is_upstream in
+    constant time and upstream_of in time proportional to the answer.
+
+    The other edges below divergences are stored separately. Queries follow
+    them only from the divergences they actually meet, and stop at
+    flowlines that come after the target in topological order. Storage is
+    linear in the number of flowlines and edges.
+
+    Parameters
+    ----------
+    comids : ndarray
+        Sorted COMIDs of the network.
+    sources : ndarray
+        Position of the upstream COMID of each edge.
+    targets : ndarray
+        Position of the downstream COMID of each edge.
+    order : ndarray
+        Topological order of the positions, if already known.
+    """
+    def __init__(self, comids, sources, targets, order=None):
+        self.comids = np.asarray(comids)
+        n = len(self.comids)
+        sources = np.asarray(sources, dtype=np.intp)
+        targets = np.asarray(targets, dtype=np.intp)
+        if order is None:
+            order = _topological_order(n, sources, targets)
+        self._rank = np.empty(n, dtype=np.intp)
+        self._rank[np.asarray(order, dtype=np.intp)] = np.arange(n)
+
+        # The first edge of each source is its edge in the forest.
+        edge_order = np.lexsort((targets, sources))
+        sources = sources[edge_order]
+        targets = targets[edge_order]
+        first = np.ones(len(sources), dtype=bool)
+        first[1:] = sources[1:] != sources[:-1]
+        tree_sources = sources[first]
+        tree_targets = targets[first]
+        self._parent = np.full(n, -1, dtype=np.intp)
+        self._parent[tree_sources] = tree_targets
+        self._extra_indptr, self._extra_indices = _compressed_rows(n,
+            sources[~first], targets[~first])
+        levels = _edges_by_level(n, tree_sources, tree_targets)
+        self._label_forest(n, tree_sources, tree_targets, levels)
+
+        # Nearest flowline with extra edges on the forest path downstream of
+        # each flowline, including itself.
+        diverges = np.diff(self._extra_indptr) > 0
+        self._next_divergence = np.where(diverges, np.arange(n), -1)
+        for edges in levels[::-1]:
+            children = tree_sources[edges]
+            self._next_divergence[children] = np.where(diverges[children],
+                children, self._next_divergence[tree_targets[edges]])
+
+        # Extra edges sorted by the pre-order label of their target, to find
+        # the ones entering a subtree.
+        extra_sources, extra_targets = sources[~first], targets[~first]
+        by_target = np.argsort(self._pre[extra_targets], kind='mergesort')
+        self._entering_pre = self._pre[extra_targets][by_target]
+        self._entering_sources = extra_sources[by_target]
+
+    def _label_forest(self, n, tree_sources, tree_targets, levels):
+        """Compute the subtree size and pre-order label of every flowline."""
+        self._size = np.ones(n, dtype=np.intp)
+        for edges in levels:
+            if len(edges):
+                parents, parent_positions = np.unique(tree_targets[edges],
+                    return_inverse=True)
+                self._size[parents] += np.bincount(parent_positions,
+                    weights=self._size[tree_sources[edges]]).astype(np.intp)
+
+        # Offset of each flowline from its parent: one plus the sizes of the
+        # siblings before it.
+        siblings = np.lexsort((tree_sources, tree_targets))
+        children = tree_sources[siblings]
+        preceding = np.cumsum(self._size[children]) - self._size[children]
+        group_start = np.ones(len(siblings), dtype=bool)
+        group_start[1:] = tree_targets[siblings][1:] != \
+            tree_targets[siblings][:-1]
+        starts = np.flatnonzero(group_start)
+        counts = np.diff(np.append(starts, len(siblings)))
+        offset = np.zeros(n, dtype=np.intp)
+        offset[children] = 1 + preceding - np.repeat(preceding[starts],
+            counts)
+
+        self._pre = np.zeros(n, dtype=np.intp)
+        roots = np.flatnonzero(self._parent < 0)
+        self._pre[roots] = np.cumsum(self._size[roots]) - self._size[roots]
+        for edges in levels[::-1]:
+            children = tree_sources[edges]
+            self._pre[children] = self._pre[tree_targets[edges]] + \
+                offset[children]
+        self._by_pre = np.empty(n, dtype=np.intp)
+        self._by_pre[self._pre] = np.arange(n)
+
+    def __len__(self):
+        return len(self.comids)
+
+    @property
+    def is_tree(self):
+        """True if no flowline has more than one downstream edge."""
+        return len(self._extra_indices) == 0
+
+    def _position(self, comid):
+        position = np.searchsorted(self.comids, comid)
+        if position >= len(self.comids) or self.comids[position] != comid:
+            raise KeyError(comid)
+        return int(position)
+
+    def _in_subtree(self, position, root):
+        start = self._pre[root]
+        return start <= self._pre[position] < start + self._size[root]
+
+    def is_upstream(self, from_comid, to_comid):
+        """Check whether water flows from one COMID to another. A COMID is
+        upstream of itself.
+        """
+        start = self._position(from_comid)
+        target = self._position(to_comid)
+        target_rank = self._rank[target]
+        stack = [start]
+        visited = set()
+        while stack:
+            position = stack.pop()
+            if self._in_subtree(position, target):
+                return True
+            # Follow the extra edges of the divergences on the forest path
+            # that are still above the target.
+            divergence = self._next_divergence[position]
+            while divergence >= 0 and divergence not in visited and \
+                self._rank[divergence] < target_rank:
+                visited.add(divergence)
+                for successor in self._extra_indices[
+                    self._extra_indptr[divergence]:
+                    self._extra_indptr[divergence + 1]]:
+                    if self._rank[successor] <= target_rank:
+                        stack.append(successor)
+                parent = self._parent[divergence]
+                divergence = self._next_divergence[parent] if parent >= 0 \
+                    else -1
+        return False
+
+    def upstream_of(self, comid):
+        """Get the sorted COMIDs whose water reaches a COMID, including
+        itself.
+        """
+        stack = [self._position(comid)]
+        visited = set()
+        runs = []
+        while stack:
+            root = stack.pop()
+            if root in visited:
+                continue
+            visited.add(root)
+            start = self._pre[root]
+            end = start + self._size[root]
+            runs.append(self._by_pre[start:end])
+            first, last = np.searchsorted(self._entering_pre, [start, end])
+            for source in self._entering_sources[first:last]:
+                if not self._in_subtree(source, root):
+                    stack.append(source)
+        return self.comids[np.unique(np.concatenate(runs))]
+
+    def downstream_path(self, comid):
+        """
+        Get the COMIDs from a COMID to its outlet, in downstream order.
+        Below a divergence the path follows the downstream COMID that sorts
+        first.
+        """
+        path = [self._position(comid)]
+        while self._parent[path[-1]] >= 0:
+            path.append(self._parent[path[-1]])
+        return self.comids[np.asarray(path, dtype=np.intp)]
+
+@instrumented(rows=len)
+def create_network_index(connectivity):
+    """
+    Create a NetworkIndex from a local connectivity matrix, either a
+    DataFrame or a SparseConnectivity.
+    """
+    return NetworkIndex(*_connectivity_edges(connectivity))
+
+@instrumented()
 def to_directed_acyclic_graph(connectivity):
     """
     Convert the connectivity matrix to a directed acyclic graph for
     visualization and analysis.
+
+    The nodes of a graph created from a dense matrix are numbered by
+    position. A SparseConnectivity is converted edge by edge without
+    creating a dense matrix, and its nodes are labeled by COMID.
     """
-    return nx.from_numpy_matrix(connectivity.as_matrix(), nx.DiGraph())
+    if isinstance(connectivity, SparseConnectivity):
+        g = nx.DiGraph()
+        g.add_nodes_from(connectivity.comids.tolist())
+        sources, targets = connectivity.edges()
+        g.add_edges_from(zip(connectivity.comids[sources].tolist(),
+            connectivity.comids[targets].tolist()))
+        return g
+    return nx.from_numpy_matrix(connectivity.values, nx.DiGraph())
 
 def tree_layout(g):
     """Create a layout that positions the nodes of g in a tree"""
@@ -129,9 +650,14 @@ def calculate_drainage_area(featureid, catchments, global_connectivity):
     catchments: DataFrame
         The table of catchments from the NHD+V2 catchment dataset
     global_connectivity:
-        The global (transitively closed) connectivity matrix
+        The global (transitively closed) connectivity matrix, or a
+        Reachability object.
     """
     area_attr = "AreaSqKM" # Name of the catchment area attribute in NHD+V2
+    if isinstance(global_connectivity, Reachability):
+        upstream = catchments['FEATUREID'].isin(
+            global_connectivity.upstream(featureid))
+        return catchments.loc[upstream, area_attr].sum()
     conn_column = global_connectivity[featureid]
     has_connections = pd.DataFrame(conn_column[conn_column == 1])
 
@@ -140,6 +666,7 @@ def calculate_drainage_area(featureid, catchments, global_connectivity):
                     left_index=True, right_on='FEATUREID')
     return join[area_attr].sum()
 
+@instrumented()
 def calculate_drainage_areas(catchments, global_connectivity):
     """Calculate the drainage areas for all catchments.
 
@@ -151,8 +678,11 @@ def calculate_drainage_areas(catchments, global_connectivity):
     ----------
     catchments: DataFrame
         The table of catchments to calculate drainage area.
-    global_connectivity: DataFrame
+    global_connectivity: DataFrame or Reachability
         The connectivity matrix (transitive closure)
+
+    This evaluates each catchment separately. For a whole network use
+    accumulate_drainage_areas, which visits each flowline once.
     """
     area = catchments.apply(
         lambda row: calculate_drainage_area(row['FEATUREID'], catchments, global_connectivity),
@@ -161,6 +691,71 @@ def calculate_drainage_areas(catchments, global_connectivity):
     result.columns=['FEATUREID', 'AreaSqKM']
     return result
 
+def _split_weights(sources, targets, n, comids, fractions):
+    """Get the fraction of the accumulated value of each edge source that is
+    passed to its target.
+    """
+    outdegree = np.bincount(sources, minlength=n)[sources]
+    if fractions is None:
+        return 1.0 / outdegree
+    elif isinstance(fractions, basestring):
+        if fractions == 'full':
+            return np.ones(len(sources))
+        raise ValueError("Unknown divergence fractions: %s" % fractions)
+    given = np.asarray(pd.Series(fractions).reindex(comids[targets]),
+        dtype=float)
+    shares = np.where(np.isnan(given), 1.0 / outdegree, given)
+    return np.where(outdegree > 1, shares, 1.0)
+
+@instrumented()
+def accumulate_drainage_areas(catchments, connectivity, fractions=None,
+    area_attribute="AreaSqKM"):
+    """Calculate the drainage area of every catchment in one pass over the
+    flow network.
+
+    Catchment areas are summed from upstream to downstream in topological
+    order, which takes time proportional to the number of flowlines and
+    edges. Returns a Series of drainage areas indexed by FEATUREID, in the
+    order of the catchments table.
+
+    Parameters
+    ----------
+    catchments : DataFrame
+        The table of catchments with FEATUREID and area columns.
+    connectivity : SparseConnectivity or DataFrame
+        The local (not transitively closed) connectivity of the network.
+    fractions : None, 'full' or Series
+        How the drainage area above a divergence is divided among the
+        flowlines below it. None divides it equally. 'full' passes the whole
+        area down every branch, which counts it more than once where the
+        branches rejoin. A Series indexed by COMID gives the fraction that
+        enters each flowline below a divergence, like the NHDPlus DivFrac
+        attribute; flowlines missing from it receive an equal share.
+    area_attribute : string
+        Name of the catchment area column.
+    """
+    network_comids, sources, targets = _connectivity_edges(connectivity)
+    featureids = np.asarray(catchments['FEATUREID'])
+    comids = np.union1d(network_comids, featureids)
+    n = len(comids)
+    sources = np.searchsorted(comids, network_comids[sources])
+    targets = np.searchsorted(comids, network_comids[targets])
+    positions = np.searchsorted(comids, featureids)
+    total = np.bincount(positions,
+        weights=np.asarray(catchments[area_attribute], dtype=float),
+        minlength=n)
+    weights = _split_weights(sources, targets, n, comids, fractions)
+
+    # Each level passes its finished totals downstream at once.
+    for edges in _edges_by_level(n, sources, targets):
+        if len(edges):
+            receivers, receiver_positions = np.unique(targets[edges],
+                return_inverse=True)
+            total[receivers] += np.bincount(receiver_positions,
+                weights=weights[edges] * total[sources[edges]])
+    return pd.Series(total[positions],
+        index=pd.Index(featureids, name='FEATUREID'), name=area_attribute)
+
 def to_excel(excel_file, dataframes, sheet_names=None):
     """Save a list of dataframes to an excel file, one per sheet"""
     writer = pd.ExcelWriter(excel_file)
@@ -0,0 +1,229 @@
+"""
+Persistent binary cache for NHDPlus tables and the network structures derived
+from them.
+
+Parsed DBF tables, the sparse connectivity and topological order of a
+PlusFlow network, and accumulated drainage areas are stored as columnar
+directories under the cache directory, so that a warm start loads NumPy
+arrays instead of parsing DBF files and rebuilding the network. Arrays can
+be memory-mapped instead of read.
+
+Each entry records the size and modification time of the source files it was
+built from, the waterkit version and the cache format. If any of them differ
+when the entry is read, it is rebuilt.
+
+The cache directory defaults to the WATERKIT_NHDPLUS_CACHE_DIR environment
+variable, or ~/.waterkit/nhdplus if that is not set.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+import nhdplus
+
+import waterkit
+
+from waterkit.tools import columnar
+from waterkit.tools.instrument import instrumented
+
+PLUSFLOW_COLUMNS = ['FROMCOMID', 'TOCOMID']
+CATCHMENT_COLUMNS = ['FEATUREID', 'AreaSqKM']
+
+# Version of the stored layout and of the code that builds the entries. Bump
+# it whenever either changes, so that entries written by older code are
+# rebuilt even if the waterkit version is unchanged.
+CACHE_FORMAT = 2
+
+def default_cache_directory():
+    """Get the default cache directory."""
+    return os.environ.get(
+        "WATERKIT_NHDPLUS_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".waterkit", "nhdplus"))
+
+def source_signature(filename):
+    """
+    Get the absolute path, size and modification time of a source file,
+    which together identify the version of the file a cache entry was
+    built from.
+    """
+    stat = os.stat(filename)
+    return {
+        "path": os.path.abspath(filename),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+
+class NetworkCache(object):
+    """On-disk cache of NHDPlus tables and derived network structures.
+
+    Parameters
+    ----------
+    directory : string
+        Directory in which to store cached entries. Created if missing.
+    mmap_mode : string
+        If given, memory-map cached arrays with this mode (see numpy.load)
+        instead of reading them into memory. Use 'r' to share large tables
+        between processes; the arrays are then read-only.
+    """
+    def __init__(self, directory=None, mmap_mode=None):
+        self.directory = directory if directory else default_cache_directory()
+        self.mmap_mode = mmap_mode
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _entry(self, kind, sources, **parameters):
+        """
+        Get the path of an entry and the attributes a valid entry must
+        have. The path depends only on the kind of entry, the source paths
+        and the parameters, so a rebuilt entry replaces the stale one.
+        """
+        signatures = [source_signature(source) for source in sources]
+        key = json.dumps({
+            "kind": kind,
+            "sources": [signature["path"] for signature in signatures],
+            "parameters": parameters,
+        }, sort_keys=True)
+        name = "%s_%s" % (kind, hashlib.sha1(key.encode('utf-8')).hexdigest())
+        attrs = {
+            "kind": kind,
+            "sources": signatures,
+            "parameters": parameters,
+            "version": waterkit.__version__,
+            "format": CACHE_FORMAT,
+        }
+        return os.path.join(self.directory, name), attrs
+
+    def _is_valid(self, path, attrs):
+        if not os.path.isfile(os.path.join(path, columnar.META_FILE)):
+            return False
+        try:
+            return columnar.read_attrs(path) == json.loads(json.dumps(attrs))
+        except ValueError:
+            return False
+
+    @instrumented()
+    def read_dbf(self, filename, columns=None):
+        """
+        Read a DBF table, parsing the file only if it has no valid entry.
+        Takes the same arguments as nhdplus.read_dbf.
+        """
+        path, attrs = self._entry("table", [filename],
+            columns=list(columns) if columns is not None else None)
+        if self._is_valid(path, attrs):
+            data, stored = columnar.read_frame(path, mmap_mode=self.mmap_mode)
+            return data
+        data = nhdplus.read_dbf(filename, columns)
+        columnar.write_frame(path, data, attrs)
+        return data
+
+    def _network(self, plusflow_dataset):
+        path, attrs = self._entry("network", [plusflow_dataset])
+        if self._is_valid(path, attrs):
+            arrays, stored = columnar.read_arrays(path, self.mmap_mode)
+            return arrays
+        plusflow = self.read_dbf(plusflow_dataset, PLUSFLOW_COLUMNS)
+        connectivity = nhdplus.create_sparse_connectivity(plusflow)
+        sources, targets = connectivity.edges()
+        arrays = {
+            "comids": connectivity.comids,
+            "indptr": connectivity.indptr,
+            "indices": connectivity.indices,
+            "order": nhdplus._topological_order(len(connectivity), sources,
+                targets),
+        }
+        columnar.write_arrays(path, arrays, attrs)
+        return arrays
+
+    @instrumented(rows=len)
+    def connectivity(self, plusflow_dataset):
+        """Get the SparseConnectivity of a PlusFlow DBF file."""
+        arrays = self._network(plusflow_dataset)
+        return nhdplus.SparseConnectivity(arrays["comids"], arrays["indptr"],
+            arrays["indices"])
+
+    @instrumented()
+    def topological_order(self, plusflow_dataset):
+        """
+        Get the COMIDs of a PlusFlow DBF file ordered so that every flowline
+        comes before the flowlines it flows into.
+        """
+        arrays = self._network(plusflow_dataset)
+        return np.asarray(arrays["comids"])[arrays["order"]]
+
+    @instrumented(rows=len)
+    def reachability(self, plusflow_dataset):
+        """
+        Get the Reachability of a PlusFlow DBF file. The closure itself is
+        not cached, but it is built from the cached connectivity and order.
+        """
+        arrays = self._network(plusflow_dataset)
+        connectivity = nhdplus.SparseConnectivity(arrays["comids"],
+            arrays["indptr"], arrays["indices"])
+        sources, targets = connectivity.edges()
+        return nhdplus.Reachability(connectivity.comids, sources, targets,
+            arrays["order"])
+
+    @instrumented(rows=len)
+    def network_index(self, plusflow_dataset):
+        """
+        Get the NetworkIndex of a PlusFlow DBF file, built from the cached
+        connectivity and order.
+        """
+        arrays = self._network(plusflow_dataset)
+        connectivity = nhdplus.SparseConnectivity(arrays["comids"],
+            arrays["indptr"], arrays["indices"])
+        sources, targets = connectivity.edges()
+        return nhdplus.NetworkIndex(connectivity.comids, sources, targets,
+            arrays["order"])
+
+    @instrumented()
+    def drainage_areas(self, catchment_dataset, plusflow_dataset,
+        fractions=None):
+        """
+        Get the drainage area of every catchment as a Series indexed by
+        FEATUREID, see nhdplus.accumulate_drainage_areas.
+
+        Parameters
+        ----------
+        catchment_dataset : string
+            Path of the catchment DBF file.
+        plusflow_dataset : string
+            Path of the PlusFlow DBF file.
+        fractions : None or 'full'
+            How drainage area is divided below a divergence. For fractions
+            given as a Series, call nhdplus.accumulate_drainage_areas with
+            the cached connectivity instead.
+        """
+        if not (fractions is None or isinstance(fractions, basestring)):
+            raise ValueError("Only None or 'full' fractions can be cached")
+        path, attrs = self._entry("areas",
+            [catchment_dataset, plusflow_dataset], fractions=fractions)
+        if self._is_valid(path, attrs):
+            data, stored = columnar.read_frame(path, mmap_mode=self.mmap_mode)
+            return data[CATCHMENT_COLUMNS[1]]
+        catchments = self.read_dbf(catchment_dataset, CATCHMENT_COLUMNS)
+        areas = nhdplus.accumulate_drainage_areas(catchments,
+            self.connectivity(plusflow_dataset), fractions)
+        columnar.write_frame(path, areas.to_frame(), attrs)
+        return areas
+
+    def entries(self):
+        """List the cached entries as (path, size) tuples."""
+        result = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(os.path.join(path, columnar.META_FILE)):
+                result.append((path, columnar.get_size(path)))
+        return result
+
+    def size(self):
+        """Get the total size of the cache in bytes."""
+        return sum(size for path, size in self.entries())
+
+    def clear(self):
+        """Remove all cached entries."""
+        for path, size in self.entries():
+            shutil.rmtree(path)
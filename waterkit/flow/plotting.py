@@ -15,6 +15,7 @@ import analysis
 import colormap
 
 from waterkit.tools import stats
+from waterkit.tools.instrument import instrumented
 
 def deficit_days_plot(data, gap_attribute, title, fig = None, ax = None):
     """
@@ -79,32 +80,39 @@ def volume_deficit_pct_annual(data, gap_attribute, target_attribute, title, fig=
         fig=fig, ax=ax)
     return ax
 
+@instrumented()
 def rasterplot(data, attribute, title=None, colormap=None, norm=None,
-                show_colorbar=False, vmin=None, vmax=None, fig=None, ax=None):
+                show_colorbar=False, vmin=None, vmax=None, fig=None, ax=None,
+                leap_days='keep', raster=None):
     """
     Create a raster plot of a given attribute with day of year on the
     x-axis and year on the y-axis.
+
+    A RasterTable from analysis.create_raster may be passed as raster to
+    reuse one built for several attributes, in which case data is unused.
     """
     if not ax:
         fig, ax = plt.subplots()
 
-    raster_table = analysis.create_raster_table(data, attribute, ascending = False)
+    if raster is None:
+        raster = analysis.create_raster(data, [attribute], leap_days=leap_days)
+    raster_table = raster.to_frame(attribute, ascending = False)
     extent = [
         raster_table.columns.min(),
         raster_table.columns.max(),
         raster_table.index.min(),
         raster_table.index.max()
     ]
-    min_value = data.min()[attribute]
-    max_value = data.max()[attribute]
+    min_value = raster.min(attribute)
+    max_value = raster.max(attribute)
 
     plot = ax.imshow(raster_table, interpolation = 'nearest', aspect='auto',
                       extent = extent, cmap=colormap, norm=norm,
                       vmin=vmin, vmax=vmax)
     if show_colorbar:
         extends = ["neither", "both", "min", "max"]
-        extend_min = vmin and vmin > data.min()[attribute]
-        extend_max = vmax and vmax < data.max()[attribute]
+        extend_min = vmin and vmin > min_value
+        extend_max = vmax and vmax < max_value
         if extend_min and extend_max:
             extend = 'both'
         elif extend_min:
@@ -164,22 +172,29 @@ def label_months(axes):
     axes.xaxis.set_minor_formatter(minor_formatter)
 
 def create_colormap(data, attribute, source_map,
-                    vmin=None, vmax=None, under=None, over=None):
+                    vmin=None, vmax=None, under=None, over=None, raster=None):
     """
     Create a colormap given a particular dataset. It
     will set the minimum value and maximum value to the dataset
     minimum and maximum and sets a zero point based on the
-    data.
+    data. If a RasterTable is passed as raster, its cached limits are used
+    instead of scanning data.
     """
-    min_value = vmin if vmin else data.min()[attribute]
-    max_value = vmax if vmax else data.max()[attribute]
+    if raster is not None:
+        data_min = raster.min(attribute)
+        data_max = raster.max(attribute)
+    else:
+        data_min = data[attribute].min()
+        data_max = data[attribute].max()
+    min_value = vmin if vmin else data_min
+    max_value = vmax if vmax else data_max
     size = max_value - min_value
     zero = abs(min_value) / size
     cmap = colormap.shiftedColorMap(source_map, midpoint = zero)
 
-    if min_value > data.min()[attribute]:
+    if min_value > data_min:
         cmap.set_under(under if under else cmap(0.0))
-    if max_value < data.max()[attribute]:
+    if max_value < data_max:
         cmap.set_over(over if over else cmap(1.0))
 
     return cmap
@@ -7,33 +7,48 @@ from matplotlib.colors import LinearSegmentedColormap
 from matplotlib.colors import LogNorm
 import matplotlib.cm
 import calendar
+import analysis
 import colormap
 import usgs_data
 
-from timeutil import get_wateryear
+from waterkit.tools import parallel
+from waterkit.tools.instrument import instrumented
+
+from timeutil import as_season, get_calendar
 
 WATER_RIGHT_BOUNDARIES = [pd.Timestamp("2000-05-15").dayofyear, pd.Timestamp('2000-07-15').dayofyear]
 
 CFS_DAY_TO_AF = 1.9835
 
 def add_time_attributes(data):
-    data["dayofyear"] = data.index.dayofyear
-    data["year"] = data.index.year
-    data["month"] = data.index.month
+    calendar = get_calendar(data.index)
+    data["dayofyear"] = calendar.dayofyear.astype(int)
+    data["year"] = calendar.year.astype(int)
+    data["month"] = calendar.month.astype(int)
 
-    data["wateryear"] = data.index.map(get_wateryear)
+    data["wateryear"] = calendar.wateryear.astype(int)
 
 class FlowTarget(object):
     def get_target_flow(self, day, default=np.nan):
         """Get the target flow on a given day of the year"""
         raise NotImplementedError
 
+    def get_target_flows(self, days, default=np.nan):
+        """Get the target flows for an array of days of the year.
+
+        Subclasses should override this with a vectorized lookup. The base
+        implementation calls get_target_flow once per day.
+        """
+        days = np.asarray(days)
+        values = [self.get_target_flow(day, default) for day in days.flat]
+        return np.array(values, dtype=float).reshape(days.shape)
+
     def as_daily_timeseries(self, begin, end, effective_date=None, term=None):
         """Get a daily timeseries of the target for the speficied dates"""
         raise NotImplementedError
 
     def __call__(self, day):
-        return self.get_target_flow(self, day)
+        return self.get_target_flow(day)
 
     def as_daily_timeseries_aligned(self, datetime_index, effective_date=None):
         """Get the flow target as a time series aligned with the given index.
@@ -55,12 +70,15 @@ class GradedFlowTarget(FlowTarget):
     def __init__(self, targets=[]):
         super(GradedFlowTarget, self).__init__()
         self.targets = []
+        self._compiled_targets = None
+        self._interval_index = None
+        self._lookup_table = None
         for target in targets:
             self.add(target[0], target[1])
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return other.__dict__ == self.__dict__
+            return other.targets == self.targets
         else:
             return False
 
@@ -99,6 +117,76 @@ class GradedFlowTarget(FlowTarget):
                 return value
         return default
 
+    def _compile(self):
+        """Compile the targets into a sorted interval index.
+
+        The index is a tuple (breaks, values, defined) describing disjoint
+        half-open intervals [breaks[i], breaks[i + 1]). Overlaps are resolved
+        so that the first matching target wins, as in get_target_flow. A
+        367-entry lookup table indexed by day of year is derived from the
+        interval index. Both are rebuilt only when the target list has
+        changed since the last compilation.
+        """
+        targets = tuple(self.targets)
+        if targets != self._compiled_targets:
+            breaks = sorted(set(
+                [interval[0] for interval, value in targets] +
+                [interval[1] + 1 for interval, value in targets]
+            ))
+            values = np.zeros(len(breaks))
+            defined = np.zeros(len(breaks), dtype=bool)
+            # The last break closes the final interval and is never defined.
+            for i, day in enumerate(breaks[:-1]):
+                for interval, value in targets:
+                    if interval[0] <= day and day <= interval[1]:
+                        values[i] = value
+                        defined[i] = True
+                        break
+            self._interval_index = (np.array(breaks), values, defined)
+            self._lookup_table = self._search(np.arange(367))
+            # Mark the compilation complete last so that concurrent readers
+            # never see a partially built index.
+            self._compiled_targets = targets
+        return self._interval_index
+
+    def _search(self, days):
+        """Search the interval index for each of the given days.
+
+        Returns a tuple of target values and a mask indicating which days are
+        covered by a target.
+        """
+        breaks, values, defined = self._interval_index
+        days = np.asarray(days)
+        if len(breaks) == 0:
+            return np.zeros(days.shape), np.zeros(days.shape, dtype=bool)
+        position = np.searchsorted(breaks, days, side='right') - 1
+        inside = position >= 0
+        position = np.where(inside, position, 0)
+        return values.take(position), inside & defined.take(position)
+
+    def get_target_flows(self, days, default=np.nan):
+        """Return the target flows for an array of days of the year.
+
+        Parameters
+        ----------
+        days : array-like
+            Integer days of the year.
+        default : number
+            Value for days not covered by any target.
+        """
+        self._compile()
+        values, found = self._search(days)
+        return np.where(found, values, default)
+
+    def get_lookup_table(self, default=np.nan):
+        """Get an array of 367 target values indexed by day of year.
+
+        Days not covered by any target are assigned the default value.
+        """
+        self._compile()
+        values, found = self._lookup_table
+        return np.where(found, values, default)
+
     def __str__(self):
         return "GradedFlowTarget(" + str(self.targets) + ")"
 
@@ -120,16 +208,11 @@ class GradedFlowTarget(FlowTarget):
             if effective_date else pd.Timestamp(begin)
         end_timestamp = pd.Timestamp(effective_timestamp) + pd.Timedelta(days=term * 365) \
             if term else pd.Timestamp(end)
-        result = pd.Series(np.nan, date_range)
-        # It'd be nice to figure out how to verctorize this.
-        for index, value in result.iteritems():
-            if index < effective_timestamp:
-                result.loc[index] = 0.0
-            elif index > end_timestamp:
-                result.loc[index] = 0.0
-            else:
-                result.loc[index] = self.get_target_flow(index.dayofyear, 0.0)
-        return result
+        lookup = self.get_lookup_table(0.0)
+        values = lookup.take(np.asarray(date_range.dayofyear))
+        active = (date_range >= effective_timestamp) & \
+            (date_range <= end_timestamp)
+        return pd.Series(np.where(active, values, 0.0), date_range)
 
 class FlatFlowTarget(FlowTarget):
     """Single value flow target.
@@ -146,6 +229,9 @@ class FlatFlowTarget(FlowTarget):
     def get_target_flow(self, day, default=np.nan):
         return self.value
 
+    def get_target_flows(self, days, default=np.nan):
+        return np.full(np.shape(days), self.value, dtype=float)
+
     def as_daily_timeseries(self, begin, end, effective_date=None, term=None):
         if effective_date:
             if effective_date < begin or effective_date > end:
@@ -162,17 +248,79 @@ class FlatFlowTarget(FlowTarget):
         ])
 
 class SeriesFlowTarget(FlowTarget):
-    """Flow target given by a series."""
+    """Flow target given by a series.
+
+    Day-of-year statistics of the series are computed on first use and
+    cached. Assigning a new series discards the cache; modifying the series
+    in place does not.
+    """
     def __init__(self, series):
         super(SeriesFlowTarget, self).__init__()
         self.series = series
 
-    def get_target_flow(self, day, default=np.nan):
+    @property
+    def series(self):
+        return self._series
+
+    @series.setter
+    def series(self, series):
+        self._series = series
+        self._climatology = {}
+
+    def climatology(self, statistic='mean'):
+        """Get a day-of-year statistic of the series.
+
+        Returns an array of 367 values indexed by day of year. Days with no
+        data are NaN.
+
+        Parameters
+        ----------
+        statistic : string or number
+            Either 'mean' or a percentile between 0 and 100.
+        """
+        if statistic not in self._climatology:
+            values = np.asarray(self.series, dtype=float)
+            days = np.asarray(self.series.index.dayofyear)
+            if statistic == 'mean':
+                valid = ~np.isnan(values)
+                counts = np.bincount(days[valid], minlength=367)
+                sums = np.bincount(days[valid], weights=values[valid],
+                    minlength=367)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    table = sums / counts
+            else:
+                quantiles = pd.Series(values).groupby(days).quantile(
+                    statistic / 100.0)
+                table = np.asarray(quantiles.reindex(np.arange(367)),
+                    dtype=float)
+            self._climatology[statistic] = table
+        return self._climatology[statistic]
+
+    def get_target_flow(self, day, default=np.nan, statistic='mean'):
         """Since the series varies continuously, this method actually
         returns the mean daily flow. To get the full continuously
         varying flow, call as_daily_timeseries.
         """
-        return self.series[self.series.dayofyear == day].mean()
+        return self.get_target_flows(day, default, statistic)[()]
+
+    def get_target_flows(self, days, default=np.nan, statistic='mean'):
+        """Return the mean daily flow for an array of days of the year.
+
+        Parameters
+        ----------
+        days : array-like
+            Integer days of the year.
+        default : number
+            Value for days with no data.
+        statistic : string or number
+            Either 'mean' or a percentile between 0 and 100.
+        """
+        table = self.climatology(statistic)
+        days = np.asarray(days)
+        inside = (days >= 0) & (days < len(table))
+        values = table.take(np.where(inside, days, 0))
+        found = inside & ~np.isnan(values)
+        return np.where(found, values, default)
 
     def as_daily_timeseries(self, begin, end, effective_date=None, term=None):
         if effective_date:
@@ -193,19 +341,29 @@ def calculate_gap_values(data, parameter_column, target, multiplier):
     add_gap_attributes(data, parameter_column, target, multiplier)
     return data
 
+@instrumented()
 def filter_season(data, season):
-    begin = pd.Timestamp("2000-" + season[0]).dayofyear
-    end = pd.Timestamp("2000-" + season[1]).dayofyear
-    return data[(data.index.dayofyear > begin) & (data.index.dayofyear < end)]
+    """Select the rows of data within a season.
+
+    Parameters
+    ----------
+    season : Season or tuple
+        A timeutil.Season, or a (begin, end) tuple of "MM-DD" strings or
+        DayOfYear objects, which includes both boundary days.
+    """
+    return as_season(season).filter(data)
 
+@instrumented()
 def read_usgs_data(site_id, start_date, end_date,
     target=None, parameter_code=usgs_data.FLOW_PARAMETER_CODE,
-    parameter_name='flow', multiplier=1.0, season=None):
+    parameter_name='flow', multiplier=1.0, season=None, cache=None):
     """
     Read data for the given USGS site id from start_date to
-    end_date. Adds derived attributes for flow gap data.
+    end_date. Adds derived attributes for flow gap data. If a
+    usgs_cache.GageDataCache is given, data is read through it.
     """
-    data = usgs_data.get_gage_data(site_id, start_date, end_date,
+    source = cache if cache else usgs_data
+    data = source.get_gage_data(site_id, start_date, end_date,
         parameter_code=parameter_code, parameter_name=parameter_name)
     gap_data = calculate_gap_values(data, parameter_name, target, multiplier)
     if season:
@@ -240,6 +398,7 @@ def get_targets(target, row):
     else:
         return target
 
+@instrumented()
 def add_gap_attributes(data, attribute, target, multiplier):
     """
     Add attribute target information.
@@ -251,13 +410,120 @@ def add_gap_attributes(data, attribute, target, multiplier):
         data[attribute + '-gap'] = data[attribute] - data[target_col]
     return data
 
-def compare_sites(site_ids, start_date, end_date, attribute,
-                  names=None, flow_target=None):
-    datasets = map(lambda site: read_data(site, start_date, end_date, flow_target), site_ids)
-    columns = map(lambda d: d[attribute], datasets)
-    join = pd.concat(columns, axis=1)
+def target_matrix(index, targets, multiplier=1.0):
+    """
+    Get the daily values of several flow targets over a date index as an
+    array of shape (targets, days).
+
+    Graded targets are looked up together from a stacked table of their
+    day-of-year values, and flat targets are filled directly. Any other
+    target is aligned from its daily time series.
+
+    Parameters
+    ----------
+    index : DatetimeIndex
+        The dates at which to evaluate the targets.
+    targets : list
+        The FlowTarget objects.
+    multiplier : float
+        Multiplication factor applied to the target values.
+    """
+    dayofyear = get_calendar(index).dayofyear.astype(np.intp)
+    matrix = np.empty((len(targets), len(index)))
+    graded = [row for row, target in enumerate(targets)
+              if isinstance(target, GradedFlowTarget)]
+    if graded:
+        tables = np.vstack(
+            [targets[row].get_lookup_table(0.0) for row in graded])
+        matrix[graded] = tables[:, dayofyear]
+    for row, target in enumerate(targets):
+        if isinstance(target, GradedFlowTarget):
+            continue
+        elif isinstance(target, FlatFlowTarget):
+            matrix[row] = target.value
+        else:
+            matrix[row] = np.asarray(target.as_daily_timeseries_aligned(
+                index).reindex(index), dtype=float)
+    return multiplier * matrix
+
+@instrumented()
+def evaluate_targets(data, targets, attribute=None, names=None,
+    multiplier=1.0, unit_multiplier=1.0):
+    """
+    Evaluate many candidate flow targets against the same flow record.
+
+    Gaps for every target are computed at once from a (targets, days) matrix
+    and summarized as an analysis.ScenarioIndicators object, with one
+    scenario per target.
+
+    Parameters
+    ----------
+    data : Series or DataFrame
+        The flow record, indexed by date.
+    targets : list
+        The FlowTarget objects to evaluate.
+    attribute : string
+        If data is a DataFrame, the column containing the flow.
+    names : list
+        Scenario name for each target. Defaults to its position.
+    multiplier : float
+        Multiplication factor applied to the target values, as in
+        add_gap_attributes.
+    unit_multiplier : float
+        Multiplication factor to convert flow units to acre-feet per day for
+        the volume indicators.
+    """
+    series = data[attribute] if attribute is not None else data
+    flow = np.asarray(series, dtype=float)
+    target = target_matrix(series.index, targets, multiplier)
+    gap = flow[np.newaxis, :] - target
+    return analysis.ScenarioIndicators(gap, target, series.index, names,
+        unit_multiplier)
+
+@instrumented()
+def read_usgs_sites(site_ids, start_date, end_date,
+    target=None, parameter_code=usgs_data.FLOW_PARAMETER_CODE,
+    parameter_name='flow', multiplier=1.0, season=None, cache=None,
+    max_workers=8, retries=3, backoff=1.0):
+    """
+    Read data for several USGS sites concurrently. Takes the same arguments
+    as read_usgs_data and returns a dict of DataFrames keyed by site id.
+
+    Parameters
+    ----------
+    max_workers : int
+        Maximum number of sites to read at once. Requests to each host are
+        further limited by usgs_data.HOST_LIMITER.
+    retries : int
+        Number of times to retry a failed site.
+    backoff : float
+        Seconds to wait before the first retry, doubling on each retry.
+    """
+    def read(site_id):
+        return read_usgs_data(site_id, start_date, end_date,
+            target=target, parameter_code=parameter_code,
+            parameter_name=parameter_name, multiplier=multiplier,
+            season=season, cache=cache)
+    datasets = parallel.map_concurrent(read, site_ids,
+        max_workers=max_workers, retries=retries, backoff=backoff)
+    return dict(zip(site_ids, datasets))
+
+def align_sites(datasets, attribute, site_ids=None, names=None):
+    """
+    Join one attribute from a dict of site DataFrames into a single wide
+    DataFrame aligned on date, with one column per site.
+    """
+    if site_ids is None:
+        site_ids = sorted(datasets.keys())
+    join = pd.concat([datasets[site][attribute] for site in site_ids], axis=1)
     if names and len(names) == len(site_ids):
         join.columns = names
     else:
         join.columns = site_ids
     return join
+
+def compare_sites(site_ids, start_date, end_date, attribute,
+                  names=None, flow_target=None, max_workers=8):
+    datasets = read_usgs_sites(site_ids, start_date, end_date,
+        target=flow_target, max_workers=max_workers)
+    return align_sites(datasets, attribute, site_ids, names)
@@ -1,17 +1,144 @@
 """Tools for working with time"""
+import weakref
+
+import numpy as np
 import pandas as pd
 
+# Month in which the water year begins. Water years are labeled by the
+# calendar year in which they end.
+WATERYEAR_START_MONTH = 10
+
 def get_year(index):
     """Get the year from a Pandas date index"""
     return index.year
 
-def get_wateryear(index):
+def get_wateryear(index, start_month=WATERYEAR_START_MONTH):
     """Get the water year from a Pandas date index"""
-    if index.month >= 10:
+    if start_month > 1 and index.month >= start_month:
         return index.year + 1
     else:
         return index.year
 
+def _as_datetime_index(index):
+    """Convert an index of date-like values to a DatetimeIndex."""
+    if isinstance(index, pd.DatetimeIndex):
+        return index
+    return pd.DatetimeIndex(index)
+
+def get_wateryears(index, start_month=WATERYEAR_START_MONTH):
+    """Get an integer array of water years for every date in a DatetimeIndex.
+
+    This is the vectorized form of get_wateryear and is suitable for use as
+    a groupby key.
+
+    Parameters
+    ----------
+    index : DatetimeIndex
+        The dates to label.
+    start_month : int
+        Month in which the water year begins.
+    """
+    index = _as_datetime_index(index)
+    years = np.asarray(index.year)
+    if start_month > 1:
+        return years + (np.asarray(index.month) >= start_month)
+    return years
+
+def is_leap_year(years):
+    """Test whether each of an array of years is a leap year."""
+    years = np.asarray(years)
+    return (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+
+class CalendarIndex(object):
+    """Compact integer calendar codes for every date in a DatetimeIndex.
+
+    Years and water years are stored as int16, months and days as int8, and
+    days of the year as int16. Use get_calendar to share one instance between
+    all functions working on the same index.
+
+    Parameters
+    ----------
+    index : DatetimeIndex
+        The dates to encode. Other indexes of date-like values are converted.
+    wateryear_start_month : int
+        Month in which the water year begins.
+    """
+    def __init__(self, index, wateryear_start_month=WATERYEAR_START_MONTH):
+        index = _as_datetime_index(index)
+        self.year = np.asarray(index.year, dtype=np.int16)
+        self.month = np.asarray(index.month, dtype=np.int8)
+        self.day = np.asarray(index.day, dtype=np.int8)
+        self.dayofyear = np.asarray(index.dayofyear, dtype=np.int16)
+        if wateryear_start_month > 1:
+            self.wateryear = self.year + \
+                (self.month >= wateryear_start_month).astype(np.int16)
+        else:
+            self.wateryear = self.year
+        self.wateryear_start_month = wateryear_start_month
+        self._factorized = {}
+        self._leap = None
+        self._aligned_dayofyear = None
+
+    def __len__(self):
+        return len(self.year)
+
+    @property
+    def leap(self):
+        """Boolean array marking dates in leap years."""
+        if self._leap is None:
+            self._leap = is_leap_year(self.year)
+        return self._leap
+
+    @property
+    def aligned_dayofyear(self):
+        """Day of year on the leap year calendar, from 1 to 366.
+
+        Each month and day falls on the same number in every year, so
+        February 29 is always 60 and March 1 is always 61.
+        """
+        if self._aligned_dayofyear is None:
+            self._aligned_dayofyear = self.dayofyear + \
+                (~self.leap & (self.dayofyear >= 60)).astype(np.int16)
+        return self._aligned_dayofyear
+
+    def factorize(self, name):
+        """Get the sorted unique values of a code array and the position of
+        each date among them, for use as dense group indices.
+
+        Parameters
+        ----------
+        name : string
+            One of 'year', 'month', 'day', 'dayofyear' or 'wateryear'.
+        """
+        if name not in self._factorized:
+            self._factorized[name] = np.unique(
+                getattr(self, name), return_inverse=True)
+        return self._factorized[name]
+
+# Calendars keyed by index identity. Entries hold a weak reference to their
+# index and are removed when the index is garbage collected.
+_CALENDAR_CACHE = {}
+
+def get_calendar(index, wateryear_start_month=WATERYEAR_START_MONTH):
+    """Get the CalendarIndex for a DatetimeIndex, computing it only once for
+    each index object.
+    """
+    key = (id(index), wateryear_start_month)
+    entry = _CALENDAR_CACHE.get(key)
+    if entry is not None and entry[0]() is index:
+        return entry[1]
+    calendar = CalendarIndex(index, wateryear_start_month)
+    def remove(ref, key=key):
+        current = _CALENDAR_CACHE.get(key)
+        if current is not None and current[0] is ref:
+            del _CALENDAR_CACHE[key]
+    try:
+        _CALENDAR_CACHE[key] = (weakref.ref(index, remove), calendar)
+    except TypeError:
+        # The index does not support weak references, so don't cache it.
+        pass
+    return calendar
+
 class DayOfYear(object):
     """Represents a day of the year as a month/day pair.
     """
@@ -22,6 +149,22 @@ class DayOfYear(object):
     def __str__(self):
         return "{:0>2}-{:0>2}".format(self.month, self.day)
 
+    def __eq__(self, other):
+        return isinstance(other, DayOfYear) and \
+            (self.month, self.day) == (other.month, other.day)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.month, self.day))
+
+    @staticmethod
+    def parse(text):
+        """Create a DayOfYear from a month-day string such as "05-15"."""
+        month, day = text.split("-")
+        return DayOfYear(int(month), int(day))
+
     def get_dayofyear(self, leap_year=False):
         """Get the number specifying on which day in the year this month/day
         occurs.
@@ -34,3 +177,66 @@ class DayOfYear(object):
             return pd.Timestamp(
                 "2001-{:}-{:}".format(self.month, self.day)
             ).dayofyear
+
+class Season(object):
+    """A span of days within the year, such as May 15 through September 30.
+
+    A season whose end comes before its begin wraps across the new year, so
+    Season("11-01", "03-31") covers November through March. Membership is
+    precomputed as a mask over the 366 days of the leap year calendar and
+    applied to an index with a single take.
+
+    Parameters
+    ----------
+    begin : DayOfYear or string
+        First day of the season, as a DayOfYear or a "MM-DD" string.
+    end : DayOfYear or string
+        Last day of the season.
+    inclusive : tuple of bool
+        Whether the begin and end days themselves are part of the season.
+    """
+    def __init__(self, begin, end, inclusive=(True, True)):
+        self.begin = begin if isinstance(begin, DayOfYear) \
+            else DayOfYear.parse(begin)
+        self.end = end if isinstance(end, DayOfYear) \
+            else DayOfYear.parse(end)
+        self.inclusive = tuple(inclusive)
+
+        begin_day = self.begin.get_dayofyear(leap_year=True)
+        end_day = self.end.get_dayofyear(leap_year=True)
+        days = np.arange(1, 367)
+        after_begin = days >= begin_day if self.inclusive[0] \
+            else days > begin_day
+        before_end = days <= end_day if self.inclusive[1] \
+            else days < end_day
+        if begin_day <= end_day:
+            in_season = after_begin & before_end
+        else:
+            in_season = after_begin | before_end
+        # Element 0 is unused so the mask can be indexed by day number.
+        self.mask = np.concatenate([[False], in_season])
+
+    def __str__(self):
+        return "Season(%s, %s)" % (self.begin, self.end)
+
+    def contains(self, index):
+        """Get a boolean array marking the dates of an index in the season."""
+        return self.mask.take(get_calendar(index).aligned_dayofyear)
+
+    def filter(self, data):
+        """Select the rows of date-indexed data that fall in the season."""
+        return data[self.contains(data.index)]
+
+    def length(self, leap_year=False):
+        """Get the number of days in the season in a leap or common year."""
+        if leap_year:
+            return int(self.mask.sum())
+        return int(self.mask.sum() - self.mask[60])
+
+def as_season(season):
+    """Convert a (begin, end) tuple of DayOfYear objects or "MM-DD" strings
+    to a Season. Seasons are returned unchanged.
+    """
+    if isinstance(season, Season):
+        return season
+    return Season(season[0], season[1])
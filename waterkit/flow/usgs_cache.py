@@ -0,0 +1,191 @@
+"""
+Persistent local cache for USGS daily value downloads.
+
+Each site and parameter code is stored as a columnar directory under the
+cache directory, along with the earliest date requested and the last date
+the web service has returned so far. Requests that extend beyond that range
+fetch only the missing head or tail and append it to the cached record.
+History is not published later, so dates before the start of a record are
+not fetched again, but dates that had not been published when they were
+requested are fetched again by later requests. When the total cache size
+exceeds a limit, the least recently used entries are removed.
+
+The cache directory defaults to the WATERKIT_CACHE_DIR environment variable,
+or ~/.waterkit/usgs if that is not set.
+"""
+import os
+import re
+import shutil
+import threading
+
+import pandas as pd
+
+import usgs_data
+
+from waterkit.tools import columnar
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+VALUE_COLUMN = "value"
+
+def default_cache_directory():
+    """Get the default cache directory."""
+    return os.environ.get(
+        "WATERKIT_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".waterkit", "usgs"))
+
+def _format_date(timestamp):
+    return timestamp.strftime("%Y-%m-%d")
+
+class GageDataCache(object):
+    """On-disk cache of USGS gage data keyed by site id and parameter code.
+
+    Parameters
+    ----------
+    directory : string
+        Directory in which to store cached records. Created if missing.
+    max_bytes : int
+        Size limit for the cache directory. Least recently used entries are
+        evicted once it is exceeded.
+    fetch : callable
+        Function with the signature of usgs_data.get_gage_data used to
+        download missing data. Replace this to read from a local file or a
+        test server.
+    """
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES,
+        fetch=usgs_data.get_gage_data):
+        self.directory = directory if directory else default_cache_directory()
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self._evict_lock = threading.Lock()
+        self._locks_lock = threading.Lock()
+        self._locks = {}
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _entry_path(self, site_id, parameter_code):
+        key = "%s_%s" % (site_id, parameter_code)
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", key))
+
+    def _entry_lock(self, path):
+        """Get the lock that guards reading, writing and removing an entry."""
+        with self._locks_lock:
+            if path not in self._locks:
+                self._locks[path] = threading.Lock()
+            return self._locks[path]
+
+    def _fetch(self, site_id, begin, end, parameter_code):
+        data = self.fetch(site_id, _format_date(begin), _format_date(end),
+            parameter_code=parameter_code, parameter_name=VALUE_COLUMN)
+        return data[[VALUE_COLUMN]]
+
+    def get_gage_data(self, site_id, start_date, end_date,
+        parameter_code=usgs_data.FLOW_PARAMETER_CODE, parameter_name='flow'):
+        """
+        Get USGS gage data, downloading only the dates that are not already
+        cached. Takes the same arguments as usgs_data.get_gage_data.
+        """
+        begin = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        one_day = pd.Timedelta(days=1)
+        path = self._entry_path(site_id, parameter_code)
+
+        with self._entry_lock(path):
+            # The recorded range starts at the earliest date requested, since
+            # history is not published later, and ends at the last date
+            # actually returned, so dates that were not yet published are
+            # fetched again.
+            if os.path.isdir(path):
+                data, attrs = columnar.read_frame(path)
+                fetched_begin = pd.Timestamp(attrs["begin"])
+                fetched_end = pd.Timestamp(attrs["end"])
+                pieces = [data]
+                if begin < fetched_begin:
+                    head = self._fetch(site_id, begin,
+                        fetched_begin - one_day, parameter_code)
+                    pieces.insert(0, head)
+                    fetched_begin = begin
+                if end > fetched_end:
+                    tail = self._fetch(
+                        site_id, fetched_end + one_day, end, parameter_code)
+                    if len(tail):
+                        pieces.append(tail)
+                        fetched_end = tail.index.max()
+                modified = len(pieces) > 1 or fetched_begin != \
+                    pd.Timestamp(attrs["begin"])
+                if modified:
+                    data = pd.concat(pieces)
+                    data = data[~data.index.duplicated()].sort_index()
+            else:
+                data = self._fetch(site_id, begin, end, parameter_code)
+                modified = len(data) > 0
+                if modified:
+                    fetched_begin, fetched_end = begin, data.index.max()
+
+            if modified:
+                columnar.write_frame(path, data, {
+                    "site_id": site_id,
+                    "parameter_code": parameter_code,
+                    "begin": _format_date(fetched_begin),
+                    "end": _format_date(fetched_end),
+                })
+                self.evict(keep=path)
+            elif os.path.isdir(path):
+                # Mark the entry as recently used.
+                os.utime(os.path.join(path, columnar.META_FILE), None)
+
+            result = data[begin:end].rename(
+                columns={VALUE_COLUMN: parameter_name})
+            result.index.name = 'date'
+            return result
+
+    def entries(self):
+        """List the cached entries as (path, size, last access) tuples."""
+        result = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            meta = os.path.join(path, columnar.META_FILE)
+            if not os.path.isfile(meta):
+                continue
+            try:
+                result.append(
+                    (path, columnar.get_size(path), os.path.getmtime(meta)))
+            except OSError:
+                # Renamed or removed by another thread while listing.
+                continue
+        return result
+
+    def size(self):
+        """Get the total size of the cache in bytes."""
+        return sum(size for path, size, used in self.entries())
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits within
+        max_bytes. The entry at path keep is never removed.
+        """
+        with self._evict_lock:
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum(size for path, size, used in entries)
+            for path, size, used in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                # Entries in use by another thread are skipped rather than
+                # waited for, since that thread may itself be evicting.
+                lock = self._entry_lock(path)
+                if not lock.acquire(False):
+                    continue
+                try:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                        total -= size
+                finally:
+                    lock.release()
+
+    def clear(self):
+        """Remove all cached entries."""
+        for path, size, used in self.entries():
+            with self._entry_lock(path):
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
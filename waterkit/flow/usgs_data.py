@@ -8,42 +8,217 @@ http://waterservices.usgs.gov/rest/DV-Test-Tool.html
 
 Choose the USGS RDB format as output.
 """
+import numpy as np
 import pandas as pd
 import datetime
+import re
 
-def format_url(site, from_str, to_str, parameter_code):
-    baseurl = "http://waterservices.usgs.gov/nwis/dv/?format=rdb&indent=on&sites=%s&startDT=%s&endDT=%s&statCd=00003&parameterCd=%s"
-    return baseurl  % (site, from_str, to_str, parameter_code)
+try:
+    from urllib2 import urlopen
+    from StringIO import StringIO
+except ImportError:
+    from urllib.request import urlopen
+    from io import StringIO
+
+from waterkit.tools import parallel
+from waterkit.tools.instrument import instrumented
+
+DV_SERVICE_URL = "http://waterservices.usgs.gov/nwis/dv/"
+
+def format_url(site, from_str, to_str, parameter_code, base_url=DV_SERVICE_URL):
+    query = "?format=rdb&indent=on&sites=%s&startDT=%s&endDT=%s&statCd=00003&parameterCd=%s"
+    return base_url + query % (site, from_str, to_str, parameter_code)
 
 def dateparse(s):
     return pd.datetime.strptime(s, "%Y-%m-%d")
 
 FLOW_PARAMETER_CODE = "00060"
 
+# Shared limit on concurrent requests to each web service host.
+HOST_LIMITER = parallel.HostLimiter(max_connections=4)
+
+# Columns in an RDB response that identify the site and time of a value.
+RDB_KEY_COLUMNS = ['agency_cd', 'site_no', 'datetime', 'tz_cd']
+
+def _open(filepath_or_buffer):
+    """Open a URL or file path for reading lines, or return a buffer as is."""
+    if not isinstance(filepath_or_buffer, basestring):
+        return filepath_or_buffer
+    if re.match(r"^\w+://", filepath_or_buffer):
+        return urlopen(filepath_or_buffer)
+    return open(filepath_or_buffer)
+
+def _value_column(header, parameter_code=None):
+    """Choose the value column of an RDB header, optionally by parameter code.
+    """
+    columns = [c for c in header
+               if c not in RDB_KEY_COLUMNS and not c.endswith('_cd')]
+    if parameter_code:
+        matches = [c for c in columns if '_%s' % parameter_code in c]
+        if matches:
+            columns = matches
+    if not columns:
+        raise ValueError("No value column found in RDB header: %s" % header)
+    return columns[0]
+
+def _date_format(sample):
+    """Get the strptime format for an RDB datetime value."""
+    if len(sample) == 10:
+        return "%Y-%m-%d"
+    elif len(sample) == 16:
+        return "%Y-%m-%d %H:%M"
+    return None
+
+def _parse_rdb_rows(header, rows, parameter_name, parameter_code, categorical):
+    """Parse a block of RDB data rows sharing a single header."""
+    table = pd.read_csv(StringIO("".join(rows)), sep="\t", header=None,
+        names=header, dtype=str, na_filter=False)
+    value_column = _value_column(header, parameter_code)
+    dates = table['datetime'].values
+    index = pd.DatetimeIndex(
+        pd.to_datetime(dates, format=_date_format(dates[0])), name='date')
+    raw = table[value_column].values
+    values = pd.to_numeric(table[value_column], errors='coerce').values
+    # Non-numeric values such as Ice, Eqp or Ssn take the place of the
+    # qualifier code, otherwise the *_cd column is used.
+    code_column = value_column + '_cd'
+    codes = table[code_column].values if code_column in table \
+        else np.repeat('', len(table))
+    qualifiers = np.where(np.isnan(values) & (raw != ''), raw, codes)
+    site = table['site_no'].values if 'site_no' in table \
+        else np.repeat('', len(table))
+    return pd.DataFrame({
+        'site_no': pd.Categorical(site) if categorical else site,
+        parameter_name: values,
+        parameter_name + '_cd':
+            pd.Categorical(qualifiers) if categorical else qualifiers,
+    }, index=index, columns=['site_no', parameter_name, parameter_name + '_cd'])
+
+def _iter_rdb(filepath_or_buffer, parameter_name, parameter_code, chunksize,
+    categorical):
+    handle = _open(filepath_or_buffer)
+    header = None
+    skip_type_line = False
+    rows = []
+    try:
+        for line in handle:
+            if isinstance(line, bytes) and not isinstance(line, str):
+                line = line.decode('utf-8')
+            if line.startswith('#'):
+                # A comment block starts the next site in a multi-site file.
+                if rows:
+                    yield _parse_rdb_rows(header, rows, parameter_name,
+                        parameter_code, categorical)
+                    rows = []
+                header = None
+            elif header is None:
+                header = line.rstrip('\r\n').split('\t')
+                skip_type_line = True
+            elif skip_type_line:
+                # The line after the header defines column widths and types,
+                # e.g. 5s 15s 20d 14n 10s.
+                skip_type_line = False
+            elif line.strip():
+                rows.append(line if line.endswith('\n') else line + '\n')
+                if chunksize and len(rows) >= chunksize:
+                    yield _parse_rdb_rows(header, rows, parameter_name,
+                        parameter_code, categorical)
+                    rows = []
+        if rows:
+            yield _parse_rdb_rows(header, rows, parameter_name,
+                parameter_code, categorical)
+    finally:
+        if handle is not filepath_or_buffer:
+            handle.close()
+
+def iter_rdb(filepath_or_buffer, parameter_name='flow', parameter_code=None,
+    chunksize=100000):
+    """
+    Stream an RDB response from a URL, file or buffer, chunk by chunk.
+
+    Yields DataFrames indexed by date with a site_no column, a value column
+    named by parameter_name and a categorical qualifier column named
+    parameter_name + '_cd'. Values that are not numeric (such as Ice or Eqp)
+    are NaN and their code is stored as the qualifier. A chunk never spans
+    more than one site.
+
+    Parameters
+    ==========
+    filepath_or_buffer : string or file-like
+        URL, file path, or open file containing RDB data.
+    parameter_name : string
+        Name of the value column in the result.
+    parameter_code : string
+        USGS parameter code of the value column to read. Defaults to the
+        first value column of each site.
+    chunksize : int
+        Maximum number of rows per chunk. If None, each site is one chunk.
+    """
+    return _iter_rdb(filepath_or_buffer, parameter_name, parameter_code,
+        chunksize, True)
+
+@instrumented()
+def read_rdb(filepath_or_buffer, parameter_name='flow', parameter_code=None,
+    qualifiers=False):
+    """
+    Read single-site values in the USGS RDB format from a URL, file or buffer.
+    Returns a DataFrame indexed by date with a column named by
+    parameter_name. If qualifiers is True, a categorical column of qualifier
+    codes named parameter_name + '_cd' is included.
+    """
+    chunks = list(_iter_rdb(filepath_or_buffer, parameter_name,
+        parameter_code, None, False))
+    columns = [parameter_name, parameter_name + '_cd'] if qualifiers \
+        else [parameter_name]
+    if not chunks:
+        return pd.DataFrame(columns=columns,
+            index=pd.DatetimeIndex([], name='date'))
+    data = pd.concat([chunk[columns] for chunk in chunks])
+    if qualifiers:
+        data[parameter_name + '_cd'] = data[parameter_name + '_cd'].astype(
+            'category')
+    return data
+
+def read_rdb_sites(filepath_or_buffer, parameter_name='flow',
+    parameter_code=None, qualifiers=False):
+    """
+    Read a multi-site RDB response. Returns a dict of DataFrames keyed by site
+    number, each in the form returned by read_rdb.
+    """
+    columns = [parameter_name, parameter_name + '_cd'] if qualifiers \
+        else [parameter_name]
+    pieces = {}
+    for chunk in _iter_rdb(filepath_or_buffer, parameter_name,
+        parameter_code, None, False):
+        pieces.setdefault(chunk['site_no'].iloc[0], []).append(chunk[columns])
+    result = {}
+    for site, chunks in pieces.items():
+        data = pd.concat(chunks)
+        if qualifiers:
+            data[parameter_name + '_cd'] = data[parameter_name + '_cd'].astype(
+                'category')
+        result[site] = data
+    return result
+
+@instrumented()
 def get_gage_data(site_id, start_date, end_date,
-    parameter_code=FLOW_PARAMETER_CODE, parameter_name='flow'):
+    parameter_code=FLOW_PARAMETER_CODE, parameter_name='flow',
+    base_url=DV_SERVICE_URL, qualifiers=False):
     """
     Download USGS flow data using waterservices.usgs.gov.
     site_id: The USGS gage ID
     start_date: The starting date for the data
     end_date: The end date for the data
+    base_url: The daily values service URL, which may be replaced to
+    point at a mirror or a local test server.
+    qualifiers: Include a categorical column of qualifier codes.
     Returns a Pandas time series with the data.
     """
     from_str = start_date.isoformat() if isinstance(start_date, datetime.date) else start_date
     to_str = end_date.isoformat() if isinstance(end_date, datetime.date) else end_date
-    url = format_url(site_id, from_str, to_str, parameter_code)
-    data = pd.read_csv(
-        url,
-        comment='#',
-        delimiter="\t",
-        usecols=[2, 3],
-        header=1,
-        parse_dates=["date"],
-        date_parser=dateparse,
-        index_col='date',
-        names=['date', parameter_name],
-        na_values='Ice')
-    return data
+    url = format_url(site_id, from_str, to_str, parameter_code, base_url)
+    with HOST_LIMITER.limit(url):
+        return read_rdb(url, parameter_name, parameter_code, qualifiers)
 
 def read_nws_predicted(filename):
     data = pd.read_excel(
@@ -0,0 +1,167 @@
+"""
+Simple columnar storage for DataFrames.
+
+A frame is stored as a directory containing one NumPy .npy file per column,
+one for the index, and a JSON file describing the layout. Numeric columns can
+be memory-mapped when read back. Arbitrary JSON-serializable attributes can be
+stored alongside the data. A set of named arrays of different lengths can be
+stored the same way with write_arrays.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+META_FILE = "_meta.json"
+
+def _save_array(path, values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        dtype = str(values.dtype)
+        values = values.view(np.int64)
+    else:
+        dtype = None
+    np.save(path, values, allow_pickle=True)
+    return dtype
+
+def _load_array(path, dtype, mmap_mode):
+    try:
+        values = np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+    except ValueError:
+        # Object arrays are pickled and cannot be memory-mapped.
+        values = np.load(path, allow_pickle=True)
+    if dtype:
+        values = values.view(dtype)
+    return values
+
+def _begin_write(path):
+    # Each write gets its own temporary directory next to the target, so
+    # concurrent writers never share one.
+    directory, name = os.path.split(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return tempfile.mkdtemp(prefix=name + ".tmp", dir=directory)
+
+def _finish_write(tmp_path, path, meta):
+    with open(os.path.join(tmp_path, META_FILE), "w") as f:
+        json.dump(meta, f)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+def write_frame(path, frame, attrs=None):
+    """Write a DataFrame to a columnar directory, replacing any existing one.
+
+    Parameters
+    ==========
+    path : string
+        The directory to write.
+    frame : DataFrame
+        The data to store.
+    attrs : dict
+        JSON-serializable attributes to store with the frame.
+    """
+    tmp_path = _begin_write(path)
+    meta = {
+        "index": {
+            "name": frame.index.name,
+            "dtype": _save_array(
+                os.path.join(tmp_path, "index.npy"), frame.index),
+        },
+        "columns": [],
+        "attrs": attrs or {},
+    }
+    for i, column in enumerate(frame.columns):
+        filename = "c%d.npy" % i
+        meta["columns"].append({
+            "name": column,
+            "file": filename,
+            "dtype": _save_array(
+                os.path.join(tmp_path, filename), frame[column]),
+        })
+    _finish_write(tmp_path, path, meta)
+
+def write_arrays(path, arrays, attrs=None):
+    """Write named arrays of any length to a columnar directory, replacing
+    any existing one.
+
+    Parameters
+    ==========
+    path : string
+        The directory to write.
+    arrays : dict
+        The arrays to store, by name.
+    attrs : dict
+        JSON-serializable attributes to store with the arrays.
+    """
+    tmp_path = _begin_write(path)
+    meta = {"arrays": [], "attrs": attrs or {}}
+    for i, name in enumerate(sorted(arrays)):
+        filename = "a%d.npy" % i
+        meta["arrays"].append({
+            "name": name,
+            "file": filename,
+            "dtype": _save_array(
+                os.path.join(tmp_path, filename), arrays[name]),
+        })
+    _finish_write(tmp_path, path, meta)
+
+def read_arrays(path, mmap_mode=None):
+    """Read named arrays written with write_arrays.
+
+    Returns a tuple of a dict of the arrays and the stored attributes.
+    See read_frame for mmap_mode.
+    """
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    arrays = dict(
+        (array["name"], _load_array(os.path.join(path, array["file"]),
+            array["dtype"], mmap_mode))
+        for array in meta["arrays"])
+    return arrays, meta["attrs"]
+
+def read_attrs(path):
+    """Read only the stored attributes of a columnar directory."""
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)["attrs"]
+
+def read_frame(path, columns=None, mmap_mode=None):
+    """Read a DataFrame from a columnar directory.
+
+    Returns a tuple of the DataFrame and its stored attributes.
+
+    Parameters
+    ==========
+    path : string
+        The directory to read.
+    columns : list
+        If given, only these columns are loaded.
+    mmap_mode : string
+        Memory-map numeric columns with the given mode (see numpy.load).
+    """
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    index_meta = meta["index"]
+    index = pd.Index(
+        _load_array(os.path.join(path, "index.npy"),
+            index_meta["dtype"], mmap_mode),
+        name=index_meta["name"])
+    data = {}
+    names = []
+    for column in meta["columns"]:
+        if columns is not None and column["name"] not in columns:
+            continue
+        names.append(column["name"])
+        data[column["name"]] = _load_array(
+            os.path.join(path, column["file"]), column["dtype"], mmap_mode)
+    return pd.DataFrame(data, index=index, columns=names), meta["attrs"]
+
+def get_size(path):
+    """Get the number of bytes used by a columnar directory."""
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+    )
@@ -0,0 +1,278 @@
+"""
+Fast reader for dBASE (.dbf) attribute tables such as those in NHDPlus.
+
+Records in a DBF file have a fixed width, so a block of records can be read
+in one call and viewed as a NumPy structured array that includes only the
+requested fields. Each field is then decoded as a whole column into a typed
+array: numbers to int64 or float64, dates to datetime64, logicals to
+objects of True, False or None, and text to strings.
+"""
+import datetime
+import struct
+
+import numpy as np
+import pandas as pd
+
+HEADER_FORMAT = "<BBBBIHH20x"
+FIELD_FORMAT = "<11sc4xBB14x"
+FIELD_TERMINATOR = b"\r"
+DELETED = b"*"
+
+DEFAULT_CHUNKSIZE = 100000
+
+class Field(object):
+    """A field descriptor of a DBF file.
+
+    Parameters
+    ----------
+    name : string
+        Field name.
+    type : string
+        dBASE type code: C, N, F, L, D, I or O.
+    length : int
+        Width of the field in bytes.
+    decimal_count : int
+        Number of decimal places of a numeric field.
+    offset : int
+        Position of the field within a record, after the deletion flag.
+    """
+    def __init__(self, name, type, length, decimal_count, offset):
+        self.name = name
+        self.type = type
+        self.length = length
+        self.decimal_count = decimal_count
+        self.offset = offset
+
+    def __repr__(self):
+        return "Field(%r, %r, %d, %d)" % (self.name, self.type, self.length,
+            self.decimal_count)
+
+class Header(object):
+    """The header of a DBF file.
+
+    Attributes
+    ----------
+    records : int
+        Number of records, including deleted ones.
+    header_length : int
+        Position of the first record in the file.
+    record_length : int
+        Width of each record in bytes.
+    fields : list
+        The Field descriptors.
+    """
+    def __init__(self, records, header_length, record_length, fields):
+        self.records = records
+        self.header_length = header_length
+        self.record_length = record_length
+        self.fields = fields
+
+    @property
+    def field_names(self):
+        return [field.name for field in self.fields]
+
+def read_header(f, encoding="latin-1"):
+    """Read the header of an open DBF file."""
+    f.seek(0)
+    (version, year, month, day, records, header_length,
+        record_length) = struct.unpack(HEADER_FORMAT,
+        f.read(struct.calcsize(HEADER_FORMAT)))
+    fields = []
+    # The deletion flag takes the first byte of every record.
+    offset = 1
+    while True:
+        descriptor = f.read(32)
+        if not descriptor or descriptor[:1] == FIELD_TERMINATOR:
+            break
+        name, type_code, length, decimal_count = struct.unpack(FIELD_FORMAT,
+            descriptor)
+        name = name.split(b"\0")[0].decode(encoding)
+        fields.append(Field(name, type_code.decode('ascii'), length,
+            decimal_count, offset))
+        offset += length
+    return Header(records, header_length, record_length, fields)
+
+def _record_dtype(header, fields):
+    """Get a structured dtype that views only the given fields of a record."""
+    return np.dtype({
+        'names': ['_deleted'] + [field.name for field in fields],
+        'formats': ['S1'] + [_raw_format(field) for field in fields],
+        'offsets': [0] + [field.offset for field in fields],
+        'itemsize': header.record_length,
+    })
+
+def _raw_format(field):
+    if field.type == 'I':
+        return '<i4'
+    elif field.type == 'O':
+        return '<f8'
+    return 'S%d' % field.length
+
+def _decode_numeric(raw, field):
+    text = np.char.strip(raw)
+    # Blank or overflowed (*****) values are missing.
+    missing = (text == b"") | (np.char.count(text, b"*") > 0)
+    if field.decimal_count == 0 and field.type == 'N' and not missing.any():
+        try:
+            return text.astype(np.int64)
+        except (ValueError, OverflowError):
+            pass
+    text = np.where(missing, b"nan", text)
+    return text.astype(np.float64)
+
+def _decode_date(raw):
+    text = np.char.strip(raw)
+    dates = pd.to_datetime(pd.Series(text).str.decode('ascii'),
+        format="%Y%m%d", errors='coerce')
+    return dates.values
+
+def _decode_logical(raw):
+    result = np.empty(len(raw), dtype=object)
+    result[:] = None
+    result[np.in1d(raw, [b"Y", b"y", b"T", b"t"])] = True
+    result[np.in1d(raw, [b"N", b"n", b"F", b"f"])] = False
+    return result
+
+def _decode(raw, field, encoding):
+    """Decode a column of raw field values into a typed array."""
+    if field.type in ('N', 'F'):
+        return _decode_numeric(raw, field)
+    elif field.type == 'D':
+        return _decode_date(raw)
+    elif field.type == 'L':
+        return _decode_logical(raw)
+    elif field.type in ('I', 'O'):
+        return raw.copy()
+    text = np.char.rstrip(raw, b" \0")
+    return np.char.decode(text, encoding).astype(object)
+
+def _select_fields(header, columns):
+    if columns is None:
+        return header.fields
+    by_name = dict((field.name, field) for field in header.fields)
+    missing = [name for name in columns if name not in by_name]
+    if missing:
+        raise KeyError("Fields not found in DBF file: %s" % ", ".join(missing))
+    return [by_name[name] for name in columns]
+
+def iter_dbf(filename, columns=None, chunksize=DEFAULT_CHUNKSIZE,
+    encoding="latin-1"):
+    """
+    Read a DBF file in chunks of records, yielding a DataFrame for each.
+    Deleted records are skipped.
+
+    Parameters
+    ----------
+    filename : string
+        Path of the DBF file.
+    columns : list
+        Names of the fields to read. Defaults to all fields.
+    chunksize : int
+        Number of records to read at a time.
+    encoding : string
+        Encoding of the text fields.
+    """
+    with open(filename, 'rb') as f:
+        header = read_header(f, encoding)
+        fields = _select_fields(header, columns)
+        dtype = _record_dtype(header, fields)
+        f.seek(header.header_length)
+        remaining = header.records
+        while remaining > 0:
+            count = min(chunksize, remaining)
+            block = f.read(count * header.record_length)
+            count = len(block) // header.record_length
+            if count == 0:
+                break
+            remaining -= count
+            records = np.frombuffer(block, dtype=dtype, count=count)
+            keep = records['_deleted'] != DELETED
+            if not keep.all():
+                records = records[keep]
+            yield pd.DataFrame(dict(
+                (field.name, _decode(records[field.name], field, encoding))
+                for field in fields), columns=[field.name for field in fields])
+
+def read_dbf(filename, columns=None, chunksize=DEFAULT_CHUNKSIZE,
+    encoding="latin-1"):
+    """
+    Read a DBF file into a DataFrame, decoding only the requested columns.
+    Takes the same arguments as iter_dbf.
+    """
+    chunks = list(iter_dbf(filename, columns, chunksize, encoding))
+    if not chunks:
+        with open(filename, 'rb') as f:
+            header = read_header(f, encoding)
+        names = [field.name for field in _select_fields(header, columns)]
+        return pd.DataFrame(columns=names)
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+def _field_for(name, values):
+    """Choose a DBF field descriptor for a column of values."""
+    kind = values.dtype.kind
+    if kind == 'b':
+        return Field(name, 'L', 1, 0, 0)
+    elif kind in 'iu':
+        width = max(len(str(values.min())), len(str(values.max()))) \
+            if len(values) else 1
+        return Field(name, 'N', width, 0, 0)
+    elif kind == 'f':
+        return Field(name, 'N', 19, 11, 0)
+    elif kind == 'M':
+        return Field(name, 'D', 8, 0, 0)
+    width = max([len(v) for v in values.astype(str)] + [1])
+    return Field(name, 'C', min(width, 254), 0, 0)
+
+def _encode(values, field, encoding):
+    if field.type == 'L':
+        return np.where(values, b"T", b"F").astype("S1")
+    elif field.type == 'D':
+        text = pd.DatetimeIndex(values).strftime("%Y%m%d")
+        return np.array([t.encode('ascii') for t in text], dtype="S8")
+    elif field.type == 'N' and field.decimal_count:
+        text = ["%*.*f" % (field.length, field.decimal_count, v)
+                for v in values]
+    elif field.type == 'N':
+        text = ["%*d" % (field.length, v) for v in values]
+    else:
+        text = [("%s" % v).ljust(field.length) for v in values]
+    return np.array([t.encode(encoding) for t in text],
+        dtype="S%d" % field.length)
+
+def write_dbf(filename, frame, encoding="latin-1"):
+    """
+    Write a DataFrame to a dBASE III file. Integer, float, boolean, date and
+    text columns are supported. Mainly useful for tests and benchmarks.
+    """
+    fields = [_field_for(str(name), np.asarray(frame[name]))
+              for name in frame.columns]
+    offset = 1
+    for field in fields:
+        field.offset = offset
+        offset += field.length
+    record_length = offset
+    header_length = 32 + 32 * len(fields) + 1
+    today = datetime.date.today()
+    records = np.zeros(len(frame), dtype=np.dtype({
+        'names': ['_deleted'] + [field.name for field in fields],
+        'formats': ['S1'] + ['S%d' % field.length for field in fields],
+        'offsets': [0] + [field.offset for field in fields],
+        'itemsize': record_length,
+    }))
+    records['_deleted'] = b" "
+    for field, name in zip(fields, frame.columns):
+        records[field.name] = _encode(np.asarray(frame[name]), field,
+            encoding)
+    with open(filename, 'wb') as f:
+        f.write(struct.pack(HEADER_FORMAT, 3, today.year - 1900, today.month,
+            today.day, len(frame), header_length, record_length))
+        for field in fields:
+            f.write(struct.pack(FIELD_FORMAT,
+                field.name.encode(encoding)[:10].ljust(11, b"\0"),
+                field.type.encode('ascii'), field.length,
+                field.decimal_count))
+        f.write(FIELD_TERMINATOR)
+        f.write(records.tobytes())
+        f.write(b"\x1a")
@@ -0,0 +1,310 @@
+"""
+Opt-in timing and memory instrumentation.
+
+Functions decorated with instrumented, and blocks wrapped in a span, record
+their wall time, the number of rows they return and optionally their peak
+memory, but only while instrumentation is enabled. When it is disabled a
+decorated function costs one extra global lookup per call.
+
+    from waterkit.tools import instrument
+
+    instrument.enable(memory=True)
+    data = rasterflow.read_usgs_data(...)
+    print(instrument.summary())
+    instrument.write_chrome_trace("trace.json")
+    instrument.disable()
+
+The Chrome trace can be opened in chrome://tracing or https://ui.perfetto.dev
+to see nested spans on a timeline.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import warnings
+
+import pandas as pd
+
+from timeit import default_timer as timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def max_rss():
+    """Get the peak resident set size of this process in bytes, or None if
+    it is not available on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def memory_method():
+    """
+    Get how memory peaks are measured: 'tracemalloc' for the peak allocated
+    by Python, 'max_rss' for the growth of the peak resident set size of the
+    process, which misses peaks below an earlier high-water mark, or None if
+    neither is available.
+    """
+    if tracemalloc is not None:
+        return 'tracemalloc'
+    elif resource is not None:
+        return 'max_rss'
+    return None
+
+class _NullSpan(object):
+    """Span returned while instrumentation is disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_rows(self, rows):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _Recorder(object):
+    """Collects finished spans."""
+    def __init__(self, memory):
+        self.memory = memory_method() if memory else None
+        if memory and self.memory is None:
+            warnings.warn("Memory cannot be measured on this platform, "
+                "recording time only")
+        self.start = timer()
+        self.events = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.started_tracing = False
+        if self.memory == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def close(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+
+_recorder = None
+
+# Spans recorded before the last call to disable.
+_disabled_events = []
+
+class Span(object):
+    """A timed block of code. Use span to create one.
+
+    Parameters
+    ----------
+    name : string
+        Name of the span in the summary and trace.
+    rows : int
+        Number of rows the block processed, if known in advance. It can also
+        be set with set_rows before the block ends.
+    """
+    def __init__(self, recorder, name, rows=None):
+        self.recorder = recorder
+        self.name = name
+        self.rows = rows
+        self.peak = 0
+
+    def set_rows(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        recorder = self.recorder
+        stack = recorder.stack()
+        if recorder.memory == 'max_rss':
+            self.base_memory = max_rss()
+        elif recorder.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # Resetting the peak would lose it for the enclosing spans, so
+            # pass it on to them first.
+            for parent in stack:
+                parent.peak = max(parent.peak, peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self.base_memory = current
+        stack.append(self)
+        self.begin = timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = timer()
+        recorder = self.recorder
+        stack = recorder.stack()
+        stack.pop()
+        peak_bytes = None
+        if recorder.memory == 'max_rss':
+            peak_bytes = max_rss() - self.base_memory
+        elif recorder.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peak_bytes = self.peak - self.base_memory
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        event = {
+            'name': self.name,
+            'start': self.begin - recorder.start,
+            'duration': end - self.begin,
+            'depth': len(stack),
+            'thread': threading.current_thread().ident,
+            'rows': self.rows,
+            'peak_bytes': peak_bytes,
+            'error': exc_info[0].__name__ if exc_info[0] else None,
+        }
+        with recorder.lock:
+            recorder.events.append(event)
+        return False
+
+def enable(memory=False):
+    """Start recording spans, discarding any recorded so far.
+
+    Parameters
+    ----------
+    memory : bool
+        Also record the peak memory allocated in each span with tracemalloc.
+        This slows down allocation-heavy code considerably. Peaks of nested
+        spans are exact only on Python versions with tracemalloc.reset_peak.
+        Without tracemalloc, as on Python 2, the growth of the process peak
+        resident set size is recorded instead, see memory_method.
+    """
+    global _recorder
+    disable()
+    del _disabled_events[:]
+    _recorder = _Recorder(memory)
+
+def disable():
+    """Stop recording spans. Recorded spans remain available until the next
+    call to enable or reset.
+    """
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _disabled_events[:] = _recorder.events
+    _recorder = None
+
+def is_enabled():
+    return _recorder is not None
+
+def reset():
+    """Discard all recorded spans."""
+    del _disabled_events[:]
+    if _recorder is not None:
+        with _recorder.lock:
+            del _recorder.events[:]
+
+def span(name, rows=None):
+    """Context manager that records a span if instrumentation is enabled.
+
+        with instrument.span("load basin") as s:
+            data = load()
+            s.set_rows(len(data))
+    """
+    if _recorder is None:
+        return _NULL_SPAN
+    return Span(_recorder, name, rows)
+
+def count_rows(value):
+    """Get the number of rows of a DataFrame, Series or array result, or None
+    for other values.
+    """
+    shape = getattr(value, 'shape', None)
+    if shape:
+        return int(shape[0])
+    return None
+
+def instrumented(name=None, rows=count_rows):
+    """Decorator that records a span for each call of a function while
+    instrumentation is enabled.
+
+    Parameters
+    ----------
+    name : string
+        Span name. Defaults to the module and function name.
+    rows : callable
+        Function of the return value giving the number of rows to record.
+    """
+    def decorate(function):
+        span_name = name or "%s.%s" % (
+            function.__module__.split('.')[-1], function.__name__)
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return function(*args, **kwargs)
+            with Span(recorder, span_name) as current:
+                result = function(*args, **kwargs)
+                current.set_rows(rows(result) if rows else None)
+            return result
+        return wrapper
+    return decorate
+
+def events():
+    """Get the recorded spans as a list of dicts in the order they ended.
+
+    Each has a name, a start time and duration in seconds, the nesting depth,
+    the thread id, the row count, the peak memory in bytes and the name of
+    the exception that ended the span, if any.
+    """
+    if _recorder is not None:
+        with _recorder.lock:
+            return list(_recorder.events)
+    return list(_disabled_events)
+
+def summary():
+    """Summarize the recorded spans as a DataFrame indexed by span name, with
+    the number of calls, total, mean and maximum time in seconds, total rows
+    and the largest memory peak in bytes, sorted by total time.
+    """
+    columns = ['name', 'duration', 'rows', 'peak_bytes']
+    table = pd.DataFrame(events(), columns=columns)
+    for column in ['rows', 'peak_bytes']:
+        table[column] = pd.to_numeric(table[column])
+    groups = table.groupby('name')
+    result = pd.DataFrame({
+        'calls': groups['duration'].count(),
+        'total': groups['duration'].sum(),
+        'mean': groups['duration'].mean(),
+        'max': groups['duration'].max(),
+        'rows': groups['rows'].sum(),
+        'peak_bytes': groups['peak_bytes'].max(),
+    }, columns=['calls', 'total', 'mean', 'max', 'rows', 'peak_bytes'])
+    return result.sort_values('total', ascending=False)
+
+def chrome_trace():
+    """Get the recorded spans in the Chrome trace event format."""
+    pid = os.getpid()
+    trace = []
+    for event in events():
+        args = dict((key, event[key]) for key in ['rows', 'peak_bytes', 'error']
+            if event[key] is not None)
+        trace.append({
+            'name': event['name'],
+            'cat': 'waterkit',
+            'ph': 'X',
+            'ts': event['start'] * 1e6,
+            'dur': event['duration'] * 1e6,
+            'pid': pid,
+            'tid': event['thread'],
+            'args': args,
+        })
+    return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+def write_chrome_trace(path):
+    """Write the recorded spans to a Chrome trace JSON file."""
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(), f)
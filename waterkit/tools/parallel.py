@@ -0,0 +1,134 @@
+"""Tools for running I/O bound work concurrently."""
+import errno
+import re
+import socket
+import threading
+import time
+
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urllib2 import HTTPError, URLError
+except ImportError:
+    from urllib.error import HTTPError, URLError
+
+def get_host(url):
+    """Get the host name from a URL, or the URL itself if it has none."""
+    match = re.match(r"^\w+://([^/:?#]+)", url)
+    return match.group(1) if match else url
+
+class HostLimiter(object):
+    """Limits the number of concurrent requests made to each host.
+
+    Parameters
+    ----------
+    max_connections : int
+        Maximum number of concurrent requests per host.
+    """
+    def __init__(self, max_connections=4):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(
+                    self.max_connections)
+            return self._semaphores[host]
+
+    @contextmanager
+    def limit(self, url):
+        """Context manager that holds one of the connection slots for the
+        host of the given URL.
+        """
+        semaphore = self._semaphore(get_host(url))
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+# Error numbers of socket errors that are local failures rather than network
+# ones. On Python 3 socket.error is OSError, so file errors are socket errors.
+LOCAL_ERRNOS = frozenset([errno.ENOENT, errno.EACCES, errno.EPERM,
+    errno.EEXIST, errno.EISDIR, errno.ENOTDIR, errno.ENOSPC])
+
+def is_transient(error):
+    """
+    Check whether an exception is a network failure worth retrying: a
+    connection error, a timeout, or an HTTP status of 429 or 5xx. Other
+    HTTP errors, local I/O errors such as a missing file, and non-I/O errors
+    such as a bad site id are permanent.
+    """
+    status = getattr(error, 'code', None) if isinstance(error, HTTPError) \
+        else getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (URLError, socket.timeout)):
+        return True
+    return isinstance(error, socket.error) and \
+        getattr(error, 'errno', None) not in LOCAL_ERRNOS
+
+def call_with_retry(function, args=(), retries=3, backoff=1.0,
+    exceptions=None):
+    """Call a function, retrying with exponential backoff on failure.
+
+    Parameters
+    ----------
+    function : callable
+        The function to call.
+    args : tuple
+        Positional arguments for the function.
+    retries : int
+        Number of retries after the first failed attempt.
+    backoff : float
+        Seconds to wait before the first retry. The wait doubles after each
+        subsequent failure.
+    exceptions : tuple
+        Exception types that trigger a retry. Others are raised immediately.
+        Defaults to the transient errors accepted by is_transient.
+    """
+    attempt = 0
+    while True:
+        try:
+            return function(*args)
+        except Exception as e:
+            retry = isinstance(e, exceptions) if exceptions else \
+                is_transient(e)
+            if not retry or attempt >= retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+            attempt += 1
+
+def map_concurrent(function, items, max_workers=8, retries=0, backoff=1.0):
+    """Map a function over items using a bounded pool of threads.
+
+    Returns a list of results in the same order as items. If any call still
+    fails after its retries, the exception is raised.
+
+    Parameters
+    ----------
+    function : callable
+        Function of a single item.
+    items : list
+        The items to process.
+    max_workers : int
+        Maximum number of threads.
+    retries : int
+        Number of retries for each item.
+    backoff : float
+        Initial retry delay in seconds.
+    """
+    items = list(items)
+    if not items:
+        return []
+    def call(item):
+        return call_with_retry(function, (item,), retries, backoff)
+    pool = ThreadPool(min(max_workers, len(items)))
+    try:
+        return pool.map(call, items)
+    finally:
+        pool.close()
+        pool.join()